@@ -26,11 +26,19 @@ const MOVE_THROTTLE_MS = 50;
 const SNAPSHOT_INTERVAL_MS = 3000;
 const CELL_SIZE = 200; // AOI cell size
 const MAX_SPEED = 20; 
+const PICKUP_RADIUS = 50;
 const WORLD_WIDTH = 5000;
 const WORLD_HEIGHT = 5000;
 
 // Load World Objects with Fallback Strategy
 let worldData = { portals: [], npcs: [], pickups: [] };
+let worldGrids = null; // roomId or '*' -> precomputed spatial index (tools/scripts/build_spatial_index.py), if present
+// Collision grids (tools/nds/build_collision.py): hand-placed ones first, then the pipeline's collision stage
+const COLLISION_DIRS = [
+    path.join(__dirname, '../../contentpacks/poc/world/collision'),
+    path.join(__dirname, '../../contentpacks/poc/collision'),
+];
+const collisionCache = new Map(); // roomId -> { path, mtime, grid }; a rebuilt file is reloaded on the next join
 
 function loadWorldData() {
     // 1. Try Generated (R1.2A)
@@ -41,6 +49,7 @@ function loadWorldData() {
             if (data.portals && data.portals.length > 0) {
                  worldData = data;
                  console.log('[World] Using GENERATED objects from:', genPath);
+                 loadWorldGrid(genPath);
                  return;
             }
         }
@@ -54,6 +63,7 @@ function loadWorldData() {
         if (fs.existsSync(dataPath)) {
             worldData = JSON.parse(fs.readFileSync(dataPath, 'utf8'));
             console.log('[World] Using HANDCRAFTED objects from:', dataPath);
+            loadWorldGrid(dataPath);
         } else {
             console.warn('[World] No world_objects.json found, using empty defaults.');
         }
@@ -62,6 +72,61 @@ function loadWorldData() {
     }
 }
 
+function loadWorldGrid(worldPath) {
+    // <name>.grid.json next to the world file: one grid per roomId plus '*' for the other rooms.
+    // Each room checks its grid against its own objects when it is created.
+    const gridPath = worldPath.replace(/\.json$/, '.grid.json');
+    try {
+        if (!fs.existsSync(gridPath)) return;
+        const grid = JSON.parse(fs.readFileSync(gridPath, 'utf8'));
+        if (grid.version !== 2 || !grid.rooms) {
+            console.warn('[World] Unsupported spatial index version, falling back to linear scans:', gridPath);
+            return;
+        }
+        worldGrids = grid.rooms;
+        console.log(`[World] Spatial index for rooms: ${Object.keys(worldGrids).join(', ')}`);
+    } catch (e) {
+        console.warn('[World] Failed to load spatial index:', e.message);
+    }
+}
+
+function inRoom(obj, roomId) {
+    // Objects with a roomId (their own, else the world file's) only appear in that room
+    const scope = obj.roomId || worldData.roomId;
+    return !scope || scope === roomId;
+}
+
+function loadCollision(roomId) {
+    // <roomId>.collision.json from tools/nds/build_collision.py; rooms without one have no map geometry.
+    // Cached by file and mtime, so a grid rebuilt (or added) while the server runs is picked up.
+    let grid = null;
+    const colPath = (/^[\w-]+$/.test(roomId) &&
+        COLLISION_DIRS.map(dir => path.join(dir, `${roomId}.collision.json`)).find(p => fs.existsSync(p))) || null;
+    let mtime = 0;
+    try {
+        if (colPath) mtime = fs.statSync(colPath).mtimeMs;
+    } catch (e) {
+        // Removed between the existence check and stat: treated as no grid
+    }
+    const hit = collisionCache.get(roomId);
+    if (hit && hit.path === colPath && hit.mtime === mtime) return hit.grid;
+    try {
+        if (colPath) {
+            const data = JSON.parse(fs.readFileSync(colPath, 'utf8'));
+            if (data.version === 1) {
+                grid = { ...data, bits: Buffer.from(data.bits, 'base64') };
+                console.log(`[World] Collision for ${roomId}: ${data.width}x${data.height} cells of ${data.tileSize}, ${data.solidCount} solid`);
+            } else {
+                console.warn('[World] Unsupported collision grid version:', colPath);
+            }
+        }
+    } catch (e) {
+        console.warn('[World] Failed to load collision grid:', e.message);
+    }
+    collisionCache.set(roomId, { path: colPath, mtime, grid });
+    return grid;
+}
+
 loadWorldData();
 
 let metrics = {
@@ -124,17 +189,17 @@ wss.on('connection', (ws, req) => {
     
     // Init world objects from loaded JSON
     if (worldData.pickups) {
-        worldData.pickups.forEach(p => rooms[roomId].objects.push({ ...p, active: true }));
+        worldData.pickups.filter(p => inRoom(p, roomId)).forEach(p => rooms[roomId].objects.push({ ...p, active: true }));
     }
     if (worldData.npcs) {
-        worldData.npcs.forEach(n => rooms[roomId].objects.push({ ...n }));
+        worldData.npcs.filter(n => inRoom(n, roomId)).forEach(n => rooms[roomId].objects.push({ ...n }));
     }
     // Portals are static but can be in objects if needed for server logic.
     // Assuming server just passes them or ignores them for now if only client needs to render.
     // BUT for consistency, let's include them so client gets state?
     // Portals usually don't have "state" like pickups, but let's add them.
     if (worldData.portals) {
-         worldData.portals.forEach(p => rooms[roomId].objects.push({ ...p }));
+         worldData.portals.filter(p => inRoom(p, roomId)).forEach(p => rooms[roomId].objects.push({ ...p }));
     }
 
     // If no JSON loaded/empty, fallback to hardcoded for safety
@@ -143,6 +208,17 @@ wss.on('connection', (ws, req) => {
         rooms[roomId].objects.push({ id: 'npc_1', type: 'npc', x: 600, y: 600 });
         console.log("Using fallback objects for room");
     }
+    const worldGrid = worldGrids && (worldGrids[roomId] || worldGrids['*']);
+    if (worldGrid) {
+        // Grid entries are object indexes into grid.ids; resolve them to this room's objects once
+        const byId = new Map(rooms[roomId].objects.map(o => [o.id, o]));
+        const objects = worldGrid.ids.map(id => byId.get(id));
+        if (worldGrid.count === rooms[roomId].objects.length && objects.every(o => o)) {
+            rooms[roomId].grid = { ...worldGrid, objects };
+        } else {
+            console.warn(`[World] Spatial index for ${roomId} is stale, falling back to linear scans`);
+        }
+    }
 
     console.log(`Created room: ${roomId} with ${rooms[roomId].objects.length} objects`);
     rooms[roomId].tickInterval = setInterval(() => {
@@ -151,6 +227,7 @@ wss.on('connection', (ws, req) => {
   }
 
   const room = rooms[roomId];
+  room.collision = loadCollision(roomId);
   
   // 4. Determine Spawn Position
   let startX = Math.random() * 300 + 50;
@@ -160,6 +237,10 @@ wss.on('connection', (ws, req) => {
       startX = persistedState.x;
       startY = persistedState.y;
   }
+  // A spawn (random or persisted) inside a solid cell would reject every move; use the nearest free cell
+  if (room.collision && solidAt(room.collision, startX, startY)) {
+      [startX, startY] = nearestFree(room.collision, startX, startY);
+  }
   
   const lastMove = { time: 0, x: startX, y: startY };
   
@@ -225,6 +306,10 @@ wss.on('connection', (ws, req) => {
                 metrics.violationCount++;
                 return; 
             }
+            if (room.collision && pathBlocked(room.collision, player.x, player.y, newX, newY)) {
+                metrics.violationCount++;
+                return;
+            }
 
             const newCell = getCellKey(newX, newY);
             if (newCell !== player.cell) {
@@ -239,13 +324,14 @@ wss.on('connection', (ws, req) => {
             player.dirty = true;
             
             // Interaction Check (Server-side authoritative collision)
-            // Check collision with ACTIVE pickups
-            room.objects.forEach(obj => {
-                if (obj.type === 'pickup' && obj.active) {
+            // Check collision with ACTIVE pickups (only the nearby grid cells when indexed)
+            const candidates = room.grid ? queryGrid(room.grid, player.x, player.y, PICKUP_RADIUS) : room.objects;
+            candidates.forEach(obj => {
+                if (obj && obj.type === 'pickup' && obj.active) {
                     const dx = player.x - obj.x;
                     const dy = player.y - obj.y;
                     // Simple distance check (e.g., < 50 units)
-                    if (Math.sqrt(dx*dx + dy*dy) < 50) {
+                    if (Math.sqrt(dx*dx + dy*dy) < PICKUP_RADIUS) {
                         console.log(`Player ${player.id} picked up ${obj.id}`);
                         obj.active = false;
                         if (!room.objectRemoves) room.objectRemoves = [];
@@ -290,6 +376,65 @@ wss.on('connection', (ws, req) => {
   });
 });
 
+function queryGrid(grid, x, y, r) {
+    // Objects in the grid cells overlapping the query square widened by the largest object extent
+    // (at most 2x2 cells while r <= grid.queryRadius: the cell size is at least 2 * (queryRadius + maxExtent))
+    const reach = r + grid.maxExtent;
+    const x0 = Math.max(Math.floor((x - reach) / grid.cellSize), 0);
+    const x1 = Math.min(Math.floor((x + reach) / grid.cellSize), grid.cols - 1);
+    const y0 = Math.max(Math.floor((y - reach) / grid.cellSize), 0);
+    const y1 = Math.min(Math.floor((y + reach) / grid.cellSize), grid.rows - 1);
+    const out = [];
+    for (let cy = y0; cy <= y1; cy++) {
+        for (let c = cy * grid.cols + x0; c <= cy * grid.cols + x1; c++) {
+            for (let i = grid.cellStart[c]; i < grid.cellStart[c + 1]; i++) {
+                out.push(grid.objects[grid.items[i]]);
+            }
+        }
+    }
+    return out;
+}
+
+function solidAt(col, x, y) {
+    // Positions outside the map are not blocked (the world can be larger than the map)
+    const tx = Math.floor(x / col.tileSize);
+    const ty = Math.floor(y / col.tileSize);
+    if (tx < 0 || ty < 0 || tx >= col.width || ty >= col.height) return false;
+    const i = ty * col.width + tx;
+    return (col.bits[i >> 3] >> (i & 7)) & 1;
+}
+
+function nearestFree(col, x, y) {
+    // Centre of the nearest non-solid cell in the first square ring around (x, y) that has one. Cells
+    // past the right / bottom edge of the map count as free, so the search always ends.
+    const tx = Math.floor(x / col.tileSize);
+    const ty = Math.floor(y / col.tileSize);
+    for (let r = 1; r <= Math.max(col.width, col.height) + 1; r++) {
+        let best = null;
+        for (let cy = ty - r; cy <= ty + r; cy++) {
+            for (let cx = tx - r; cx <= tx + r; cx++) {
+                if (Math.max(Math.abs(cx - tx), Math.abs(cy - ty)) !== r) continue;
+                const px = (cx + 0.5) * col.tileSize;
+                const py = (cy + 0.5) * col.tileSize;
+                if (px < 0 || py < 0 || solidAt(col, px, py)) continue;
+                const d = (px - x) ** 2 + (py - y) ** 2;
+                if (!best || d < best[2]) best = [px, py, d];
+            }
+        }
+        if (best) return [best[0], best[1]];
+    }
+    return [x, y];
+}
+
+function pathBlocked(col, x0, y0, x1, y1) {
+    // Sample the segment every half cell so a move cannot step over a one-cell wall
+    const steps = Math.max(1, Math.ceil(Math.hypot(x1 - x0, y1 - y0) / (col.tileSize / 2)));
+    for (let i = 1; i <= steps; i++) {
+        if (solidAt(col, x0 + (x1 - x0) * i / steps, y0 + (y1 - y0) * i / steps)) return true;
+    }
+    return false;
+}
+
 function getCellKey(x, y) {
     const cx = Math.floor(x / CELL_SIZE);
     const cy = Math.floor(y / CELL_SIZE);
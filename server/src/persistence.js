@@ -2,7 +2,18 @@ const fs = require('fs');
 const path = require('path');
 
 const DATA_DIR = path.join(__dirname, '../data');
-const STATE_FILE = path.join(DATA_DIR, 'world_state.json');
+// Player state is a compact snapshot plus an append-only log of changes:
+//   world_state.snapshot.json  {"version": 1, "compactedAt", "players": {playerKey: state}}
+//   world_state.log            one JSON line {"k": playerKey, ...fields changed} per player per save
+// A save appends only the players that changed since the last one; loading replays the log over
+// the snapshot. tools/scripts/compact_world_state.py folds the log into a new snapshot offline
+// (and prunes stale entries); the server does the same, without pruning, once the log passes
+// LOG_COMPACT_BYTES. world_state.json (the old whole-map format) is the base when there is no
+// snapshot yet.
+const SNAPSHOT_FILE = path.join(DATA_DIR, 'world_state.snapshot.json');
+const LOG_FILE = path.join(DATA_DIR, 'world_state.log');
+const LEGACY_FILE = path.join(DATA_DIR, 'world_state.json');
+const LOG_COMPACT_BYTES = 16 * 1024 * 1024;
 
 // Ensure data dir exists
 if (!fs.existsSync(DATA_DIR)) {
@@ -10,20 +21,45 @@ if (!fs.existsSync(DATA_DIR)) {
 }
 
 let persistenceMap = {}; // playerKey -> { roomId, name, color, x, y, ts }
+let pendingMap = {}; // playerKey -> fields changed since the last save
 let saveTimeout = null;
 
+function readState(dir = DATA_DIR) {
+    const snapshotFile = path.join(dir, path.basename(SNAPSHOT_FILE));
+    const legacyFile = path.join(dir, path.basename(LEGACY_FILE));
+    const logFile = path.join(dir, path.basename(LOG_FILE));
+    let state = {};
+    if (fs.existsSync(snapshotFile)) {
+        state = JSON.parse(fs.readFileSync(snapshotFile, 'utf8')).players || {};
+    } else if (fs.existsSync(legacyFile)) {
+        state = JSON.parse(fs.readFileSync(legacyFile, 'utf8'));
+    }
+    if (fs.existsSync(logFile)) {
+        for (const line of fs.readFileSync(logFile, 'utf8').split('\n')) {
+            if (!line) continue;
+            let entry;
+            try {
+                entry = JSON.parse(line);
+            } catch (e) {
+                continue; // torn write at the end of the log
+            }
+            const { k, ...fields } = entry;
+            state[k] = Object.assign(state[k] || {}, fields);
+        }
+    }
+    return state;
+}
+
 function loadState() {
     try {
-        if (fs.existsSync(STATE_FILE)) {
-            const raw = fs.readFileSync(STATE_FILE, 'utf8');
-            persistenceMap = JSON.parse(raw);
-            console.log(`[Persistence] Loaded ${Object.keys(persistenceMap).length} players.`);
-        }
+        persistenceMap = readState();
+        console.log(`[Persistence] Loaded ${Object.keys(persistenceMap).length} players.`);
     } catch (e) {
         console.error('[Persistence] Failed to load state:', e);
         // Rename bad file
-        if (fs.existsSync(STATE_FILE)) {
-            fs.renameSync(STATE_FILE, STATE_FILE + '.bad.' + Date.now());
+        const bad = fs.existsSync(SNAPSHOT_FILE) ? SNAPSHOT_FILE : LEGACY_FILE;
+        if (fs.existsSync(bad)) {
+            fs.renameSync(bad, bad + '.bad.' + Date.now());
         }
         persistenceMap = {};
     }
@@ -39,6 +75,7 @@ function updatePlayerState(playerKey, data) {
         persistenceMap[playerKey] = {};
     }
     Object.assign(persistenceMap[playerKey], data);
+    pendingMap[playerKey] = Object.assign(pendingMap[playerKey] || {}, data);
     scheduleSave();
 }
 
@@ -51,18 +88,31 @@ function scheduleSave() {
 }
 
 function saveState() {
+    const keys = Object.keys(pendingMap);
+    if (keys.length === 0) return;
     try {
-        const tempFile = STATE_FILE + '.tmp';
-        fs.writeFileSync(tempFile, JSON.stringify(persistenceMap, null, 2));
-        fs.renameSync(tempFile, STATE_FILE);
-        // console.log('[Persistence] Saved world state.');
+        const lines = keys.map(k => JSON.stringify({ k, ...pendingMap[k] })).join('\n') + '\n';
+        pendingMap = {};
+        fs.appendFileSync(LOG_FILE, lines);
+        if (fs.statSync(LOG_FILE).size > LOG_COMPACT_BYTES) compactState();
     } catch (e) {
         console.error('[Persistence] Save failed:', e);
     }
 }
 
+function compactState() {
+    // Everything in memory becomes the snapshot; the log restarts empty. A crash in between only
+    // leaves log lines that replay to the values the snapshot already has.
+    const tempFile = SNAPSHOT_FILE + '.tmp';
+    fs.writeFileSync(tempFile, JSON.stringify({ version: 1, compactedAt: Date.now(), players: persistenceMap }));
+    fs.renameSync(tempFile, SNAPSHOT_FILE);
+    fs.writeFileSync(LOG_FILE, '');
+    console.log(`[Persistence] Compacted ${Object.keys(persistenceMap).length} players into the snapshot.`);
+}
+
 module.exports = {
     loadState,
+    readState,
     getPlayerState,
     updatePlayerState
 };
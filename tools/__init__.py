@@ -0,0 +1,2 @@
+# Asset tooling. The Python tools are importable as a package (tools.nds, tools.pack) as
+# well as runnable as scripts; see tools/nds/README.md.
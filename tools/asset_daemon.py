@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import mmap
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from . import instrument
+    from .nds.extract_nds import read_rom_tables
+    from .nds.render_rgcn_rlcn_rcsn import (parse_rgcn, parse_rlcn, parse_rcsn, linear_map,
+                                           compose_tilemap, encode_rgb_png)
+    from .nds.parse_btx0 import decode_btx0
+    from .nds.parse_bmg import BMGFile
+    from .nds.parse_nftr_summary import decode_nftr, bake_font
+    from .nds.pngio import encode_png
+    from .pack.mm2r_pak_probe import probe_pak
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from tools import instrument
+    from tools.nds.extract_nds import read_rom_tables
+    from tools.nds.render_rgcn_rlcn_rcsn import (parse_rgcn, parse_rlcn, parse_rcsn, linear_map,
+                                                 compose_tilemap, encode_rgb_png)
+    from tools.nds.parse_btx0 import decode_btx0
+    from tools.nds.parse_bmg import BMGFile
+    from tools.nds.parse_nftr_summary import decode_nftr, bake_font
+    from tools.nds.pngio import encode_png
+    from tools.pack.mm2r_pak_probe import probe_pak
+
+# Long-running asset daemon: extract / render / decode over HTTP on TCP or a Unix socket.
+#
+# ROMs, paks and loose files are memory-mapped once; parsed FAT/FNT and pak tables,
+# palettes, tile banks, screen maps, decoded textures and finished renders sit in LRU
+# caches. Every cache key carries the source's (path, mtime, size), so an edited file is
+# picked up on the next request and only the parts derived from it are rebuilt (a palette
+# edit re-composites the map but reuses the decoded tile bank).
+#
+# Members are addressed by a query parameter holding a path relative to --root; with
+# rom=<rom> it is a NitroFS path or file id inside that ROM, with pak=<pak> an entry index
+# (pak tables come from probe=<probe.json> when given, else from probe_pak()).
+#
+#   GET  /status                                    cache sizes, hit rates, request count
+#   GET  /rom/files?rom=R                           file table (JSON)
+#   GET  /rom/file?rom=R&file=ID|PATH               raw file bytes
+#   GET  /pak/entries?pak=P[&probe=J]               entry table (JSON)
+#   GET  /pak/entry?pak=P&index=N[&probe=J]         raw entry bytes
+#   GET  /render/tilemap?rgcn=&rlcn=[&rcsn=]        PNG
+#   GET  /decode/btx0?src=[&tex=NAME]               texture list (JSON), or one texture as PNG
+#   GET  /decode/nftr?src=                          glyph atlas PNG
+#   GET  /decode/bmg?src=                           messages (JSON)
+#   POST /cache/clear
+
+DEFAULT_SIZES = {
+    'maps': 16,
+    'tables': 32,
+    'palettes': 256,
+    'tiles': 128,
+    'screens': 128,
+    'textures': 32,
+    'fonts': 8,
+    'messages': 16,
+    'renders': 64,
+}
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, load):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+        # Loaded outside the lock; two threads missing on the same key both load, last one wins
+        value = load()
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 3) if total else None,
+        }
+
+class AssetStore:
+    def __init__(self, root, sizes=None, m=None):
+        self.root = os.path.realpath(root)
+        self.m = m or instrument.Metrics('asset_daemon')
+        self.caches = {name: LRUCache(size) for name, size in dict(DEFAULT_SIZES, **(sizes or {})).items()}
+        self.started = time.perf_counter()
+
+    def resolve(self, path):
+        # -> (real path, stamp); paths may not leave --root
+        if not path:
+            raise ValueError("missing path")
+        full = os.path.realpath(os.path.join(self.root, path))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise PermissionError(f"{path} is outside the asset root")
+        st = os.stat(full)
+        return full, (full, st.st_mtime_ns, st.st_size)
+
+    def mapped(self, path):
+        # -> (read-only mmap of the whole file, stamp)
+        full, stamp = self.resolve(path)
+        def load():
+            with open(full, 'rb') as f:
+                if stamp[2] == 0:
+                    return b''
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.caches['maps'].get(stamp, load), stamp
+
+    def rom_tables(self, rom):
+        full, stamp = self.resolve(rom)
+        def load():
+            with self.m.stage('rom_tables'):
+                with open(full, 'rb') as f:
+                    tables = read_rom_tables(f, self.m)
+            tables['by_path'] = {e['path'].replace(os.sep, '/'): e for e in tables['files']}
+            tables['by_id'] = {e['file_id']: e for e in tables['files']}
+            return tables
+        return self.caches['tables'].get(('rom',) + stamp, load), stamp
+
+    def pak_table(self, pak, probe=None):
+        data, stamp = self.mapped(pak)
+        probe_stamp = self.resolve(probe)[1] if probe else None
+        def load():
+            with self.m.stage('pak_table'):
+                if probe:
+                    with open(probe_stamp[0], 'r') as f:
+                        return json.load(f)
+                return probe_pak(data, self.m)
+        return self.caches['tables'].get(('pak',) + stamp + (probe_stamp,), load), stamp
+
+    def member(self, ref, rom=None, pak=None, probe=None):
+        # -> (memoryview of the member's bytes, cache key identifying this exact content)
+        if (rom or pak) and not ref:
+            raise ValueError("missing member")
+        if rom:
+            tables, stamp = self.rom_tables(rom)
+            entry = tables['by_id'].get(int(ref)) if ref.isdigit() else tables['by_path'].get(ref.lstrip('/'))
+            if entry is None:
+                raise KeyError(f"{ref} not in {rom}")
+            data, _ = self.mapped(rom)
+            return memoryview(data)[entry['start']:entry['end']], stamp + (entry['file_id'],)
+        if pak:
+            table, stamp = self.pak_table(pak, probe)
+            if not ref.isdigit():
+                raise ValueError(f"bad entry index {ref}")
+            index = int(ref)
+            entries = [e for e in table.get('entries', []) if e['index'] == index]
+            if not entries or entries[0]['size'] <= 0:
+                raise KeyError(f"entry {ref} not in {pak}")
+            data, _ = self.mapped(pak)
+            e = entries[0]
+            if e['offset'] + e['size'] > len(data):
+                raise ValueError(f"entry {ref} runs past the end of {pak}")
+            return memoryview(data)[e['offset']:e['offset'] + e['size']], stamp + (index,)
+        data, stamp = self.mapped(ref)
+        return memoryview(data), stamp
+
+    def _decoded(self, cache, stage, parse, ref, where):
+        view, key = self.member(ref, **where)
+        def load():
+            with self.m.stage(stage):
+                # The parsers slice and compare with bytes literals, which memoryviews don't do
+                return parse(bytes(view))
+        return self.caches[cache].get(key, load), key
+
+    def render_tilemap(self, rgcn, rlcn, rcsn=None, **where):
+        tiles, tiles_key = self._decoded('tiles', 'rgcn', parse_rgcn, rgcn, where)
+        palette, palette_key = self._decoded('palettes', 'rlcn', parse_rlcn, rlcn, where)
+        screen, screen_key = (self._decoded('screens', 'rcsn', parse_rcsn, rcsn, where) if rcsn
+                              else (linear_map(len(tiles)), None))
+        def load():
+            w, h, pixels = compose_tilemap(tiles, palette, *screen, m=self.m)
+            with self.m.stage('encode'):
+                return encode_rgb_png(w, h, pixels)
+        return self.caches['renders'].get(('tilemap', tiles_key, palette_key, screen_key), load)
+
+    def textures(self, src, **where):
+        return self._decoded('textures', 'btx0', lambda d: decode_btx0(d, self.m)[0], src, where)[0]
+
+    def texture_png(self, src, name, **where):
+        textures = self.textures(src, **where)
+        for tex in textures:
+            if tex['name'] == name:
+                key = ('texture', self.member(src, **where)[1], name)
+                return self.caches['renders'].get(key, lambda: encode_png(tex['width'], tex['height'], tex['rgba']))
+        raise KeyError(f"texture {name} not in {src}")
+
+    def font_atlas(self, src, **where):
+        font, key = self._decoded('fonts', 'nftr', decode_nftr, src, where)
+        def load():
+            with self.m.stage('bake'):
+                w, h, rgba, _ = bake_font(font)
+            return encode_png(w, h, rgba)
+        return self.caches['renders'].get(('font', key), load)
+
+    def messages(self, src, **where):
+        def parse(data):
+            bmg = BMGFile(data)
+            return [bmg.text(i) for i in range(len(bmg))]
+        return self._decoded('messages', 'bmg', parse, src, where)[0]
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+class AssetHandler(BaseHTTPRequestHandler):
+    server_version = 'AssetDaemon/1'
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, obj, status=200):
+        self.send_body(status, json.dumps(obj).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        self.dispatch(GET_ROUTES)
+
+    def do_HEAD(self):
+        self.dispatch(GET_ROUTES)
+
+    def do_POST(self):
+        self.dispatch(POST_ROUTES)
+
+    def dispatch(self, routes):
+        url = urlsplit(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        route = routes.get(url.path)
+        if route is None:
+            self.send_json({'error': f"no route {url.path}"}, 404)
+            return
+        store = self.server.store
+        start = time.perf_counter()
+        try:
+            with store.m.stage('request'):
+                status, body, content_type = route(store, q)
+        except (FileNotFoundError, KeyError) as e:
+            self.send_json({'error': str(e).strip("'")}, 404)
+        except PermissionError as e:
+            self.send_json({'error': str(e)}, 403)
+        except (ValueError, IndexError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self.log_error("%s failed: %r", self.path, e)
+            self.send_json({'error': repr(e)}, 500)
+        else:
+            if content_type == 'application/json':
+                body = json.dumps(body).encode('utf-8')
+            self.send_body(status, body, content_type)
+        store.m.count('requests')
+        if self.server.verbose:
+            self.log_message("%s %.1f ms", url.path, (time.perf_counter() - start) * 1000)
+
+def where(q):
+    return {'rom': q.get('rom'), 'pak': q.get('pak'), 'probe': q.get('probe')}
+
+def route_status(store, q):
+    return 200, {
+        'root': store.root,
+        'uptime_s': round(time.perf_counter() - store.started, 1),
+        'requests': store.m.counts.get('requests', 0),
+        'caches': store.stats(),
+    }, 'application/json'
+
+def route_rom_files(store, q):
+    tables, _ = store.rom_tables(q.get('rom'))
+    return 200, tables['files'], 'application/json'
+
+def route_pak_entries(store, q):
+    table, _ = store.pak_table(q.get('pak'), q.get('probe'))
+    return 200, table.get('entries', []), 'application/json'
+
+def route_rom_file(store, q):
+    if not q.get('rom'):
+        raise ValueError("missing rom")
+    view, _ = store.member(q.get('file'), **where(q))
+    return 200, view, 'application/octet-stream'
+
+def route_pak_entry(store, q):
+    if not q.get('pak'):
+        raise ValueError("missing pak")
+    view, _ = store.member(q.get('index'), **where(q))
+    return 200, view, 'application/octet-stream'
+
+def route_tilemap(store, q):
+    return 200, store.render_tilemap(q.get('rgcn'), q.get('rlcn'), q.get('rcsn'), **where(q)), 'image/png'
+
+def route_btx0(store, q):
+    if q.get('tex'):
+        return 200, store.texture_png(q['src'], q['tex'], **where(q)), 'image/png'
+    textures = store.textures(q.get('src'), **where(q))
+    return 200, [{k: v for k, v in t.items() if k != 'rgba'} for t in textures], 'application/json'
+
+def route_nftr(store, q):
+    return 200, store.font_atlas(q.get('src'), **where(q)), 'image/png'
+
+def route_bmg(store, q):
+    return 200, store.messages(q.get('src'), **where(q)), 'application/json'
+
+def route_clear(store, q):
+    store.clear()
+    return 200, {'cleared': True}, 'application/json'
+
+GET_ROUTES = {
+    '/status': route_status,
+    '/rom/files': route_rom_files,
+    '/rom/file': route_rom_file,
+    '/pak/entries': route_pak_entries,
+    '/pak/entry': route_pak_entry,
+    '/render/tilemap': route_tilemap,
+    '/decode/btx0': route_btx0,
+    '/decode/nftr': route_nftr,
+    '/decode/bmg': route_bmg,
+}
+POST_ROUTES = {
+    '/cache/clear': route_clear,
+}
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)  # stale socket from a previous run
+        super().server_bind()
+
+def make_server(store, port=None, host='127.0.0.1', unix_socket=None, verbose=False):
+    if unix_socket:
+        server = ThreadingUnixHTTPServer(unix_socket, AssetHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), AssetHandler)
+    server.store = store
+    server.verbose = verbose
+    return server
+
+def preload(store, paths, probe=None):
+    for path in paths:
+        if path.lower().endswith('.nds'):
+            tables, _ = store.rom_tables(path)
+            print(f"Preloaded {path}: {len(tables['files'])} files")
+        else:
+            table, _ = store.pak_table(path, probe)
+            print(f"Preloaded {path}: {len(table.get('entries', []))} entries")
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve extract / render / decode requests from memory-mapped ROMs and paks.')
+    parser.add_argument('--root', default='.', help='Directory that request paths are resolved against')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--socket', dest='unix_socket', help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--preload', nargs='*', default=[], help='ROMs (.nds) / paks to map and index at startup')
+    parser.add_argument('--probe', help='Probe JSON for the preloaded paks')
+    parser.add_argument('--cache', nargs='*', default=[], metavar='NAME=SIZE',
+                        help=f"LRU sizes, e.g. renders=256 ({', '.join(sorted(DEFAULT_SIZES))})")
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'asset_daemon')
+
+    sizes = {}
+    for spec in args.cache:
+        name, _, size = spec.partition('=')
+        if name not in DEFAULT_SIZES or not size.isdigit():
+            parser.error(f"bad --cache {spec}")
+        sizes[name] = int(size)
+
+    store = AssetStore(args.root, sizes, m)
+    try:
+        preload(store, args.preload, args.probe)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    server = make_server(store, args.port, args.host, args.unix_socket, args.verbose)
+    where_to = args.unix_socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving {store.root} on {where_to}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+if __name__ == "__main__":
+    main()
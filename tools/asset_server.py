@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+try:
+    from . import instrument
+    from .asset_daemon import LRUCache
+    from .pack.content_pack import ContentPack
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from tools import instrument
+    from tools.asset_daemon import LRUCache
+    from tools.pack.content_pack import ContentPack
+
+# Static asset server for content packs and the files next to them.
+#
+#   GET|HEAD /<pack>.cpak/<entry>[?v=HASH]   one entry of a content pack under --root
+#   GET      /<pack>.cpak/                   entry list (JSON: name, size, sha256, codec)
+#   GET|HEAD /<path>[?v=HASH]                any other file under --root (a whole bundle, a manifest)
+#   GET      /status                         request / byte / sendfile counts, cache stats
+#
+# Packs are opened once (memory-mapped, see tools/pack/content_pack.py) and kept in an LRU keyed
+# by (path, mtime, size), so a rebuilt pack is picked up on the next request.
+#
+# Validators and caching: the ETag is the entry's sha256 (from the pack index; for plain files
+# hashed once per (path, mtime, size)). Responses are "no-cache" (clients revalidate, and get a
+# 304 on If-None-Match) unless the URL names the content with ?v=<sha256 or a prefix of 8+ hex
+# digits> that matches, in which case they are "immutable" for a year. The sha256 values are in
+# the pack listing and in the room bundle manifests.
+#
+# Bodies: uncompressed entries and plain files go from the page cache to the socket with
+# sendfile(); single-block zlib entries go the same way as Content-Encoding: deflate to clients
+# that accept it (no Range); everything else is decompressed block-wise from the mmap. Single
+# byte ranges (Range: bytes=a-b / a- / -n, with If-Range) get a 206; other forms get the whole
+# body, unsatisfiable ones a 416.
+#
+# Concurrency: a pool of --threads handler threads, each serving one keep-alive connection at a
+# time; further connections wait for a free thread, and a burst of connects waits in the listen
+# backlog (LISTEN_BACKLOG) instead of being refused. The threads spend their time in recv() /
+# sendfile() / zlib, which release the GIL. Idle connections are closed after IDLE_TIMEOUT
+# seconds. tools/bench/asset_load.py is the load test.
+
+LISTEN_BACKLOG = 1024
+IDLE_TIMEOUT = 30
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+SENDFILE = hasattr(os, 'sendfile')
+DEFAULT_SIZES = {'packs': 64, 'hashes': 4096}
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+class Resource:
+    # One representation: `size` bytes with validator `etag`, sent either from `file` (anything
+    # with fileno(); the bytes start at `offset`) with sendfile(), or through read(offset, length)
+    def __init__(self, size, sha256, content_type, file=None, offset=0, read=None, encoding=None, close=None):
+        self.size = size
+        self.sha256 = sha256
+        self.etag = f'"{sha256}-{encoding}"' if encoding else f'"{sha256}"'
+        self.content_type = content_type
+        self.file = file
+        self.offset = offset
+        self.read = read
+        self.encoding = encoding
+        self.close = close
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+def accepts(header, coding):
+    # Accept-Encoding lists coding (or *) without q=0
+    for item in (header or '').split(','):
+        token, _, params = item.strip().partition(';')
+        if token.strip().lower() in (coding, '*'):
+            q = params.strip()
+            return not (q.startswith('q=') and float(q[2:] or 0) == 0)
+    return False
+
+def etag_matches(header, etag):
+    # If-None-Match: weak comparison, '*' matches anything
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+def byte_range(header, size):
+    # -> (start, end) exclusive for a single satisfiable range, None to send the whole body
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[6:].strip()
+    if ',' in spec:
+        return None
+    first, dash, last = spec.partition('-')
+    if not dash or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        n = int(last)
+        if n == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - n, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+class AssetServerStore:
+    def __init__(self, root, sizes=None, m=None):
+        self.root = os.path.realpath(root)
+        self.m = m or instrument.Metrics('asset_server')
+        self.caches = {name: LRUCache(size) for name, size in dict(DEFAULT_SIZES, **(sizes or {})).items()}
+        self.started = time.perf_counter()
+
+    def resolve(self, path):
+        # -> real path; paths may not leave --root or name hidden files (.pipeline, .stage.json)
+        if any(part.startswith('.') for part in path.split('/') if part):
+            raise FileNotFoundError(f"{path} not found")
+        full = os.path.realpath(os.path.join(self.root, path))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise PermissionError(f"{path} is outside the asset root")
+        return full
+
+    def pack(self, path):
+        full = self.resolve(path)
+        st = os.stat(full)
+        return self.caches['packs'].get((full, st.st_mtime_ns, st.st_size), lambda: ContentPack(full))
+
+    def entry(self, pack, name, accept_encoding=None, ranged=False):
+        entry = pack.entries.get(name)
+        if entry is None:
+            raise KeyError(f"{name} not in pack")
+        sha256 = pack.sha256(name)
+        ctype = content_type(name)
+        blocks = entry['blocks']
+        if SENDFILE and entry['codec'] == 'none':
+            return Resource(entry['size'], sha256, ctype, file=pack, offset=blocks[0][0] if blocks else 0)
+        if (SENDFILE and entry['codec'] == 'zlib' and len(blocks) == 1 and not ranged
+                and accepts(accept_encoding, 'deflate')):
+            # A zlib stream is what HTTP calls "deflate"
+            return Resource(blocks[0][1], sha256, ctype, file=pack, offset=blocks[0][0], encoding='deflate')
+        return Resource(entry['size'], sha256, ctype, read=lambda offset, length: pack.read(name, offset, length))
+
+    def file(self, path):
+        full = self.resolve(path)
+        f = open(full, 'rb')  # IsADirectoryError for directories
+        try:
+            st = os.fstat(f.fileno())
+            sha256 = self.caches['hashes'].get((full, st.st_mtime_ns, st.st_size), lambda: self._hash(full))
+        except BaseException:
+            f.close()
+            raise
+        if SENDFILE:
+            return Resource(st.st_size, sha256, content_type(full), file=f, close=f.close)
+        def read(offset, length):
+            f.seek(offset)
+            return f.read(length)
+        return Resource(st.st_size, sha256, content_type(full), read=read, close=f.close)
+
+    def _hash(self, full):
+        h = hashlib.sha256()
+        with self.m.stage('hash'), open(full, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def status(self):
+        # The handler threads share self.m; read it under its lock for a consistent view
+        with self.m.lock:
+            bytes_sent, counts = self.m.bytes_written, dict(self.m.counts)
+        return {
+            'root': self.root,
+            'uptime_s': round(time.perf_counter() - self.started, 1),
+            'bytes_sent': bytes_sent,
+            'counts': counts,
+            'caches': {name: cache.stats() for name, cache in self.caches.items()},
+        }
+
+class AssetServerHandler(BaseHTTPRequestHandler):
+    server_version = 'AssetServer/1'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and a sendfile() body are separate writes
+    timeout = IDLE_TIMEOUT
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.serve()
+
+    def do_HEAD(self):
+        self.serve()
+
+    def serve(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        store = self.server.store
+        store.m.count('requests')
+        res = None
+        try:
+            if path == '/status':
+                self.send_json(store.status())
+                return
+            pack_path, sep, name = path.partition('.cpak/')
+            if sep:
+                pack = store.pack(pack_path.lstrip('/') + '.cpak')
+                if not name:
+                    self.send_json([{'name': e['name'], 'size': e['size'], 'sha256': pack.sha256(e['name']),
+                                     'codec': e['codec']} for e in pack.entries.values()])
+                    return
+                res = store.entry(pack, name, self.headers.get('Accept-Encoding'), 'Range' in self.headers)
+                vary = True
+            else:
+                res = store.file(path.lstrip('/'))
+                vary = False
+            self.send_resource(res, q, vary)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError, KeyError) as e:
+            self.send_json({'error': str(e).strip("'")}, 404)
+        except PermissionError as e:
+            self.send_json({'error': str(e)}, 403)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            # The client went away mid-body; the connection is unusable
+            self.close_connection = True
+        except Exception as e:
+            self.log_error("%s failed: %r", self.path, e)
+            self.send_json({'error': repr(e)}, 500)
+        finally:
+            if res is not None and res.close:
+                res.close()
+
+    def send_resource(self, res, q, vary):
+        m = self.server.store.m
+        v = q.get('v', '')
+        cache = IMMUTABLE if len(v) >= 8 and res.sha256.startswith(v.lower()) else REVALIDATE
+        if etag_matches(self.headers.get('If-None-Match'), res.etag):
+            self.send_response(304)
+            self.send_validators(res, cache, vary)
+            self.end_headers()
+            m.count('not_modified')
+            return
+        rng = None
+        if res.encoding is None:
+            if_range = self.headers.get('If-Range')
+            try:
+                if not if_range or if_range.strip() == res.etag:
+                    rng = byte_range(self.headers.get('Range'), res.size)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{res.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        start, end = rng or (0, res.size)
+        self.send_response(206 if rng else 200)
+        self.send_header('Content-Type', res.content_type)
+        self.send_header('Content-Length', str(end - start))
+        if rng:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{res.size}')
+            m.count('partial')
+        if res.encoding:
+            self.send_header('Content-Encoding', res.encoding)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_validators(res, cache, vary)
+        self.end_headers()
+        if self.command == 'HEAD' or end == start:
+            return
+        if res.file is not None:
+            m.wrote(self.connection.sendfile(res.file, res.offset + start, end - start))
+            m.count('sendfile')
+        else:
+            with m.stage('decode'):
+                body = res.read(start, end - start)
+            self.wfile.write(body)
+            m.wrote(len(body))
+
+    def send_validators(self, res, cache, vary):
+        self.send_header('ETag', res.etag)
+        self.send_header('Cache-Control', cache)
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+
+class AssetHTTPServer(HTTPServer):
+    # Connections are queued to a fixed pool of handler threads started up front. Spawning a
+    # thread per connection makes the accept loop wait for each new thread to get the GIL, which
+    # under load (hundreds of busy handlers) takes seconds.
+    request_queue_size = LISTEN_BACKLOG
+
+    def start_workers(self, threads):
+        self.pending = queue.SimpleQueue()
+        for _ in range(threads):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def process_request(self, request, client_address):
+        self.pending.put((request, client_address))
+
+    def worker(self):
+        while True:
+            request, client_address = self.pending.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+def make_server(store, port=8766, host='127.0.0.1', threads=512, verbose=False):
+    server = AssetHTTPServer((host, port), AssetServerHandler)
+    server.store = store
+    server.verbose = verbose
+    server.start_workers(threads)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve content pack entries and files with ranges, sendfile and ETags.')
+    parser.add_argument('--root', default='.', help='Directory that request paths are resolved against')
+    parser.add_argument('--port', type=int, default=8766, help='TCP port (0: pick a free one)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--threads', type=int, default=512,
+                        help='Handler threads = connections served at once; more wait for a free thread')
+    parser.add_argument('--cache', nargs='*', default=[], metavar='NAME=SIZE',
+                        help=f"LRU sizes, e.g. packs=128 ({', '.join(sorted(DEFAULT_SIZES))})")
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'asset_server')
+
+    sizes = {}
+    for spec in args.cache:
+        name, _, size = spec.partition('=')
+        if name not in DEFAULT_SIZES or not size.isdigit():
+            parser.error(f"bad --cache {spec}")
+        sizes[name] = int(size)
+    if not os.path.isdir(args.root):
+        print(f"Error: {args.root} is not a directory.")
+        sys.exit(1)
+
+    store = AssetServerStore(args.root, sizes, m)
+    server = make_server(store, args.port, args.host, args.threads, args.verbose)
+    print(f"Serving {store.root} on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
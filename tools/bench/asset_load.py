@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from tools.pack.content_pack import write_content_pack
+
+# Load test for tools/asset_server.py.
+#
+# Starts the server on a free port (or targets --url), lists the entries of one pack and has
+# --clients keep-alive connections fetch random entries for --duration seconds, timed from when
+# all of them are connected (connect times are reported separately). Each request is a full GET,
+# a random single Range (--ranges), or a revalidation with If-None-Match that should be a 304
+# (--revalidate). The clients are threads spread over --procs processes, so the client side
+# is not one GIL. Reported: requests/s, MB/s, status counts, errors and latency percentiles
+# (p50 / p90 / p99 / p99.9 / max), plus the server's own counters from /status.
+#
+# Without --pack a synthetic one is built: --entries files of 1 KiB - 256 KiB (log-uniform), half
+# random bytes (stored uncompressed, sent with sendfile) and half compressible (zlib).
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+def synthetic_pack(work, entries, seed=0):
+    rng = random.Random(seed)
+    src = os.path.join(work, 'src')
+    os.makedirs(src)
+    files = []
+    for i in range(entries):
+        size = int(2 ** rng.uniform(10, 18))
+        if i % 2:
+            data = rng.randbytes(size)
+        else:
+            words = [b'tile', b'sprite', b'palette', b'room', b'npc', b'0000', b'\x00' * 8]
+            data = b' '.join(rng.choice(words) for _ in range(size // 5))[:size]
+        name = f"assets/{i:04d}.{'bin' if i % 2 else 'dat'}"
+        path = os.path.join(src, f'{i:04d}')
+        with open(path, 'wb') as f:
+            f.write(data)
+        files.append((name, path))
+    os.makedirs(os.path.join(work, 'root'))
+    write_content_pack(files, os.path.join(work, 'root', 'bench.cpak'))
+    return os.path.join(work, 'root'), 'bench.cpak'
+
+def start_server(root, host):
+    server = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'asset_server.py')
+    proc = subprocess.Popen([sys.executable, server, '--root', root, '--host', host, '--port', '0'],
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if 'http://' not in line:
+        proc.kill()
+        raise RuntimeError(f"server did not start: {line.strip() or proc.wait()}")
+    return proc, line.split()[-1]
+
+def get_json(url, path):
+    u = urlsplit(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"GET {path}: {resp.status} {body[:200]!r}")
+        return json.loads(body)
+    finally:
+        conn.close()
+
+def run_client(url, entries, duration, mix, verify, seed, start, out):
+    # Connects, waits for the other clients of this process (start barrier), then runs for duration
+    u = urlsplit(url)
+    rng = random.Random(seed)
+    latencies, statuses, errors, received = [], {}, 0, 0
+    t0 = time.perf_counter()
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+    try:
+        conn.connect()
+    except OSError:
+        conn = None
+        errors += 1
+    connect = time.perf_counter() - t0
+    start.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        e = rng.choice(entries)
+        headers = {}
+        r = rng.random()
+        expect = e['size']
+        if r < mix['ranges'] and e['size'] > 1:
+            lo = rng.randrange(e['size'])
+            hi = min(e['size'], lo + rng.randint(1, 64 * 1024))
+            headers['Range'] = f'bytes={lo}-{hi - 1}'
+            expect = hi - lo
+        elif r < mix['ranges'] + mix['revalidate']:
+            headers['If-None-Match'] = f'"{e["sha256"]}"'
+            expect = 0
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+            t0 = time.perf_counter()
+            conn.request('GET', e['path'], headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+            latencies.append(time.perf_counter() - t0)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+        received += len(body)
+        if resp.status not in (200, 206, 304) or len(body) != expect:
+            errors += 1
+        elif verify and resp.status == 200 and hashlib.sha256(body).hexdigest() != e['sha256']:
+            errors += 1
+    if conn is not None:
+        conn.close()
+    out.append((latencies, statuses, errors, received, connect))
+
+def run_process(url, entries, clients, duration, mix, verify, seed):
+    # One process: `clients` threads -> (latencies, statuses, errors, bytes received, connect times)
+    results = []
+    start = threading.Barrier(clients)
+    threads = [threading.Thread(target=run_client, args=(url, entries, duration, mix, verify, seed * 100003 + i,
+                                                         start, results))
+               for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies, statuses, errors, received, connects = [], {}, 0, 0, []
+    for lat, st, err, rec, connect in results:
+        latencies += lat
+        for k, v in st.items():
+            statuses[k] = statuses.get(k, 0) + v
+        errors += err
+        received += rec
+        connects.append(connect)
+    return latencies, statuses, errors, received, connects
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the asset server with parallel keep-alive clients.')
+    parser.add_argument('--url', help='Running server (default: start tools/asset_server.py on a free port)')
+    parser.add_argument('--root', help='--root for the started server (default: a synthetic pack)')
+    parser.add_argument('--pack', help='Pack path under the root to fetch from')
+    parser.add_argument('--entries', type=int, default=200, help='Entries in the synthetic pack')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--clients', type=int, default=256, help='Parallel connections')
+    parser.add_argument('--procs', type=int, default=min(4, os.cpu_count() or 1), help='Client processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds')
+    parser.add_argument('--ranges', type=float, default=0.2, help='Fraction of Range requests')
+    parser.add_argument('--revalidate', type=float, default=0.2, help='Fraction of If-None-Match requests')
+    parser.add_argument('--verify', action='store_true', help='Check full bodies against their sha256')
+    parser.add_argument('--json', dest='json_out', help='Write results JSON')
+    args = parser.parse_args()
+
+    if (args.url or args.root) and not args.pack:
+        parser.error('--pack is required with --url / --root')
+    work = None
+    proc = None
+    try:
+        url, pack = args.url, args.pack
+        if not url:
+            root = args.root
+            if not root:
+                work = tempfile.mkdtemp(prefix='asset_load_')
+                root, pack = synthetic_pack(work, args.entries)
+            proc, url = start_server(root, args.host)
+        listing = get_json(url, f"/{quote(pack)}/")
+        entries = [{'path': f"/{quote(pack)}/{quote(e['name'])}", 'size': e['size'], 'sha256': e['sha256']}
+                   for e in listing]
+        if not entries:
+            print(f"Error: {pack} has no entries.")
+            sys.exit(1)
+        mix = {'ranges': args.ranges, 'revalidate': args.revalidate}
+        procs = max(1, min(args.procs, args.clients))
+        shares = [args.clients // procs + (i < args.clients % procs) for i in range(procs)]
+        print(f"{url}/{pack}: {len(entries)} entries, {args.clients} clients in {procs} processes, {args.duration:g}s")
+        with ProcessPoolExecutor(procs) as pool:
+            parts = list(pool.map(run_process, [url] * procs, [entries] * procs, shares, [args.duration] * procs,
+                                  [mix] * procs, [args.verify] * procs, range(procs)))
+        server_status = get_json(url, '/status')
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    latencies, statuses, errors, received, connects = [], {}, 0, 0, []
+    for lat, st, err, rec, con in parts:
+        latencies += lat
+        for k, v in st.items():
+            statuses[k] = statuses.get(k, 0) + v
+        errors += err
+        received += rec
+        connects += con
+    latencies.sort()
+    connects.sort()
+    ms = {f'p{p:g}': round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES}
+    ms['max'] = round(latencies[-1] * 1000, 3) if latencies else 0.0
+    results = {
+        'clients': args.clients,
+        'procs': procs,
+        'duration_s': args.duration,
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / args.duration, 1),
+        'mb_per_s': round(received / args.duration / (1 << 20), 2),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'errors': errors,
+        'latency_ms': ms,
+        'connect_ms': {'p50': round(percentile(connects, 50) * 1000, 3), 'max': round(connects[-1] * 1000, 3)},
+        'server': server_status.get('counts', {}),
+    }
+    print(f"{results['requests']} requests in {args.duration:g}s: {results['requests_per_s']} req/s, "
+          f"{results['mb_per_s']} MB/s, errors {errors}")
+    print(f"status {', '.join(f'{k}: {v}' for k, v in results['statuses'].items())}")
+    print('latency ms ' + ', '.join(f'{k} {v}' for k, v in ms.items()))
+    print(f"connect ms p50 {results['connect_ms']['p50']}, max {results['connect_ms']['max']} (before the timed run)")
+    print(f"server {', '.join(f'{k} {v}' for k, v in sorted(results['server'].items()))}")
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
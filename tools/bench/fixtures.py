@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+import struct
+
+# Synthetic inputs for the benchmark suite (no real ROM needed).
+#
+# NDS ROM: 0x200 header (title, FNT offset/size at 0x40, FAT offset/size at 0x48), FNT, FAT, file data
+#   FNT main table: 8 bytes per directory (u32 sub table offset, u16 first file id,
+#                   u16 parent id | 0xF000; root stores the directory count instead)
+#   sub table: u8 len + name for files, u8 0x80|len + name + u16 0xF000|dir id for directories, 0 ends
+# MM2R pak: u16 name count, u16 table offset, u16 0, u16 name end, NUL separated names from 0x08,
+#           table of (u32 size, u32 offset) per name, entry data
+# Nitro files: RGCN / RLCN / RCSN / NFTR with the block layouts read by tools/nds/nitro.py
+#
+# Everything is seeded, so the same scale always produces byte-identical fixtures.
+
+SCALES = {
+    'small': {'rom_files': 200, 'rom_depth': 3, 'rom_file_size': 4096,
+              'pak_entries': 32, 'tiles': 256, 'map_w': 32, 'map_h': 24, 'glyphs': 256},
+    'medium': {'rom_files': 2000, 'rom_depth': 4, 'rom_file_size': 16384,
+               'pak_entries': 128, 'tiles': 1024, 'map_w': 64, 'map_h': 64, 'glyphs': 2048},
+    'large': {'rom_files': 20000, 'rom_depth': 6, 'rom_file_size': 16384,
+              'pak_entries': 512, 'tiles': 4096, 'map_w': 128, 'map_h': 128, 'glyphs': 8192},
+}
+
+def align(n, a):
+    return (n + a - 1) // a * a
+
+def nitro(magic, blocks, version=0x0100):
+    body = b''.join(blocks)
+    return magic + struct.pack('<HHIHH', 0xFEFF, version, 16 + len(body), 16, len(blocks)) + body
+
+def make_rgcn(tiles, bpp=4, seed=0):
+    data = random.Random(seed).randbytes(tiles * bpp * 8)
+    blk = b'RAHC' + struct.pack('<IHHIIIII', 0x20 + len(data), 1, tiles,
+                                3 if bpp == 4 else 4, 0, 0, len(data), 0x18) + data
+    return nitro(b'RGCN', [blk])
+
+def make_rlcn(colors, bpp=4, seed=0):
+    rng = random.Random(seed)
+    data = struct.pack(f'<{colors}H', *(rng.randrange(0x8000) for _ in range(colors)))
+    blk = b'TTLP' + struct.pack('<IIIII', 0x18 + len(data), 3 if bpp == 4 else 4, 0, len(data), 0x10) + data
+    return nitro(b'RLCN', [blk])
+
+def make_rcsn(width, height, tiles, banks=1, bpp=4, seed=0):
+    # width / height in tiles; entries use every flip combination
+    rng = random.Random(seed)
+    n = width * height
+    entries = [rng.randrange(tiles) | (rng.randrange(4) << 10) | (rng.randrange(banks) << 12) for _ in range(n)]
+    data = struct.pack(f'<{n}H', *entries)
+    blk = b'NRCS' + struct.pack('<IHHHHI', 0x14 + len(data), width * 8, height * 8,
+                                0 if bpp == 4 else 1, 0, len(data)) + data
+    return nitro(b'RCSN', [blk])
+
+def _pad_block(blk):
+    blk += b'\0' * (-len(blk) % 4)
+    return blk[:4] + struct.pack('<I', len(blk)) + blk[8:]
+
+def make_nftr(glyphs, cell_w=12, cell_h=12, bpp=2, first_code=0x20, seed=0):
+    # One direct CMAP for the first 96 codes, one table CMAP for the rest
+    rng = random.Random(seed)
+    cell = (cell_w * cell_h * bpp + 7) // 8
+    finf_size = 0x1C
+    cglp_off = 16 + finf_size
+    cglp = _pad_block(b'PLGC' + struct.pack('<IBBHBBBB', 0, cell_w, cell_h, cell, cell_h - 2, cell_w, bpp, 0)
+                      + rng.randbytes(glyphs * cell))
+    cwdh_off = cglp_off + len(cglp)
+    widths = b''.join(struct.pack('<bBB', rng.randrange(-1, 2), rng.randrange(1, cell_w + 1), cell_w)
+                      for _ in range(glyphs))
+    cwdh = _pad_block(b'HDWC' + struct.pack('<IHHI', 0, 0, glyphs - 1, 0) + widths)
+    cmap_off = cwdh_off + len(cwdh)
+
+    direct = min(glyphs, 96)
+    cmaps = [struct.pack('<HHHHI', first_code, first_code + direct - 1, 0, 0, 0) + struct.pack('<H', 0)]
+    if glyphs > direct:
+        # Every other code point, so the table has holes
+        start = 0x4E00
+        table = [0xFFFF] * ((glyphs - direct) * 2 - 1)
+        for i in range(glyphs - direct):
+            table[i * 2] = direct + i
+        cmaps.append(struct.pack('<HHHHI', start, start + len(table) - 1, 1, 0, 0)
+                     + struct.pack(f'<{len(table)}H', *table))
+    blocks = []
+    pos = cmap_off
+    for i, body in enumerate(cmaps):
+        blk = _pad_block(b'PAMC' + struct.pack('<I', 0) + body)
+        if i + 1 < len(cmaps):
+            blk = blk[:16] + struct.pack('<I', pos + len(blk) + 8) + blk[20:]
+        blocks.append(blk)
+        pos += len(blk)
+    finf = b'FNIF' + struct.pack('<IBBHbBBBIII', finf_size, 0, cell_h + 2, 0, 0, cell_w, cell_w, 1,
+                                 cglp_off + 8, cwdh_off + 8, cmap_off + 8)
+    return nitro(b'RTFN', [finf, cglp, cwdh] + blocks, version=0x0102)
+
+def _dir_tree(depth, fanout):
+    # [(parent index, level)] in breadth-first order, root first
+    dirs = [(None, 0)]
+    level = [0]
+    for d in range(1, depth + 1):
+        nxt = []
+        for p in level:
+            for _ in range(fanout):
+                dirs.append((p, d))
+                nxt.append(len(dirs) - 1)
+        level = nxt
+    return dirs
+
+def make_nds_rom(path, files, depth=3, fanout=2, file_size=4096, file_align=0x200, seed=0):
+    # Returns the number of bytes written. Files are spread evenly over the directory tree.
+    rng = random.Random(seed)
+    dirs = _dir_tree(depth, fanout)
+    children = [[] for _ in dirs]
+    for i, (parent, _) in enumerate(dirs):
+        if parent is not None:
+            children[parent].append(i)
+    per_dir = [files // len(dirs) + (1 if i < files % len(dirs) else 0) for i in range(len(dirs))]
+
+    subtables = []
+    first_ids = []
+    next_id = 0
+    for i in range(len(dirs)):
+        first_ids.append(next_id)
+        st = bytearray()
+        for n in range(per_dir[i]):
+            name = f"f{next_id:05d}.bin".encode()
+            st += bytes((len(name),)) + name
+            next_id += 1
+        for c in children[i]:
+            name = f"d{c:04d}".encode()
+            st += bytes((0x80 | len(name),)) + name + struct.pack('<H', 0xF000 | c)
+        st += b'\0'
+        subtables.append(bytes(st))
+
+    main = bytearray()
+    sub_off = 8 * len(dirs)
+    for i, (parent, _) in enumerate(dirs):
+        third = len(dirs) if parent is None else 0xF000 | parent
+        main += struct.pack('<IHH', sub_off, first_ids[i], third)
+        sub_off += len(subtables[i])
+    fnt = bytes(main) + b''.join(subtables)
+
+    fnt_off = 0x200
+    fat_off = align(fnt_off + len(fnt), 0x200)
+    data_off = align(fat_off + files * 8, file_align)
+    fat = bytearray()
+    pos = data_off
+    sizes = []
+    for _ in range(files):
+        size = max(16, file_size // 2 + rng.randrange(file_size + 1))
+        fat += struct.pack('<II', pos, pos + size)
+        sizes.append((pos, size))
+        pos = align(pos + size, file_align)
+
+    header = bytearray(0x200)
+    header[0:12] = b'BENCHROM'.ljust(12, b'\0')
+    header[0x0C:0x10] = b'BNCH'
+    struct.pack_into('<IIII', header, 0x40, fnt_off, len(fnt), fat_off, len(fat))
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(fnt)
+        f.seek(fat_off)
+        f.write(fat)
+        for start, size in sizes:
+            f.seek(start)
+            f.write(rng.randbytes(size))
+        f.truncate(pos)
+    return pos
+
+def make_mm2r_pak(path, entries, seed=0):
+    # Entry payloads cycle through the tile / palette / map / font formats plus opaque blobs,
+    # the first entry is always an RGCN (mm2r_pak_probe uses it as the table anchor).
+    # Returns [(name, offset, size, magic)].
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(entries):
+        kind = i % 5
+        if kind == 0:
+            payloads.append(('NCGR', make_rgcn(rng.randrange(64, 512), seed=seed + i)))
+        elif kind == 1:
+            payloads.append(('NCLR', make_rlcn(16 * rng.randrange(1, 16), seed=seed + i)))
+        elif kind == 2:
+            payloads.append(('NSCR', make_rcsn(32, 24, 64, seed=seed + i)))
+        elif kind == 3:
+            payloads.append(('NFTR', make_nftr(rng.randrange(32, 256), seed=seed + i)))
+        else:
+            payloads.append(('BIN', rng.randbytes(rng.randrange(256, 8192))))
+    names = [f"res_{i:04d}.{ext}".encode() for i, (ext, _) in enumerate(payloads)]
+    name_blob = b'\0'.join(names) + b'\0'
+    name_end = 8 + len(name_blob)
+    table_off = align(name_end, 0x20)
+    pos = align(table_off + entries * 8, 0x20)
+    table = bytearray()
+    layout = []
+    for (ext, payload), name in zip(payloads, names):
+        table += struct.pack('<II', len(payload), pos)
+        head = payload[:4]
+        magic = head.decode('latin-1') if all(32 <= b <= 126 for b in head) else head.hex()
+        layout.append((name.decode(), pos, len(payload), magic))
+        pos = align(pos + len(payload), 0x20)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<HHHH', entries, table_off, 0, name_end))
+        f.write(name_blob)
+        f.seek(table_off)
+        f.write(table)
+        for (_, payload), (_, off, _, _) in zip(payloads, layout):
+            f.seek(off)
+            f.write(payload)
+        f.truncate(pos)
+    return layout
+
+def write_fixtures(out_dir, scale='small', seed=0):
+    # Writes every fixture for `scale` into out_dir, returns a manifest of paths and sizes
+    p = SCALES[scale]
+    os.makedirs(out_dir, exist_ok=True)
+    path = lambda name: os.path.join(out_dir, name)
+
+    rom_size = make_nds_rom(path('bench.nds'), p['rom_files'], p['rom_depth'],
+                            file_size=p['rom_file_size'], seed=seed)
+    layout = make_mm2r_pak(path('pack_data.pak'), p['pak_entries'], seed=seed)
+    # Probe JSON with the known table, as generate_correct_probe.py writes for the real pak
+    probe = {
+        'file_size': os.path.getsize(path('pack_data.pak')),
+        'name_count': len(layout),
+        'entry_mode_guess': 'offset_size',
+        'entries': [{'index': i, 'offset': off, 'size': size, 'mode': 'size_offset', 'magic': magic}
+                    for i, (_, off, size, magic) in enumerate(layout)],
+    }
+    with open(path('pak_probe.json'), 'w') as f:
+        json.dump(probe, f, indent=2)
+
+    nitro_files = {
+        'bg_rgcn.bin': make_rgcn(p['tiles'], seed=seed),
+        'bg_rlcn.bin': make_rlcn(64, seed=seed),
+        'bg_rcsn.bin': make_rcsn(p['map_w'], p['map_h'], p['tiles'], banks=4, seed=seed),
+        'font.nftr': make_nftr(p['glyphs'], seed=seed),
+    }
+    for name, data in nitro_files.items():
+        with open(path(name), 'wb') as f:
+            f.write(data)
+
+    return {
+        'scale': scale,
+        'rom': {'path': path('bench.nds'), 'bytes': rom_size, 'files': p['rom_files']},
+        'pak': {'path': path('pack_data.pak'), 'bytes': probe['file_size'], 'files': len(layout),
+                'probe': path('pak_probe.json')},
+        'rgcn': {'path': path('bg_rgcn.bin'), 'tiles': p['tiles']},
+        'rlcn': {'path': path('bg_rlcn.bin')},
+        'rcsn': {'path': path('bg_rcsn.bin'), 'tiles': p['map_w'] * p['map_h']},
+        'nftr': {'path': path('font.nftr'), 'glyphs': p['glyphs']},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic ROM / pak / Nitro benchmark fixtures.')
+    parser.add_argument('--out_dir', required=True)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = write_fixtures(args.out_dir, args.scale, args.seed)
+    with open(os.path.join(args.out_dir, 'fixtures.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Fixtures ({args.scale}) written to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from .fixtures import SCALES, write_fixtures
+except ImportError:
+    from fixtures import SCALES, write_fixtures
+
+# Benchmark runner for the extraction / pack / render tools.
+#
+# Every tool runs as its own process on the synthetic fixtures, `--repeat` times, with its
+# output directory wiped between runs. Wall time is taken around the process, peak RSS from
+# os.wait4() rusage of that child. Results are compared against baseline.json (per scale);
+# a median time or peak RSS above baseline * (1 + tolerance) is a regression and the
+# runner exits with status 1. Tolerances are per metric ("tolerance" in baseline.json, RSS
+# looser than time since the interpreter's own footprint moves between runs). Each run also
+# passes --metrics, so the per-stage split of the fastest run is included in the results.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NDS = os.path.join(ROOT, 'nds')
+PACK = os.path.join(ROOT, 'pack')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = {'median_s': 0.25, 'peak_rss_kb': 0.5}
+
+def benchmarks(fx, work):
+    # (name, argv, output dir to clear, units per run)
+    out = lambda name: os.path.join(work, 'out', name)
+    py = sys.executable
+    return [
+        ('extract_nds',
+         [py, os.path.join(NDS, 'extract_nds.py'), '--rom', fx['rom']['path'], '--out', out('extract_nds'),
+          '--limit', str(fx['rom']['files'])],
+         out('extract_nds'), {'files': fx['rom']['files'], 'bytes': fx['rom']['bytes']}),
+        ('unpack_pack',
+         [py, os.path.join(PACK, 'unpack_pack.py'), '--in', fx['pak']['path'], '--out', os.path.join(out('unpack_pack'), 'raw')],
+         out('unpack_pack'), {'bytes': fx['pak']['bytes']}),
+        ('mm2r_pak_probe',
+         [py, os.path.join(PACK, 'mm2r_pak_probe.py'), '--in', fx['pak']['path'],
+          '--scan', os.path.join(out('unpack_pack'), 'pack_scan.json'), '--out', os.path.join(out('mm2r_pak_probe'), 'probe.json')],
+         out('mm2r_pak_probe'), {'bytes': fx['pak']['bytes']}),
+        ('mm2r_pak_unpack',
+         [py, os.path.join(PACK, 'mm2r_pak_unpack_v2.py'), '--in', fx['pak']['path'], '--probe', fx['pak']['probe'],
+          '--out', out('mm2r_pak_unpack'), '--limit', str(fx['pak']['files'])],
+         out('mm2r_pak_unpack'), {'files': fx['pak']['files'], 'bytes': fx['pak']['bytes']}),
+        ('render_tilemap',
+         [py, os.path.join(NDS, 'render_rgcn_rlcn_rcsn.py'), '--rgcn', fx['rgcn']['path'], '--rlcn', fx['rlcn']['path'],
+          '--rcsn', fx['rcsn']['path'], '--out', os.path.join(out('render_tilemap'), 'bg.png')],
+         out('render_tilemap'), {'tiles': fx['rcsn']['tiles']}),
+        ('nftr_bake',
+         [py, os.path.join(NDS, 'parse_nftr_summary.py'), '--in', fx['nftr']['path'],
+          '--atlas', os.path.join(out('nftr_bake'), 'font.png'), '--glyph-metrics', os.path.join(out('nftr_bake'), 'font.gmt')],
+         out('nftr_bake'), {'glyphs': fx['nftr']['glyphs']}),
+    ]
+
+def run_once(argv, cwd):
+    # -> (wall seconds, peak RSS KiB, exit status, stderr text)
+    # stderr goes to a temporary file, not a pipe: a child that logs more than a pipe buffer
+    # would block on the write while we block in wait4().
+    with tempfile.TemporaryFile() as err_file:
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=err_file)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        err_file.seek(0)
+        err = err_file.read().decode(errors='replace')
+    rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss  # bytes on macOS
+    return wall, rss, proc.returncode, err
+
+def run_bench(name, argv, out_dir, units, cwd, repeat):
+    walls = []
+    peak = 0
+    stages = {}
+    metrics_path = os.path.join(cwd, 'metrics', f"{name}.json")
+    for _ in range(repeat):
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir, exist_ok=True)
+        wall, rss, code, err = run_once(argv + ['--metrics', metrics_path], cwd)
+        if code != 0:
+            raise RuntimeError(f"{name} exited with {code}:\n{err.strip()}")
+        if not walls or wall < min(walls):
+            with open(metrics_path, 'r') as f:
+                stages = {k: round(v['wall_s'], 4) for k, v in json.load(f)['stages'].items()}
+        walls.append(wall)
+        peak = max(peak, rss)
+    median = statistics.median(walls)
+    result = {
+        'median_s': round(median, 4),
+        'min_s': round(min(walls), 4),
+        'max_s': round(max(walls), 4),
+        'peak_rss_kb': peak,
+        'stages': stages,
+    }
+    for unit, count in units.items():
+        if unit == 'bytes':
+            result['mb_per_s'] = round(count / (1 << 20) / median, 2)
+        else:
+            result[f'{unit}_per_s'] = round(count / median, 1)
+    return result
+
+def compare(results, baseline, tolerance):
+    # tolerance: {metric: allowed growth}; -> list of regression messages
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key, allowed in tolerance.items():
+            if base.get(key) and res[key] > base[key] * (1 + allowed):
+                regressions.append(f"{name}: {key} {res[key]} > baseline {base[key]} (+{res[key] / base[key] - 1:.0%})")
+    return regressions
+
+def format_row(name, res, base):
+    rates = ', '.join(f"{k[:-6]}/s {v}" for k, v in res.items() if k.endswith('_per_s'))
+    delta = ''
+    if base and base.get('median_s'):
+        delta = f" ({res['median_s'] / base['median_s'] - 1:+.0%} vs baseline)"
+    return f"  {name:<16} {res['median_s'] * 1000:9.1f} ms{delta:<20} rss {res['peak_rss_kb'] / 1024:7.1f} MiB  {rates}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction, pack and render tools on synthetic fixtures.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='Run only these benchmarks')
+    parser.add_argument('--work_dir', help='Fixture / output directory (default: temporary, removed afterwards)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, help='Allowed slowdown over baseline (default: baseline.json, 0.25)')
+    parser.add_argument('--rss-tolerance', type=float, help='Allowed peak RSS growth over baseline (default: baseline.json, 0.5)')
+    parser.add_argument('--update-baseline', action='store_true', help='Store this run as the baseline for --scale')
+    parser.add_argument('--json', dest='json_out', help='Write results JSON')
+    args = parser.parse_args()
+
+    work = args.work_dir or tempfile.mkdtemp(prefix='nds_bench_')
+    try:
+        t0 = time.perf_counter()
+        fx = write_fixtures(os.path.join(work, 'fixtures'), args.scale)
+        print(f"Fixtures ({args.scale}) generated in {time.perf_counter() - t0:.1f}s: "
+              f"ROM {fx['rom']['bytes'] / (1 << 20):.1f} MiB / {fx['rom']['files']} files, "
+              f"pak {fx['pak']['bytes'] / (1 << 20):.1f} MiB / {fx['pak']['files']} entries")
+        # The renderer logs into ./logs
+        os.makedirs(os.path.join(work, 'logs'), exist_ok=True)
+        os.makedirs(os.path.join(work, 'metrics'), exist_ok=True)
+
+        baseline_all = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline_all = json.load(f)
+        baseline = baseline_all.get('scales', {}).get(args.scale, {})
+
+        results = {}
+        for name, argv, out_dir, units in benchmarks(fx, work):
+            if args.only and name not in args.only:
+                continue
+            try:
+                results[name] = run_bench(name, argv, out_dir, units, work, args.repeat)
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            print(format_row(name, results[name], baseline.get(name)))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'scale': args.scale, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+    if args.update_baseline:
+        scales = baseline_all.setdefault('scales', {})
+        scales.setdefault(args.scale, {}).update(results)
+        baseline_all['machine'] = f"{platform.system()} {platform.machine()}, Python {platform.python_version()}"
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline_all, f, indent=2, sort_keys=True)
+        print(f"Baseline for {args.scale} written to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"No baseline for {args.scale} in {args.baseline} (run with --update-baseline).")
+        return
+    tolerance = dict(DEFAULT_TOLERANCE, **baseline_all.get('tolerance', {}))
+    if args.tolerance is not None:
+        tolerance['median_s'] = args.tolerance
+    if args.rss_tolerance is not None:
+        tolerance['peak_rss_kb'] = args.rss_tolerance
+    regressions = compare(results, baseline, tolerance)
+    if regressions:
+        print(f"Regressions (tolerance: time {tolerance['median_s']:.0%}, RSS {tolerance['peak_rss_kb']:.0%}):")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# WebSocket load generator for the game server (server/src/index.js).
+#
+# Simulated players speak the server's protocol: connect with ?roomId=&name=Bot-<i>&playerKey=,
+# read the snapshot, then send {"type": "move", "x", "y"} at --move-hz. Most players jump to a
+# random home point inside --area x --area (which sets how many share an AOI neighbourhood) and
+# random-walk from there; --pickers of them walk to the nearest active pickup instead (the server
+# picks it up within its PICKUP_RADIUS and broadcasts "objRemoves").
+#
+# The load follows --load-profile, stages "CLIENTS:SECONDS,..." (or a name from PROFILES): at the start
+# of each stage players are connected (at --connect-rate per second) or closed until CLIENTS are
+# in, and every stage is reported on its own:
+#   move RTT        time from sending a move to the first broadcast carrying that position back
+#                   (includes the wait for the next tick); moves overtaken by a later echoed one
+#                   are "coalesced", moves never echoed within --timeout are "lost"
+#   delivery lag    receive time - the tick's server "ts" (same host clock), i.e. the fan-out delay
+#   ticks           distinct tick timestamps seen per room (rate and max gap, informational: the
+#                   server skips ticks where nothing changed and sends deltas only for a client's
+#                   AOI, so gaps here also happen on an idle server)
+#   snapshots       every client is owed a full snapshot each SNAPSHOT_INTERVAL_MS whatever moved,
+#                   so gaps between the snapshot "ts" one client receives are the tick loop's health:
+#                   a gap over the interval plus 2 ticks is a late snapshot, every whole snapshot
+#                   period missing in a gap a dropped one (stages need a few periods to show any)
+#   fan-out         broadcast messages / s and recipients per tick
+#   server CPU      from /proc/<pid>/stat (--server-pid, the --start-server child, or whatever
+#                   process listens on the port)
+# Latencies go into HDR-style histograms (log-linear buckets, < 1% relative error). The generator
+# reports its own CPU and event loop lag: when the loop lags, the numbers of that stage describe
+# the generator, not the server; spread the players over more --procs.
+#
+# Players use playerKey <--key-prefix><i>, so repeated runs reuse the same persisted entries in
+# server/data/world_state.snapshot.json / world_state.log instead of adding thousands of new ones;
+# tools/scripts/compact_world_state.py prunes loadgen-* entries after a day.
+
+TICK_RATE = 15  # server/src/index.js
+SNAPSHOT_INTERVAL_MS = 3000  # server/src/index.js; snapshots go out on the first tick past it
+WORLD_SIZE = 5000
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+PROFILES = {
+    'smoke': '10:10',
+    'ramp': '100:20,250:20,500:20,1000:20,2000:20,4000:20',
+    'soak': '1000:600',
+}
+PERCENTILES = (50, 90, 99, 99.9)
+LOOP_LAG_WARN_MS = 50
+
+TS_RE = re.compile(rb'"ts":(\d+)')
+SNAPSHOT_PREFIX = b'{"type":"snapshot"'
+OBJ_REMOVES_RE = re.compile(rb'"objRemoves":\[([^\]]*)\]')
+QUOTED_RE = re.compile(rb'"([^"]*)"')
+
+class Histogram:
+    # HDR-style histogram of non-negative integers (microseconds): values below 2 * SUB are exact,
+    # above that every power-of-two range is split into SUB linear buckets
+    SUB_BITS = 7
+    SUB = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        v = max(int(value), 0)
+        shift = max(v.bit_length() - self.SUB_BITS - 1, 0)
+        i = shift * self.SUB + (v >> shift)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.total += 1
+        self.max = max(self.max, v)
+
+    def bucket_high(self, i):
+        shift = max(i // self.SUB - 1, 0)
+        return ((i - shift * self.SUB + 1) << shift) - 1
+
+    def merge(self, other):
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        rank = max(1, -(-self.total * p // 100))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self.bucket_high(i), self.max)
+        return self.max
+
+    def summary_ms(self):
+        out = {f'p{p:g}': round(self.percentile(p) / 1000, 2) for p in PERCENTILES}
+        out['max'] = round(self.max / 1000, 2)
+        out['count'] = self.total
+        return out
+
+class WebSocket:
+    # Minimal RFC 6455 client: masked text frames out; text / binary (fragmented), ping and close in
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16))
+        writer.write(b'GET %s HTTP/1.1\r\nHost: %s:%d\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n'
+                     % (path.encode(), host.encode(), port, key))
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        if not lines[0].startswith('HTTP/1.1 101'):
+            writer.close()
+            raise ConnectionError(f"handshake refused: {lines[0]}")
+        headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(':') for l in lines[1:] if l)}
+        expect = base64.b64encode(hashlib.sha1(key + WS_GUID).digest()).decode()
+        if headers.get('sec-websocket-accept') != expect:
+            writer.close()
+            raise ConnectionError("bad Sec-WebSocket-Accept")
+        return cls(reader, writer)
+
+    def _frame(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            head = struct.pack('!BB', 0x80 | opcode, 0x80 | n)
+        elif n < 1 << 16:
+            head = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, n)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, n)
+        mask = os.urandom(4)
+        masked = (int.from_bytes(payload, 'big') ^ int.from_bytes((mask * (n // 4 + 1))[:n], 'big')).to_bytes(n, 'big')
+        self.writer.write(head + mask + masked)
+
+    async def send_text(self, text):
+        self._frame(0x1, text.encode('utf-8'))
+        await self.writer.drain()
+
+    async def recv(self):
+        # -> message payload (bytes), or None once the server closed the connection
+        parts = []
+        while True:
+            b0, b1 = await self.reader.readexactly(2)
+            n = b1 & 0x7f
+            if n == 126:
+                n = struct.unpack('!H', await self.reader.readexactly(2))[0]
+            elif n == 127:
+                n = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+            mask = await self.reader.readexactly(4) if b1 & 0x80 else None
+            payload = await self.reader.readexactly(n)
+            if mask:
+                payload = bytes(c ^ mask[i & 3] for i, c in enumerate(payload))
+            opcode = b0 & 0x0f
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._frame(0xa, payload)
+                continue
+            if opcode == 0xa:
+                continue
+            parts.append(payload)
+            if b0 & 0x80:
+                return b''.join(parts)
+
+    def close(self):
+        try:
+            self._frame(0x8, struct.pack('!H', 1000))
+        except (OSError, RuntimeError):
+            pass
+        self.writer.close()
+
+class StageStats:
+    def __init__(self):
+        self.rtt = Histogram()
+        self.lag = Histogram()
+        self.connect = Histogram()
+        self.loop = Histogram()
+        self.counts = {}
+        self.ticks = {}     # room -> {tick ts: recipients}
+        self.pickups = {}   # room -> set of picked-up object ids
+        self.snapshot_gap_max = 0
+        self.active = 0
+        self.cpu_s = 0.0
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+class Generator:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.stage = StageStats()
+        self.active = 0
+
+    async def join(self, path):
+        # -> (WebSocket, the server's first snapshot)
+        ws = await WebSocket.connect(self.cfg['host'], self.cfg['port'], path)
+        try:
+            first = await ws.recv()
+            snapshot = json.loads(first)
+            snapshot['players'][snapshot['you']]
+        except BaseException:
+            ws.close()
+            raise
+        return ws, snapshot
+
+    async def player(self, i):
+        cfg = self.cfg
+        rng = random.Random(cfg['seed'] * 1000003 + i)
+        room = cfg['room'] if cfg['rooms'] == 1 else f"{cfg['room']}_{i % cfg['rooms']}"
+        path = f"/?roomId={room}&name=Bot-{i}&playerKey={cfg['key_prefix']}{i}"
+        t0 = time.perf_counter()
+        # asyncio.wait() rather than wait_for(): wait_for() can swallow a cancel that arrives as the
+        # connect completes, and the player would then run on after its stage closed it
+        joining = asyncio.ensure_future(self.join(path))
+        try:
+            await asyncio.wait([joining], timeout=cfg['timeout'])
+        except asyncio.CancelledError:
+            joining.cancel()
+            if joining.done() and not joining.cancelled() and joining.exception() is None:
+                joining.result()[0].close()
+            raise
+        try:
+            if not joining.done():
+                joining.cancel()
+                raise TimeoutError(f"no snapshot within {cfg['timeout']:g}s")
+            ws, snapshot = joining.result()
+        except (OSError, asyncio.IncompleteReadError, ValueError, TypeError, KeyError) as e:
+            self.stage.count('connect_failed')
+            if cfg['verbose']:
+                print(f"Bot-{i}: {e!r}", file=sys.stderr)
+            return
+        self.stage.connect.record((time.perf_counter() - t0) * 1e6)
+        self.active += 1
+        me = snapshot['you']
+        own = snapshot['players'][me]
+        picker = rng.random() < cfg['pickers']
+        pickups = {o['id']: (o['x'], o['y']) for o in snapshot.get('objects', [])
+                   if o.get('type') == 'pickup' and o.get('active') and 'x' in o and 'y' in o}
+        echo_re = re.compile(rb'"id":"' + re.escape(me.encode()) + rb'"[^}]*?"x":(-?[0-9.eE+]+)')
+        pending = {}  # x sent -> send time
+        last_snapshot = [None]  # ts of the last periodic snapshot this client got
+        pos = [own['x'], own['y']]
+        if not picker:
+            pos = [rng.uniform(0, cfg['area']), rng.uniform(0, cfg['area'])]
+
+        async def reader():
+            while True:
+                msg = await ws.recv()
+                if msg is None:
+                    return
+                now = time.perf_counter()
+                stage = self.stage
+                stage.count('messages')
+                stage.count('bytes', len(msg))
+                m = TS_RE.search(msg, 0, 64)
+                if m:
+                    ts = int(m.group(1))
+                    stage.lag.record(max(time.time() * 1000 - ts, 0) * 1000)
+                    ticks = stage.ticks.setdefault(room, {})
+                    ticks[ts] = ticks.get(ts, 0) + 1
+                    if msg.startswith(SNAPSHOT_PREFIX):
+                        stage.count('snapshots')
+                        if last_snapshot[0] is not None:
+                            gap = ts - last_snapshot[0]
+                            stage.snapshot_gap_max = max(stage.snapshot_gap_max, gap)
+                            if gap > SNAPSHOT_INTERVAL_MS + 2000 / TICK_RATE:
+                                stage.count('snapshots_late')
+                                stage.count('snapshots_dropped', max(round(gap / snapshot_period()) - 1, 0))
+                        last_snapshot[0] = ts
+                m = echo_re.search(msg)
+                if m and pending:
+                    sent = pending.get(float(m.group(1)))
+                    if sent is not None:
+                        stage.rtt.record((now - sent) * 1e6)
+                        for x, t in list(pending.items()):
+                            if t <= sent:
+                                del pending[x]
+                                if t < sent:
+                                    stage.count('coalesced')
+                m = OBJ_REMOVES_RE.search(msg)
+                if m and m.group(1):
+                    for oid in QUOTED_RE.findall(m.group(1)):
+                        stage.pickups.setdefault(room, set()).add(oid)
+                        pickups.pop(oid.decode('utf-8', 'replace'), None)
+
+        async def mover():
+            period = 1 / cfg['move_hz']
+            await asyncio.sleep(rng.uniform(0, period))
+            seq = 0
+            while True:
+                if picker and pickups:
+                    tx, ty = min(pickups.values(), key=lambda p: (p[0] - pos[0]) ** 2 + (p[1] - pos[1]) ** 2)
+                    dx, dy = tx - pos[0], ty - pos[1]
+                    dist = max((dx * dx + dy * dy) ** 0.5, 1e-9)
+                    step = min(cfg['speed'], dist)
+                    pos[0] += dx / dist * step
+                    pos[1] += dy / dist * step
+                elif seq:
+                    pos[0] = min(max(pos[0] + rng.uniform(-cfg['speed'], cfg['speed']), 0), WORLD_SIZE - 1)
+                    pos[1] = min(max(pos[1] + rng.uniform(-cfg['speed'], cfg['speed']), 0), WORLD_SIZE - 1)
+                seq += 1
+                # A fraction unique to this move, so its echo can be told apart
+                x = round(pos[0], 2) + (seq % 997 + 1) * 1e-6
+                now = time.perf_counter()
+                for sx, t in list(pending.items()):
+                    if now - t > cfg['timeout']:
+                        del pending[sx]
+                        self.stage.count('lost')
+                pending[x] = now
+                await ws.send_text(json.dumps({'type': 'move', 'x': x, 'y': pos[1]}))
+                self.stage.count('moves')
+                await asyncio.sleep(period)
+
+        tasks = [asyncio.ensure_future(reader()), asyncio.ensure_future(mover())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    raise t.exception()
+            self.stage.count('disconnects')  # the server closed the connection
+        except (OSError, asyncio.IncompleteReadError):
+            self.stage.count('disconnects')
+        finally:
+            for t in tasks:
+                t.cancel()
+            self.active -= 1
+            ws.close()
+
+    async def loop_monitor(self):
+        # Event loop lag: how late a 50 ms sleep wakes up
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(0.05)
+            self.stage.loop.record((time.perf_counter() - t - 0.05) * 1e6)
+
+    async def run(self, share, procs, start_at):
+        cfg = self.cfg
+        players = {}
+        results = []
+        monitor = asyncio.ensure_future(self.loop_monitor())
+        t_stage = start_at
+        for target, seconds in cfg['stages']:
+            await asyncio.sleep(max(t_stage - time.time(), 0))
+            self.stage = StageStats()
+            cpu0 = time.process_time()
+            for i in [i for i in players if i >= target]:
+                players.pop(i).cancel()
+            new = [i for i in range(share, target, procs) if i not in players]
+            interval = procs / cfg['connect_rate']
+            for k, i in enumerate(new):
+                at = t_stage + k * interval
+                if at >= t_stage + seconds or time.time() >= t_stage + seconds:
+                    break  # the rest join in the next stage
+                await asyncio.sleep(max(at - time.time(), 0))
+                players[i] = asyncio.ensure_future(self.player(i))
+            await asyncio.sleep(max(t_stage + seconds - time.time(), 0))
+            self.stage.active = self.active
+            self.stage.cpu_s = time.process_time() - cpu0
+            results.append(self.stage)
+            t_stage += seconds
+        monitor.cancel()
+        for task in players.values():
+            task.cancel()
+        await asyncio.gather(*players.values(), return_exceptions=True)
+        return results
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def run_worker(cfg, share, procs, start_at):
+    raise_fd_limit()
+    return asyncio.run(Generator(cfg).run(share, procs, start_at))
+
+def parse_stages(spec):
+    # "CLIENTS:SECONDS,..." or a PROFILES name -> [(clients, seconds)]
+    stages = []
+    for item in PROFILES.get(spec, spec).split(','):
+        clients, _, seconds = item.strip().partition(':')
+        if not clients.isdigit() or not seconds:
+            raise ValueError(f"bad stage {item!r} (CLIENTS:SECONDS)")
+        stages.append((int(clients), float(seconds)))
+    return stages
+
+def listener_pid(port):
+    # Linux: the process holding the listening TCP socket on port (None when not found)
+    inodes = set()
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) == port:
+                        inodes.add(f'socket:[{fields[9]}]')
+        except OSError:
+            continue
+    for pid in filter(str.isdigit, os.listdir('/proc') if inodes else []):
+        try:
+            fds = os.listdir(f'/proc/{pid}/fd')
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(f'/proc/{pid}/fd/{fd}') in inodes:
+                    return int(pid)
+            except OSError:
+                continue
+    return None
+
+def sample_process(pid):
+    # -> (cpu seconds, RSS bytes) from /proc/<pid>/stat, or None
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11]) + int(fields[12])) / ticks, int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+
+def snapshot_period():
+    # Expected gap between periodic snapshots: the first tick more than SNAPSHOT_INTERVAL_MS later
+    interval = 1000 / TICK_RATE
+    return (SNAPSHOT_INTERVAL_MS // interval + 1) * interval
+
+def tick_stats(ticks, seconds):
+    # -> {'ticks', 'ticks_per_s', 'max_gap_ms', 'recipients'} over all rooms
+    out = {'ticks': 0, 'max_gap_ms': 0, 'recipients': 0.0}
+    total = 0
+    for room, by_ts in ticks.items():
+        stamps = sorted(by_ts)
+        out['ticks'] += len(stamps)
+        total += sum(by_ts.values())
+        for a, b in zip(stamps, stamps[1:]):
+            out['max_gap_ms'] = max(out['max_gap_ms'], b - a)
+    out['recipients'] = round(total / out['ticks'], 1) if out['ticks'] else 0.0
+    out['ticks_per_s'] = round(out['ticks'] / max(len(ticks), 1) / seconds, 1)
+    return out
+
+def merge_stage(parts):
+    merged = StageStats()
+    for s in parts:
+        for name in ('rtt', 'lag', 'connect', 'loop'):
+            getattr(merged, name).merge(getattr(s, name))
+        for k, v in s.counts.items():
+            merged.count(k, v)
+        for room, by_ts in s.ticks.items():
+            into = merged.ticks.setdefault(room, {})
+            for ts, n in by_ts.items():
+                into[ts] = into.get(ts, 0) + n
+        for room, ids in s.pickups.items():
+            merged.pickups.setdefault(room, set()).update(ids)
+        merged.snapshot_gap_max = max(merged.snapshot_gap_max, s.snapshot_gap_max)
+        merged.active += s.active
+        merged.cpu_s += s.cpu_s
+    return merged
+
+def report_stage(k, target, seconds, s, cpu):
+    c = s.counts
+    ticks = tick_stats(s.ticks, seconds)
+    return {
+        'stage': k,
+        'target_clients': target,
+        'seconds': seconds,
+        'clients': s.active,
+        'connect_failed': c.get('connect_failed', 0),
+        'disconnects': c.get('disconnects', 0),
+        'moves_per_s': round(c.get('moves', 0) / seconds, 1),
+        'lost': c.get('lost', 0),
+        'coalesced': c.get('coalesced', 0),
+        'rtt_ms': s.rtt.summary_ms(),
+        'delivery_lag_ms': s.lag.summary_ms(),
+        'connect_ms': s.connect.summary_ms(),
+        'messages_per_s': round(c.get('messages', 0) / seconds, 1),
+        'mb_per_s': round(c.get('bytes', 0) / seconds / (1 << 20), 2),
+        'ticks': ticks,
+        'snapshots': {'received': c.get('snapshots', 0), 'late': c.get('snapshots_late', 0),
+                      'dropped': c.get('snapshots_dropped', 0), 'max_gap_ms': s.snapshot_gap_max},
+        'pickups': sum(len(ids) for ids in s.pickups.values()),
+        'server_cpu': cpu,
+        'generator_cpu_pct': round(100 * s.cpu_s / seconds, 1),
+        'loop_lag_ms': s.loop.summary_ms(),
+    }
+
+def format_stage(r):
+    rtt, lag, t, snap = r['rtt_ms'], r['delivery_lag_ms'], r['ticks'], r['snapshots']
+    cpu = r['server_cpu']
+    cpu_text = f"server cpu {cpu['avg_pct']}% (max {cpu['max_pct']}%), rss {cpu['rss_mb']} MB" if cpu else 'server cpu n/a'
+    return (f"[{r['stage']}] {r['clients']}/{r['target_clients']} clients, {r['seconds']:g}s: "
+            f"{r['moves_per_s']} moves/s, {r['messages_per_s']} msgs/s ({r['mb_per_s']} MB/s), "
+            f"{t['recipients']} recipients/tick\n"
+            f"    rtt ms p50 {rtt['p50']} p99 {rtt['p99']} p99.9 {rtt['p99.9']} max {rtt['max']} | "
+            f"lag ms p50 {lag['p50']} p99 {lag['p99']} | lost {r['lost']}, coalesced {r['coalesced']}\n"
+            f"    ticks {t['ticks_per_s']}/s per room (max gap {t['max_gap_ms']} ms), snapshots {snap['received']}, "
+            f"late {snap['late']}, dropped {snap['dropped']} (max gap {snap['max_gap_ms']} ms) | {cpu_text}\n"
+            f"    connect failed {r['connect_failed']}, disconnects {r['disconnects']}, pickups {r['pickups']} | "
+            f"generator cpu {r['generator_cpu_pct']}%, loop lag p99 {r['loop_lag_ms']['p99']} ms"
+            + (" (generator overloaded, use more --procs)" if r['loop_lag_ms']['p99'] > LOOP_LAG_WARN_MS else ''))
+
+def breach(r, slo_ms):
+    # -> why this stage counts as falling over, or None
+    if r['connect_failed'] or r['disconnects']:
+        return f"{r['connect_failed']} failed connects, {r['disconnects']} disconnects"
+    if r['rtt_ms']['p99'] > slo_ms:
+        return f"move RTT p99 {r['rtt_ms']['p99']} ms > {slo_ms} ms"
+    snap = r['snapshots']
+    if snap['dropped'] > 0.01 * (snap['received'] + snap['dropped']):
+        return f"{snap['dropped']} dropped snapshots"
+    sent = r['moves_per_s'] * r['seconds']
+    if sent and r['lost'] > 0.01 * sent:
+        return f"{r['lost']} moves lost"
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive simulated players against the game server and measure it.')
+    parser.add_argument('--url', default='ws://127.0.0.1:8080', help='Server (ws://host:port)')
+    parser.add_argument('--load-profile', default='ramp',
+                        help=f"Stages CLIENTS:SECONDS,... or one of {', '.join(PROFILES)} (default: ramp)")
+    parser.add_argument('--room', default='poc_world')
+    parser.add_argument('--rooms', type=int, default=1, help='Spread players over N rooms (<room>_<i>)')
+    parser.add_argument('--move-hz', type=float, default=10.0, help='Moves per player per second (server throttle: 20)')
+    parser.add_argument('--speed', type=float, default=20.0, help='Units per move')
+    parser.add_argument('--area', type=float, default=WORLD_SIZE, help='Players spread over an AREA x AREA square')
+    parser.add_argument('--pickers', type=float, default=0.05, help='Fraction of players that walk to pickups')
+    parser.add_argument('--connect-rate', type=float, default=200.0, help='New connections per second')
+    parser.add_argument('--timeout', type=float, default=5.0, help='Connect timeout / seconds before a move is lost')
+    parser.add_argument('--procs', type=int, default=1, help='Generator processes')
+    parser.add_argument('--key-prefix', default='loadgen-', help='playerKey prefix')
+    parser.add_argument('--server-pid', type=int, help='Server process for CPU sampling (default: port owner)')
+    parser.add_argument('--start-server', action='store_true', help='Start server/src/index.js on the --url port')
+    parser.add_argument('--slo-ms', type=float, default=250.0, help='Move RTT p99 above which a stage fails')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_out', help='Write per-stage results JSON')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    m = re.match(r'wss?://([^:/]+):?(\d*)', args.url)
+    if not m:
+        parser.error(f"bad --url {args.url}")
+    try:
+        stages = parse_stages(args.load_profile)
+    except ValueError as e:
+        parser.error(str(e))
+    host, port = m.group(1), int(m.group(2) or 80)
+    cfg = {
+        'host': host, 'port': port, 'room': args.room, 'rooms': max(args.rooms, 1), 'stages': stages,
+        'move_hz': args.move_hz, 'speed': args.speed, 'area': min(args.area, WORLD_SIZE), 'pickers': args.pickers,
+        'connect_rate': args.connect_rate, 'timeout': args.timeout, 'key_prefix': args.key_prefix,
+        'seed': args.seed, 'verbose': args.verbose,
+    }
+
+    server = None
+    if args.start_server:
+        index = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             'server', 'src', 'index.js')
+        server = subprocess.Popen(['node', index], env=dict(os.environ, HOST=host, PORT=str(port)),
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in server.stdout:
+            if 'listening' in line:
+                break
+        else:
+            print(f"Error: server exited with status {server.wait()}")
+            sys.exit(1)
+        # Keep draining its log so it never blocks on a full pipe
+        threading.Thread(target=server.stdout.read, daemon=True).start()
+    pid = server.pid if server else args.server_pid or listener_pid(port)
+    if pid is None:
+        print(f"Warning: no process found listening on port {port}; server CPU is not sampled")
+
+    procs = max(1, args.procs)
+    total = sum(s[1] for s in stages)
+    print(f"{args.url}: {len(stages)} stages ({args.load_profile}), {total:g}s, {procs} generator process(es)")
+    start_at = time.time() + 1.0
+    samples = []  # (time, cpu seconds, rss)
+    try:
+        with ProcessPoolExecutor(procs) as pool:
+            futures = [pool.submit(run_worker, cfg, share, procs, start_at) for share in range(procs)]
+            while not all(f.done() for f in futures):
+                if pid is not None:
+                    sample = sample_process(pid)
+                    if sample:
+                        samples.append((time.time(),) + sample)
+                time.sleep(0.5)
+            parts = [f.result() for f in futures]
+    except KeyboardInterrupt:
+        print("Interrupted.")
+        sys.exit(1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = []
+    t_stage = start_at
+    for k, (target, seconds) in enumerate(stages):
+        window = [s for s in samples if t_stage <= s[0] <= t_stage + seconds]
+        cpu = None
+        if len(window) > 1:
+            rates = [100 * (b[1] - a[1]) / (b[0] - a[0]) for a, b in zip(window, window[1:]) if b[0] > a[0]]
+            cpu = {'avg_pct': round(100 * (window[-1][1] - window[0][1]) / (window[-1][0] - window[0][0]), 1),
+                   'max_pct': round(max(rates), 1), 'rss_mb': round(window[-1][2] / (1 << 20), 1)}
+        r = report_stage(k, target, seconds, merge_stage([p[k] for p in parts]), cpu)
+        results.append(r)
+        print(format_stage(r))
+        t_stage += seconds
+
+    failed = [(r, why) for r in results if (why := breach(r, args.slo_ms))]
+    if failed:
+        r, why = failed[0]
+        print(f"Falls over at stage {r['stage']} ({r['target_clients']} clients): {why}")
+    else:
+        print(f"All stages within SLO (move RTT p99 <= {args.slo_ms:g} ms, no dropped snapshots or lost moves)")
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'url': args.url, 'load_profile': args.load_profile, 'stages': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
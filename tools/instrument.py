@@ -0,0 +1,139 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Shared instrumentation for the tool CLIs.
+#
+#   parser = argparse.ArgumentParser(...)
+#   instrument.add_arguments(parser)          # --metrics out.json, --profile [out.prof]
+#   args = parser.parse_args()
+#   m = instrument.start(args, 'extract_nds')
+#   with m.stage('fat'):
+#       ...
+#   m.read(n) / m.wrote(n) / m.count('files', n)
+#
+# Stages accumulate wall and CPU time over every entry, so a stage can wrap a loop body.
+# Updates are serialized by a lock, so the threads of a server can share one Metrics (a stage
+# is timed outside the lock; CPU time is the whole process's).
+# Metrics (and the cProfile dump) are written at interpreter exit, including sys.exit()
+# and uncaught exceptions, so early-exit paths still report. Without --metrics / --profile
+# nothing is written.
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # bytes on macOS
+
+class Metrics:
+    def __init__(self, tool):
+        self.tool = tool
+        self.stages = {}
+        self.order = []
+        self.counts = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield self
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self.lock:
+                s = self.stages.get(name)
+                if s is None:
+                    s = self.stages[name] = {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0}
+                    self.order.append(name)
+                s['wall_s'] += wall
+                s['cpu_s'] += cpu
+                s['calls'] += 1
+
+    def read(self, n):
+        with self.lock:
+            self.bytes_read += n
+        return n
+
+    def wrote(self, n):
+        with self.lock:
+            self.bytes_written += n
+        return n
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def to_dict(self):
+        with self.lock:
+            return self._to_dict()
+
+    def _to_dict(self):
+        return {
+            'tool': self.tool,
+            'argv': sys.argv[1:],
+            'wall_s': round(time.perf_counter() - self._wall0, 6),
+            'cpu_s': round(time.process_time() - self._cpu0, 6),
+            'stages': {n: {'wall_s': round(self.stages[n]['wall_s'], 6),
+                           'cpu_s': round(self.stages[n]['cpu_s'], 6),
+                           'calls': self.stages[n]['calls']} for n in self.order},
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'counts': dict(self.counts),
+            'peak_rss_kb': peak_rss_kb(),
+        }
+
+def add_arguments(parser):
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--metrics', metavar='OUT.json', help='Write per-stage timings, byte and item counts, peak RSS')
+    group.add_argument('--profile', nargs='?', const='', metavar='OUT.prof',
+                       help='Run under cProfile and dump pstats (default <tool>.prof)')
+
+def start(args, tool):
+    m = Metrics(tool)
+    metrics_path = getattr(args, 'metrics', None)
+    profile_path = getattr(args, 'profile', None)
+    profiler = None
+    if profile_path is not None:
+        import cProfile
+        profile_path = profile_path or f"{tool}.prof"
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if metrics_path or profiler:
+        atexit.register(_finish, m, metrics_path, profiler, profile_path)
+    return m
+
+def _finish(m, metrics_path, profiler, profile_path):
+    if profiler:
+        import io
+        import pstats
+        profiler.disable()
+        _makedirs_for(profile_path)
+        profiler.dump_stats(profile_path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+        sys.stderr.write(out.getvalue())
+        sys.stderr.write(f"Profile written to {profile_path}\n")
+    if metrics_path:
+        _makedirs_for(metrics_path)
+        with open(metrics_path, 'w') as f:
+            json.dump(m.to_dict(), f, indent=2)
+
+def _makedirs_for(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
@@ -0,0 +1,70 @@
+# Nitro (NDS) format tools as a library.
+#
+#   from tools import nds
+#   manifest = nds.extract_rom('game.nds', 'out/', limit=0)
+#   w, h, pixels = nds.render_tilemap(rgcn, rlcn, rcsn)
+#
+# Submodules are imported on first attribute access, so `import tools.nds` is cheap and
+# nothing (logging setup, directories, output files) happens at import time. Every
+# function below returns data; the scripts' main() only add argument parsing and output.
+# Functions that take `m` accept an instrument.Metrics to accumulate stage timings into.
+
+import importlib
+
+_EXPORTS = {
+    'extract_rom': 'extract_nds',
+    'read_rom_tables': 'extract_nds',
+    'rom_sha256': 'extract_nds',
+    'parse_fnt': 'extract_nds',
+    'render_tilemap': 'render_rgcn_rlcn_rcsn',
+    'parse_rgcn': 'render_rgcn_rlcn_rcsn',
+    'parse_rlcn': 'render_rgcn_rlcn_rcsn',
+    'parse_rcsn': 'render_rgcn_rlcn_rcsn',
+    'build_collision': 'build_collision',
+    'load_solidity': 'build_collision',
+    'merge_rects': 'build_collision',
+    'select_triplets': 'pick_tilemap_triplet',
+    'match_triplets': 'pick_tilemap_triplet',
+    'build_atlas': 'build_atlas',
+    'pack_rects': 'build_atlas',
+    'dedup_directory': 'dedup_tiles',
+    'NFTRFont': 'parse_nftr_summary',
+    'decode_nftr': 'parse_nftr_summary',
+    'bake_font': 'parse_nftr_summary',
+    'BMGFile': 'parse_bmg',
+    'open_bmg': 'parse_bmg',
+    'write_string_table': 'parse_bmg',
+    'StringTable': 'parse_bmg',
+    'SDATArchive': 'parse_sdat',
+    'open_sdat': 'parse_sdat',
+    'decode_btx0': 'parse_btx0',
+    'parse_tex0': 'parse_btx0',
+    'decode_texture': 'parse_btx0',
+    'parse_ncer': 'render_ncer_nanr',
+    'parse_nanr': 'render_ncer_nanr',
+    'render_spritesheet': 'render_ncer_nanr',
+    'build_pyramid': 'map_pyramid',
+    'read_png': 'pngio',
+    'write_png': 'pngio',
+    'encode_png': 'pngio',
+    'decode_png': 'pngio',
+    'read_header': 'nitro',
+    'iter_blocks': 'nitro',
+    'find_block': 'nitro',
+    'char_info': 'nitro',
+    'pltt_info': 'nitro',
+    'scrn_info': 'nitro',
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
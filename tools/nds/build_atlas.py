@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+try:
+    from .. import instrument
+    from .pngio import read_png, write_png
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from pngio import read_png, write_png
+
+# Packs rendered PNGs (screens, sprites, glyphs) into power-of-two atlas pages.
+#
+# Packer: skyline bottom-left. Rects are sorted by height (then width), and each
+# one is placed at the lowest skyline position that fits. Pages are trimmed to
+# the smallest power of two that still holds their contents.
+#
+# Index (atlas.json):
+#   pages:  [[file, width, height], ...]
+#   frames: {name: [page, x, y, w, h]}
+#   UVs are x / page_width, y / page_height, (x + w) / page_width, (y + h) / page_height.
+
+class Skyline:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.nodes = [[0, 0, width]]  # x, y, width
+
+    def _fit(self, index, w, h):
+        x = self.nodes[index][0]
+        if x + w > self.width:
+            return -1
+        y = 0
+        remaining = w
+        i = index
+        while remaining > 0:
+            y = max(y, self.nodes[i][1])
+            if y + h > self.height:
+                return -1
+            remaining -= self.nodes[i][2]
+            i += 1
+        return y
+
+    def insert(self, w, h):
+        best = None
+        for i in range(len(self.nodes)):
+            y = self._fit(i, w, h)
+            if y < 0:
+                continue
+            if best is None or (y, self.nodes[i][0]) < (best[1], best[2]):
+                best = (i, y, self.nodes[i][0])
+        if best is None:
+            return None
+        index, y, x = best
+        self._add(index, x, y + h, w)
+        return x, y
+
+    def _add(self, index, x, top, w):
+        self.nodes.insert(index, [x, top, w])
+        i = index + 1
+        while i < len(self.nodes):
+            node = self.nodes[i]
+            prev = self.nodes[i - 1]
+            overlap = prev[0] + prev[2] - node[0]
+            if overlap <= 0:
+                break
+            node[0] += overlap
+            node[2] -= overlap
+            if node[2] <= 0:
+                del self.nodes[i]
+            else:
+                break
+        # Merge neighbours at the same height
+        i = 0
+        while i < len(self.nodes) - 1:
+            if self.nodes[i][1] == self.nodes[i + 1][1]:
+                self.nodes[i][2] += self.nodes[i + 1][2]
+                del self.nodes[i + 1]
+            else:
+                i += 1
+
+def next_pow2(v):
+    p = 1
+    while p < v:
+        p <<= 1
+    return p
+
+def pack_rects(rects, max_size, padding):
+    # rects: [(key, w, h)] -> ({key: (page, x, y)}, [(page_w, page_h)])
+    order = sorted(rects, key=lambda r: (-r[2], -r[1]))
+    placements = {}
+    pages = []
+    extents = []
+    for key, w, h in order:
+        pw, ph = w + padding, h + padding
+        if w > max_size or h > max_size:
+            raise ValueError(f"{key} ({w}x{h}) does not fit in a {max_size}x{max_size} page")
+        for page_index, page in enumerate(pages):
+            pos = page.insert(pw, ph)
+            if pos is not None:
+                break
+        else:
+            pages.append(Skyline(max_size + padding, max_size + padding))
+            extents.append([0, 0])
+            page_index = len(pages) - 1
+            pos = pages[page_index].insert(pw, ph)
+        x, y = pos
+        placements[key] = (page_index, x, y)
+        ext = extents[page_index]
+        ext[0] = max(ext[0], x + w)
+        ext[1] = max(ext[1], y + h)
+    sizes = [(next_pow2(w), next_pow2(h)) for w, h in extents]
+    return placements, sizes
+
+def blit(dst, dst_w, src, src_w, src_h, x, y):
+    stride = src_w * 4
+    for row in range(src_h):
+        d = ((y + row) * dst_w + x) * 4
+        dst[d:d + stride] = src[row * stride:(row + 1) * stride]
+
+def collect_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith('.png'):
+                        full = os.path.join(root, name)
+                        files.append((os.path.relpath(full, path), full))
+        elif path.lower().endswith('.png'):
+            files.append((os.path.basename(path), path))
+    return files
+
+def build_atlas(files, out_dir, max_size=2048, padding=1, prefix='atlas', m=None):
+    # Identical images share a single rect
+    m = m or instrument.Metrics('build_atlas')
+    images = {}
+    frames = {}
+    with m.stage('decode'):
+        for name, path in files:
+            m.read(os.path.getsize(path))
+            w, h, rgba = read_png(path)
+            digest = hashlib.sha1(rgba + w.to_bytes(4, 'little')).hexdigest()
+            if digest not in images:
+                images[digest] = (w, h, rgba)
+            frames[os.path.splitext(name)[0].replace(os.sep, '/')] = digest
+
+    with m.stage('pack'):
+        placements, sizes = pack_rects([(k, v[0], v[1]) for k, v in images.items()], max_size, padding)
+
+    with m.stage('composite'):
+        page_pixels = [bytearray(w * h * 4) for w, h in sizes]
+        for digest, (w, h, rgba) in images.items():
+            page, x, y = placements[digest]
+            blit(page_pixels[page], sizes[page][0], rgba, w, h, x, y)
+
+    os.makedirs(out_dir, exist_ok=True)
+    pages = []
+    with m.stage('encode'):
+        for i, (w, h) in enumerate(sizes):
+            fname = f"{prefix}_{i}.png"
+            write_png(w, h, page_pixels[i], os.path.join(out_dir, fname), level=9)
+            m.wrote(os.path.getsize(os.path.join(out_dir, fname)))
+            pages.append([fname, w, h])
+
+    index = {'pages': pages, 'frames': {}}
+    for name, digest in sorted(frames.items()):
+        page, x, y = placements[digest]
+        w, h, _ = images[digest]
+        index['frames'][name] = [page, x, y, w, h]
+
+    with m.stage('write'):
+        with open(os.path.join(out_dir, f"{prefix}.json"), 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack rendered PNGs into power-of-two atlas pages.')
+    parser.add_argument('--in', dest='inputs', nargs='+', required=True, help='PNG files or directories')
+    parser.add_argument('--out_dir', required=True, help='Output directory for pages and index')
+    parser.add_argument('--max-size', type=int, default=2048, help='Max page edge (power of two)')
+    parser.add_argument('--padding', type=int, default=1, help='Gap between rects in pixels')
+    parser.add_argument('--prefix', default='atlas', help='Page / index file name prefix')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'build_atlas')
+
+    if args.max_size != next_pow2(args.max_size):
+        print(f"Error: --max-size must be a power of two, got {args.max_size}")
+        sys.exit(1)
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No PNG inputs found.")
+        sys.exit(1)
+
+    index = build_atlas(files, args.out_dir, args.max_size, args.padding, args.prefix, m)
+    unique = len({tuple(v) for v in index['frames'].values()})
+    m.count('frames', len(index['frames']))
+    m.count('unique', unique)
+    m.count('pages', len(index['pages']))
+    print(f"Packed {len(index['frames'])} frames ({unique} unique) into {len(index['pages'])} page(s):")
+    for fname, w, h in index['pages']:
+        print(f"  {fname} {w}x{h}")
+
+if __name__ == "__main__":
+    main()
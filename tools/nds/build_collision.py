@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import json
+import os
+import struct
+import sys
+
+try:
+    from .. import instrument
+    from .render_rgcn_rlcn_rcsn import parse_rcsn
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from render_rgcn_rlcn_rcsn import parse_rcsn
+
+# Collision / walkability grid for a tilemap.
+#
+# Each map cell is solid when its tile index is solid in the solidity table:
+#   {"default": 0 | 1, "solid": [index | "first-last", ...], "walkable": [...]}
+# ("walkable" overrides "solid", both override "default"), or a plain list with one 0 / 1 per
+# tile index. Output for the server (server/src/index.js, one file per room):
+#   <name>.collision.json   {"version", "width", "height" (cells), "tileSize" (world units per
+#                           cell), "solidCount", "bits" (base64 bitset), "rects"}
+#   <name>.collision.bin    '<4sHHHHI' magic 'COL1', version, tileSize, width, height, rect
+#                           count; bitset; rects as '<HHHH'
+# Bitset: cell (x, y) is bit (y * width + x), LSB first, so a lookup is one shift and mask.
+# Rects ([x, y, w, h] in cells) cover exactly the solid cells: runs of solid cells per row,
+# merged downwards while the run below has the same span. They are the coarse colliders for
+# clients and bots (swept checks against a few boxes instead of every cell).
+
+BIN_HEADER = struct.Struct('<4sHHHHI')
+BIN_MAGIC = b'COL1'
+
+def load_solidity(path):
+    # -> (default solidity, set of tile indexes that are the opposite of the default)
+    with open(path, 'r') as f:
+        doc = json.load(f)
+    if isinstance(doc, list):
+        return False, {i for i, v in enumerate(doc) if v}
+
+    def expand(items):
+        out = set()
+        for item in items:
+            if isinstance(item, str) and '-' in item:
+                first, last = item.split('-', 1)
+                out.update(range(int(first, 0), int(last, 0) + 1))
+            else:
+                out.add(int(item))
+        return out
+    walkable = expand(doc.get('walkable', []))
+    if doc.get('default', 0):
+        return True, walkable
+    return False, expand(doc.get('solid', [])) - walkable
+
+def collision_bits(tile_map, map_w, map_h, default, exceptions):
+    # -> (bitset bytearray, solid cell count); tile_map as returned by parse_rcsn
+    bits = bytearray((map_w * map_h + 7) // 8)
+    count = 0
+    for i, entry in enumerate(tile_map[:map_w * map_h]):
+        if (entry['tile'] in exceptions) != default:
+            bits[i >> 3] |= 1 << (i & 7)
+            count += 1
+    return bits, count
+
+def solid_at(bits, width, x, y):
+    i = y * width + x
+    return (bits[i >> 3] >> (i & 7)) & 1
+
+def merge_rects(bits, width, height):
+    # -> [[x, y, w, h]] covering exactly the solid cells
+    rects = []
+    open_runs = {}  # (x, w) -> rect still growing downwards
+    for y in range(height):
+        runs = []
+        x = 0
+        while x < width:
+            if solid_at(bits, width, x, y):
+                start = x
+                while x < width and solid_at(bits, width, x, y):
+                    x += 1
+                runs.append((start, x - start))
+            else:
+                x += 1
+        grown = {}
+        for run in runs:
+            rect = open_runs.pop(run, None)
+            if rect is None:
+                rect = [run[0], y, run[1], 0]
+                rects.append(rect)
+            rect[3] += 1
+            grown[run] = rect
+        open_runs = grown
+    return rects
+
+def build_collision(tile_map, map_w, map_h, default, exceptions, tile_size=8):
+    bits, count = collision_bits(tile_map, map_w, map_h, default, exceptions)
+    return {
+        'version': 1,
+        'width': map_w,
+        'height': map_h,
+        'tileSize': tile_size,
+        'solidCount': count,
+        'bits': base64.b64encode(bytes(bits)).decode('ascii'),
+        'rects': merge_rects(bits, map_w, map_h),
+    }
+
+def encode_binary(grid):
+    bits = base64.b64decode(grid['bits'])
+    out = bytearray(BIN_HEADER.pack(BIN_MAGIC, 1, grid['tileSize'], grid['width'], grid['height'], len(grid['rects'])))
+    out += bits
+    for rect in grid['rects']:
+        out += struct.pack('<HHHH', *rect)
+    return bytes(out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build collision bitsets and merged colliders from tilemaps.')
+    parser.add_argument('--rcsn', required=True, help='RCSN tilemap')
+    parser.add_argument('--solidity', required=True, help='Solidity table JSON (see the top of this script)')
+    parser.add_argument('--out', required=True, help='Output base path, e.g. contentpacks/poc/world/collision/poc_world')
+    parser.add_argument('--tile-size', type=int, default=8, help='World units per map cell (default: 8)')
+    parser.add_argument('--format', choices=['json', 'bin', 'both'], default='both')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'build_collision')
+
+    for path in (args.rcsn, args.solidity):
+        if not os.path.exists(path):
+            print(f"Error: File {path} not found.")
+            sys.exit(1)
+    with open(args.rcsn, 'rb') as f:
+        data = f.read()
+    m.read(len(data))
+    try:
+        default, exceptions = load_solidity(args.solidity)
+    except (ValueError, AttributeError) as e:
+        print(f"Error: bad solidity table {args.solidity}: {e}")
+        sys.exit(1)
+    with m.stage('decode'):
+        map_w, map_h, tile_map = parse_rcsn(data)
+    with m.stage('build'):
+        grid = build_collision(tile_map, map_w, map_h, default, exceptions, args.tile_size)
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    if args.format in ('json', 'both'):
+        with open(args.out + '.collision.json', 'w') as f:
+            json.dump(grid, f, separators=(',', ':'))
+    if args.format in ('bin', 'both'):
+        with open(args.out + '.collision.bin', 'wb') as f:
+            m.wrote(f.write(encode_binary(grid)))
+    print(f"{map_w}x{map_h} cells, {grid['solidCount']} solid in {len(grid['rects'])} rects -> {args.out}.collision.*")
+
+if __name__ == "__main__":
+    main()
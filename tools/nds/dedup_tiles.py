@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+
+try:
+    from .. import instrument
+    from .nitro import char_info
+    from .render_rgcn_rlcn_rcsn import parse_rgcn, parse_rcsn
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from nitro import char_info
+    from render_rgcn_rlcn_rcsn import parse_rgcn, parse_rcsn
+
+log = logging.getLogger(__name__)
+
+# Flip-aware 8x8 tile deduplication across every RGCN tile bank.
+#
+# Each tile is stored in a canonical orientation: the smallest of its
+# identity / H / V / HV-flipped pixel strings. Flips are involutions and
+# commute, so if canonical = F(tile) then tile = F(canonical), and a map entry
+# pointing at the tile becomes (shared_id, flips XOR F).
+#
+# Tiles are only merged within a shared bank of the same bpp (read from the CHAR header) and the
+# same palette: with --triplets each RGCN takes the RLCN it was paired with, so tiles drawn with
+# different palettes stay apart. RGCNs without a paired RLCN (all of them without --triplets) are
+# deduplicated on pixel indices alone, i.e. palette-agnostic.
+#
+# Output (--out_dir):
+#   banks/<n>.bin      one shared bank per (bpp, palette): 4bpp packed (32 bytes / tile, low
+#                      nibble = left pixel) or 8bpp (64 bytes / tile)
+#   maps/<name>.map    rewritten tilemaps, u32 LE entries:
+#                        bits 0-19 tile, bit 20 flip X, bit 21 flip Y, bits 24-27 palette
+#   dedup_index.json   shared banks (file, bpp, palette), per-RGCN remap tables
+#                      (shared_id << 2 | flip) and stats
+
+FLIP_H = 1
+FLIP_V = 2
+
+def orientations(t):
+    rows = [t[r * 8:(r + 1) * 8] for r in range(8)]
+    h = b''.join(row[::-1] for row in rows)
+    v = b''.join(rows[::-1])
+    hv = t[::-1]
+    return ((t, 0), (h, FLIP_H), (v, FLIP_V), (hv, FLIP_H | FLIP_V))
+
+def canonical(t):
+    return min(orientations(t))
+
+class TileIndex:
+    def __init__(self, bpp=4, palette=None):
+        self.bpp = bpp
+        self.palette = palette
+        self.lookup = {}  # canonical pixels -> shared id
+        self.tiles = []
+        self.seen = 0
+        self.exact = set()
+
+    def add(self, tile):
+        self.seen += 1
+        self.exact.add(tile)
+        key, flip = canonical(tile)
+        shared = self.lookup.get(key)
+        if shared is None:
+            shared = len(self.tiles)
+            self.lookup[key] = shared
+            self.tiles.append(key)
+        return shared, flip
+
+    def pack(self):
+        if self.bpp == 8:
+            return b''.join(self.tiles)
+        out = bytearray(len(self.tiles) * 32)
+        pos = 0
+        for t in self.tiles:
+            lo = t[0::2]
+            hi = t[1::2]
+            for i in range(32):
+                out[pos + i] = lo[i] | (hi[i] << 4)
+            pos += 32
+        return out
+
+def decode_tiles(data):
+    # -> (bpp, [64-byte pixel strings]); files without a readable CHAR header fall back to the
+    # renderer's 4bpp scan
+    info = char_info(data)
+    if info is None:
+        return 4, [bytes(t) for t in parse_rgcn(data)]
+    start = info['data_offset']
+    raw = data[start:start + info['data_size']]
+    if info['bpp'] == 8:
+        return 8, [raw[i:i + 64] for i in range(0, len(raw) - 63, 64)]
+    tiles = []
+    for i in range(0, len(raw) - 31, 32):
+        t = bytearray(64)
+        for j, b in enumerate(raw[i:i + 32]):
+            t[2 * j] = b & 0xF
+            t[2 * j + 1] = b >> 4
+        tiles.append(bytes(t))
+    return 4, tiles
+
+def load_triplets(path):
+    # -> [(rgcn, rlcn or None, rcsn)], one graphics bank per map: the best ranked one
+    with open(path, 'r') as f:
+        data = json.load(f)
+    seen = set()
+    unique = []
+    for t in data.get('triplets') or [data]:
+        if t.get('rgcn_path') and t.get('rcsn_path') and t['rcsn_path'] not in seen:
+            seen.add(t['rcsn_path'])
+            unique.append((t['rgcn_path'], t.get('rlcn_path'), t['rcsn_path']))
+    return unique
+
+def rewrite_map(map_entries, remap):
+    out = bytearray(len(map_entries) * 4)
+    missing = 0
+    for i, e in enumerate(map_entries):
+        if e['tile'] < len(remap):
+            shared, flip = remap[e['tile']]
+        else:
+            shared, flip = 0, 0
+            missing += 1
+        fh = e['fh'] ^ (flip & FLIP_H)
+        fv = e['fv'] ^ ((flip & FLIP_V) >> 1)
+        struct.pack_into('<I', out, i * 4, shared | (fh << 20) | (fv << 21) | (e['pal'] << 24))
+    return out, missing
+
+def dedup_directory(in_dir, out_dir, triplets=None, m=None):
+    # Writes bank.bin, maps/*.map and dedup_index.json to out_dir; returns the index
+    m = m or instrument.Metrics('dedup_tiles')
+    files = sorted(f for f in os.listdir(in_dir) if f.endswith('.bin'))
+    with m.stage('scan'):
+        rgcn_paths = []
+        for f in files:
+            path = os.path.join(in_dir, f)
+            with open(path, 'rb') as fh:
+                if fh.read(4) == b'RGCN':
+                    rgcn_paths.append(path)
+
+    if not rgcn_paths:
+        raise ValueError("No RGCN files found.")
+
+    pairs = load_triplets(triplets) if triplets else []
+    palettes = {}  # RGCN path (as found in in_dir) -> RLCN it is drawn with
+    for rgcn, rlcn, _ in pairs:
+        if rlcn:
+            palettes.setdefault(os.path.join(in_dir, os.path.basename(rgcn)), os.path.basename(rlcn))
+
+    indexes = {}  # (bpp, palette) -> TileIndex
+    banks = {}    # RGCN path -> (TileIndex, remap)
+    for path in rgcn_paths:
+        with m.stage('decode'):
+            with open(path, 'rb') as f:
+                data = f.read()
+                bpp, tiles = decode_tiles(data)
+            m.read(len(data))
+        with m.stage('dedup'):
+            key = (bpp, palettes.get(path))
+            if key not in indexes:
+                indexes[key] = TileIndex(*key)
+            index = indexes[key]
+            banks[path] = (index, [index.add(t) for t in tiles])
+
+    shared = sorted(indexes.values(), key=lambda i: (i.bpp, i.palette or ''))
+    os.makedirs(os.path.join(out_dir, 'maps'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'banks'), exist_ok=True)
+    with m.stage('write'):
+        for n, index in enumerate(shared):
+            index.file = f"banks/{n}.bin"
+            with open(os.path.join(out_dir, index.file), 'wb') as f:
+                m.wrote(f.write(index.pack()))
+
+    maps = []
+    for rgcn, _, rcsn in pairs:
+        bank = banks.get(rgcn) or banks.get(os.path.join(in_dir, os.path.basename(rgcn)))
+        if bank is None or not os.path.exists(rcsn):
+            log.warning("Skipping %s (bank %s not indexed)", rcsn, rgcn)
+            continue
+        index, remap = bank
+        with m.stage('remap'):
+            with open(rcsn, 'rb') as f:
+                data = f.read()
+                width, height, entries = parse_rcsn(data)
+            m.read(len(data))
+            data, missing = rewrite_map(entries, remap)
+        if missing:
+            log.warning("%s: %d map entries point past the %d tiles of %s; they now show shared tile 0",
+                        rcsn, missing, len(remap), rgcn)
+        name = os.path.splitext(os.path.basename(rcsn))[0] + '.map'
+        with m.stage('write'):
+            with open(os.path.join(out_dir, 'maps', name), 'wb') as f:
+                m.wrote(f.write(data))
+        maps.append({'rcsn': rcsn, 'rgcn': rgcn, 'bank': index.file, 'width': width, 'height': height,
+                     'entries': len(entries), 'missing_tiles': missing, 'file': f"maps/{name}"})
+
+    seen = sum(i.seen for i in shared)
+    m.count('banks', len(banks))
+    m.count('tiles', seen)
+    m.count('maps', len(maps))
+    stats = {
+        'banks': len(banks),
+        'shared_banks': len(shared),
+        'tiles_total': seen,
+        'tiles_unique_exact': sum(len(i.exact) for i in shared),
+        'tiles_unique_flip_aware': sum(len(i.tiles) for i in shared),
+        'bank_bytes_before': sum(i.seen * i.bpp * 8 for i in shared),
+        'bank_bytes_after': sum(len(i.tiles) * i.bpp * 8 for i in shared),
+    }
+    result = {
+        'stats': stats,
+        'shared': [{'file': i.file, 'bpp': i.bpp, 'palette': i.palette, 'tiles': len(i.tiles)} for i in shared],
+        'banks': {path: {'bank': index.file, 'remap': [(s << 2) | flip for s, flip in remap]}
+                  for path, (index, remap) in banks.items()},
+        'maps': maps,
+    }
+    with m.stage('write'):
+        with open(os.path.join(out_dir, 'dedup_index.json'), 'w') as f:
+            json.dump(result, f, separators=(',', ':'))
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicate 8x8 tiles (incl. flipped copies) across RGCN banks.')
+    parser.add_argument('--in_dir', required=True, help='Directory with unpacked .bin entries')
+    parser.add_argument('--triplets', help='pick_tilemap_triplet.py output, used to pair maps with banks')
+    parser.add_argument('--out_dir', required=True)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'dedup_tiles')
+
+    try:
+        result = dedup_directory(args.in_dir, args.out_dir, args.triplets, m)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    stats = result['stats']
+
+    print(f"Tiles: {stats['tiles_total']} -> {stats['tiles_unique_flip_aware']} shared "
+          f"({stats['tiles_unique_exact']} exact-unique) across {stats['banks']} banks "
+          f"-> {stats['shared_banks']} shared banks")
+    print(f"Rewrote {len(result['maps'])} maps -> {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
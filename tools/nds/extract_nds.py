@@ -5,6 +5,15 @@ import os
 import json
 import hashlib
 import argparse
+import logging
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+log = logging.getLogger(__name__)
 
 def read_u8(f):
     return struct.unpack('<B', f.read(1))[0]
@@ -103,7 +112,8 @@ def parse_fnt(f, fnt_offset, file_allocation_table):
             name = get_string_decoded(name_bytes)
             
             if is_subdir:
-                sub_dir_id = read_u16(f)
+                # Directory ids are 0xF000 | index into the main table
+                sub_dir_id = read_u16(f) & 0x0FFF
                 new_path = os.path.join(curr_path, name)
                 queue.append((sub_dir_id, new_path))
             else:
@@ -122,38 +132,27 @@ def parse_fnt(f, fnt_offset, file_allocation_table):
                         'size': size
                     })
                 else:
-                    print(f"Warning: File ID {current_file_id} out of FAT range.")
+                    log.warning("File ID %d out of FAT range.", current_file_id)
                 
                 current_file_id += 1
                 
     return file_tree
 
-def main():
-    parser = argparse.ArgumentParser(description='Extract NDS ROM contents POC')
-    parser.add_argument('--rom', required=True, help='Path to NDS ROM')
-    parser.add_argument('--out', required=True, help='Output directory')
-    parser.add_argument('--limit', type=int, default=50, help='Max files to extract')
-    args = parser.parse_args()
-
-    rom_path = args.rom
-    out_dir = args.out
-    
-    if not os.path.exists(rom_path):
-        print(f"Error: ROM not found at {rom_path}")
-        sys.exit(1)
-        
-    ensure_dir(out_dir)
-    ensure_dir(os.path.join(out_dir, "raw"))
-    
-    # SHA256 of ROM
+def rom_sha256(rom_path, m=None):
+    m = m or instrument.Metrics('extract_nds')
     sha256 = hashlib.sha256()
     with open(rom_path, 'rb') as f:
         while chunk := f.read(8192):
+            m.read(len(chunk))
             sha256.update(chunk)
-    rom_hash = sha256.hexdigest()
-    
-    with open(rom_path, 'rb') as f:
-        # Read Header
+    return sha256.hexdigest()
+
+def read_rom_tables(f, m=None):
+    # -> {'fnt_offset', 'fnt_size', 'fat_offset', 'fat_size', 'fat': [(start, end)], 'files': [...]}
+    # files are sorted by file id
+    m = m or instrument.Metrics('extract_nds')
+    # Read Header
+    with m.stage('header'):
         f.seek(0x40)
         fnt_offset = read_u32(f)
         fnt_size = read_u32(f)
@@ -161,8 +160,9 @@ def main():
         f.seek(0x48)
         fat_offset = read_u32(f)
         fat_size = read_u32(f)
-        
-        # Parse FAT
+    
+    # Parse FAT
+    with m.stage('fat'):
         f.seek(fat_offset)
         file_count = fat_size // 8
         fat_entries = []
@@ -170,32 +170,55 @@ def main():
             start = read_u32(f)
             end = read_u32(f)
             fat_entries.append((start, end))
-            
-        # Parse FNT
-        file_tree = parse_fnt(f, fnt_offset, fat_entries)
         
+    # Parse FNT
+    with m.stage('fnt'):
+        file_tree = parse_fnt(f, fnt_offset, fat_entries)
+    
         # Sort by file_id for consistency
         file_tree.sort(key=lambda x: x['file_id'])
+    m.count('files_found', len(file_tree))
+    return {
+        'fnt_offset': fnt_offset,
+        'fnt_size': fnt_size,
+        'fat_offset': fat_offset,
+        'fat_size': fat_size,
+        'fat': fat_entries,
+        'files': file_tree,
+    }
+
+def extract_rom(rom_path, out_dir, limit=50, m=None):
+    # Writes file_tree.json, manifest.json and up to `limit` files under raw/; returns the manifest
+    m = m or instrument.Metrics('extract_nds')
+    ensure_dir(out_dir)
+    ensure_dir(os.path.join(out_dir, "raw"))
+    
+    # SHA256 of ROM
+    with m.stage('hash'):
+        rom_hash = rom_sha256(rom_path, m)
+    
+    with open(rom_path, 'rb') as f:
+        file_tree = read_rom_tables(f, m)['files']
         
-        # Write file_tree.json
-        with open(os.path.join(out_dir, 'file_tree.json'), 'w') as jf:
-            json.dump(file_tree, jf, indent=2)
-            
-        # Write manifest.json
-        manifest = {
-            'rom_sha256': rom_hash,
-            'file_count': len(file_tree),
-            'extracted_at': os.path.basename(rom_path), # Using filename as placeholder/timestamp ref
-            'sample_files': [x['path'] for x in file_tree[:10]]
-        }
-        with open(os.path.join(out_dir, 'manifest.json'), 'w') as jf:
-            json.dump(manifest, jf, indent=2)
+        with m.stage('write_index'):
+            # Write file_tree.json
+            with open(os.path.join(out_dir, 'file_tree.json'), 'w') as jf:
+                json.dump(file_tree, jf, indent=2)
+                
+            # Write manifest.json
+            manifest = {
+                'rom_sha256': rom_hash,
+                'file_count': len(file_tree),
+                'extracted_at': os.path.basename(rom_path), # Using filename as placeholder/timestamp ref
+                'sample_files': [x['path'] for x in file_tree[:10]]
+            }
+            with open(os.path.join(out_dir, 'manifest.json'), 'w') as jf:
+                json.dump(manifest, jf, indent=2)
             
         # Extract files
-        print(f"Total files found: {len(file_tree)}")
         extract_count = 0
         for entry in file_tree:
-            if extract_count >= args.limit:
+            if extract_count >= limit:
                 break
                 
             path = entry['path']
@@ -204,15 +227,35 @@ def main():
             out_path = os.path.join(out_dir, 'raw', clean_path)
             ensure_dir(os.path.dirname(out_path))
             
-            f.seek(entry['start'])
-            data = f.read(entry['size'])
+            with m.stage('read'):
+                f.seek(entry['start'])
+                data = f.read(entry['size'])
+                m.read(len(data))
             
-            with open(out_path, 'wb') as out_f:
-                out_f.write(data)
+            with m.stage('write'):
+                with open(out_path, 'wb') as out_f:
+                    m.wrote(out_f.write(data))
                 
             extract_count += 1
-            
-        print(f"Extracted {extract_count} files.")
+        m.count('files_extracted', extract_count)
+    return dict(manifest, extracted=extract_count)
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract NDS ROM contents POC')
+    parser.add_argument('--rom', required=True, help='Path to NDS ROM')
+    parser.add_argument('--out', required=True, help='Output directory')
+    parser.add_argument('--limit', type=int, default=50, help='Max files to extract')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'extract_nds')
+
+    if not os.path.exists(args.rom):
+        print(f"Error: ROM not found at {args.rom}")
+        sys.exit(1)
+
+    result = extract_rom(args.rom, args.out, args.limit, m)
+    print(f"Total files found: {result['file_count']}")
+    print(f"Extracted {result['extracted']} files.")
 
 if __name__ == '__main__':
     main()
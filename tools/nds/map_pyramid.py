@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+from itertools import chain
+
+try:
+    from .. import instrument
+    from .pngio import encode_png, read_png
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from pngio import encode_png, read_png
+
+# Chunked multi-resolution output for large composited maps.
+#
+# Level 0 is the full image; every further level halves it (2x2 box filter) until it fits
+# in a single chunk. Each level is cut into chunk x chunk tiles (edge tiles are smaller),
+# written as <out>/<level>/<cx>_<cy>.png, and listed in <out>/pyramid.json:
+#   {"version", "width", "height", "chunkSize", "levels": [{"level", "scale", "width",
+#    "height", "cols", "rows", "chunks": {"cx_cy": {"hash", "bytes"} | {"hash", "fill"}}}]}
+# "hash" is a digest of the chunk's pixels (usable as a cache key by the client); chunks
+# of a single color are not written, "fill" gives the RGBA color instead.
+#
+# On a re-run the previous manifest is read first: a chunk whose pixel hash is unchanged
+# and whose file is still there is not re-encoded, and files of chunks that no longer
+# exist are removed.
+
+MANIFEST = 'pyramid.json'
+
+def rows_to_rgba(width, height, pixels):
+    # Rows of (r, g, b) as returned by render_tilemap -> flat RGBA bytearray
+    rgb = bytes(chain.from_iterable(chain.from_iterable(pixels)))
+    rgba = bytearray(width * height * 4)
+    rgba[0::4] = rgb[0::3]
+    rgba[1::4] = rgb[1::3]
+    rgba[2::4] = rgb[2::3]
+    rgba[3::4] = b'\xff' * (width * height)
+    return rgba
+
+def downscale(width, height, rgba):
+    # -> (width, height, rgba) at half size, each pixel the rounded mean of a 2x2 block;
+    #    an odd last row / column is averaged with itself
+    w2, h2 = (width + 1) // 2, (height + 1) // 2
+    stride = width * 4
+    out = bytearray(w2 * h2 * 4)
+    for y in range(h2):
+        r0 = rgba[2 * y * stride:(2 * y + 1) * stride]
+        r1 = rgba[(2 * y + 1) * stride:(2 * y + 2) * stride] if 2 * y + 1 < height else r0
+        if width % 2:
+            r0 += r0[-4:]
+            r1 += r1[-4:]
+        line = bytearray(w2 * 4)
+        for ch in range(4):
+            line[ch::4] = bytes((a + b + c + d + 2) >> 2 for a, b, c, d in
+                                zip(r0[ch::8], r0[ch + 4::8], r1[ch::8], r1[ch + 4::8]))
+        out[y * w2 * 4:(y + 1) * w2 * 4] = line
+    return w2, h2, out
+
+def crop(width, rgba, x, y, w, h):
+    stride = width * 4
+    return b''.join(rgba[(y + r) * stride + x * 4:(y + r) * stride + (x + w) * 4] for r in range(h))
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def build_pyramid(width, height, rgba, out_dir, chunk=256, min_size=None, level=6, m=None):
+    # -> manifest; writes only chunks whose pixels changed since the manifest in out_dir
+    m = m or instrument.Metrics('map_pyramid')
+    min_size = min_size or chunk
+    old = load_manifest(out_dir)
+    old_chunks = {}
+    if old and old.get('chunkSize') == chunk:
+        for lv in old.get('levels', []):
+            for key, entry in lv.get('chunks', {}).items():
+                old_chunks[(lv['level'], key)] = entry
+    manifest = {'version': 1, 'width': width, 'height': height, 'chunkSize': chunk, 'levels': []}
+    stats = {'encoded': 0, 'reused': 0, 'fill': 0, 'removed': 0}
+    keep = set()
+    lv, w, h, px = 0, width, height, rgba
+    while True:
+        cols, rows = (w + chunk - 1) // chunk, (h + chunk - 1) // chunk
+        entry = {'level': lv, 'scale': 1 / (1 << lv), 'width': w, 'height': h,
+                 'cols': cols, 'rows': rows, 'chunks': {}}
+        os.makedirs(os.path.join(out_dir, str(lv)), exist_ok=True)
+        for cy in range(rows):
+            for cx in range(cols):
+                key = f'{cx}_{cy}'
+                cw, ch = min(chunk, w - cx * chunk), min(chunk, h - cy * chunk)
+                with m.stage('crop'):
+                    data = crop(w, px, cx * chunk, cy * chunk, cw, ch)
+                    digest = hashlib.sha1(f'{cw}x{ch}:'.encode() + data).hexdigest()[:16]
+                if data == data[:4] * (cw * ch):
+                    entry['chunks'][key] = {'hash': digest, 'fill': list(data[:4])}
+                    stats['fill'] += 1
+                    continue
+                path = os.path.join(out_dir, str(lv), key + '.png')
+                keep.add(path)
+                prev = old_chunks.get((lv, key))
+                if prev and prev.get('hash') == digest and os.path.exists(path):
+                    entry['chunks'][key] = prev
+                    stats['reused'] += 1
+                    continue
+                with m.stage('encode'):
+                    png = encode_png(cw, ch, data, level)
+                with m.stage('write'):
+                    with open(path, 'wb') as f:
+                        f.write(png)
+                m.wrote(len(png))
+                entry['chunks'][key] = {'hash': digest, 'bytes': len(png)}
+                stats['encoded'] += 1
+        manifest['levels'].append(entry)
+        if w <= min_size and h <= min_size:
+            break
+        with m.stage('downscale'):
+            w, h, px = downscale(w, h, px)
+        lv += 1
+
+    # Chunk files left over from a larger map or a level that now is a fill
+    for name in os.listdir(out_dir):
+        level_dir = os.path.join(out_dir, name)
+        if not name.isdigit() or not os.path.isdir(level_dir):
+            continue
+        for fn in os.listdir(level_dir):
+            path = os.path.join(level_dir, fn)
+            if fn.endswith('.png') and path not in keep:
+                os.remove(path)
+                stats['removed'] += 1
+    manifest['stats'] = stats
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    for k, v in stats.items():
+        m.count(f'chunks_{k}', v)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description='Cut a large image into a chunked multi-resolution pyramid.')
+    parser.add_argument('--in', dest='input_file', required=True, help='PNG (e.g. a rendered tilemap)')
+    parser.add_argument('--out_dir', required=True)
+    parser.add_argument('--chunk', type=int, default=256, help='Chunk size in pixels (default: 256)')
+    parser.add_argument('--level', type=int, default=6, help='zlib level for the chunk PNGs')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'map_pyramid')
+
+    if not os.path.exists(args.input_file):
+        print(f"Error: File {args.input_file} not found.")
+        sys.exit(1)
+    with m.stage('read'):
+        width, height, rgba = read_png(args.input_file)
+    m.read(os.path.getsize(args.input_file))
+    manifest = build_pyramid(width, height, rgba, args.out_dir, args.chunk, level=args.level, m=m)
+    s = manifest['stats']
+    print(f"{width}x{height} -> {len(manifest['levels'])} levels of {args.chunk}px chunks: "
+          f"{s['encoded']} encoded, {s['reused']} unchanged, {s['fill']} solid, {s['removed']} removed")
+
+if __name__ == "__main__":
+    main()
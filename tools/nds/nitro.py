@@ -0,0 +1,136 @@
+import struct
+
+# Shared helpers for Nitro (NDS) resource files: RGCN / RLCN / RCSN / NFTR ...
+#
+# Common file header (0x10 bytes):
+# 0x00: Magic (4)
+# 0x04: BOM (2) - 0xFEFF
+# 0x06: Version (2)
+# 0x08: File Size (4)
+# 0x0C: Header Size (2)
+# 0x0E: Num Blocks (2)
+#
+# Every block starts with Magic (4) + Block Size (4, includes these 8 bytes).
+# Block magics are usually stored reversed ('RAHC' for CHAR, 'TTLP' for PLTT).
+
+BPP_4 = 3
+BPP_8 = 4
+
+
+def read_header(data):
+    if len(data) < 16:
+        return None
+    magic = data[0:4]
+    bom, version, file_size, header_size, num_blocks = struct.unpack_from('<HHIHH', data, 4)
+    if bom != 0xFEFF or header_size < 16:
+        return None
+    return {
+        'magic': magic.decode('ascii', errors='replace'),
+        'version': version,
+        'file_size': file_size,
+        'header_size': header_size,
+        'num_blocks': num_blocks,
+    }
+
+
+def iter_blocks(data):
+    # Yields (magic, offset, size) with magic normalized to reading order ('CHAR', 'PLTT', ...)
+    header = read_header(data)
+    if header is None:
+        return
+    offset = header['header_size']
+    for _ in range(header['num_blocks']):
+        if offset + 8 > len(data):
+            break
+        raw = data[offset:offset + 4]
+        size = struct.unpack_from('<I', data, offset + 4)[0]
+        yield block_name(raw), offset, size
+        if size < 8:
+            break
+        offset += size
+
+
+def block_name(raw):
+    name = bytes(raw).decode('ascii', errors='replace')
+    # Reversed magics are the common case on NDS
+    return name[::-1] if name[::-1] in KNOWN_BLOCKS else name
+
+
+KNOWN_BLOCKS = {
+    'CHAR', 'CPOS', 'PLTT', 'PCMP', 'SCRN',
+    'FINF', 'CGLP', 'CWDH', 'CMAP',
+    'CEBK', 'LABL', 'UEXT', 'ABNK',
+}
+
+
+def find_block(data, name):
+    # Returns the offset of block `name`, walking the block list first and
+    # falling back to a 4-aligned scan (same as the renderer) for odd files.
+    for magic, offset, _ in iter_blocks(data):
+        if magic == name:
+            return offset
+    fwd = name.encode('ascii')
+    rev = fwd[::-1]
+    offset = 0
+    while offset < len(data) - 4:
+        chunk = data[offset:offset + 4]
+        if chunk == fwd or chunk == rev:
+            return offset
+        offset += 4
+    return -1
+
+
+def char_info(data):
+    # CHAR block:
+    # +0x08: u16 height (tiles), +0x0A: u16 width (tiles)
+    # +0x0C: u32 bpp (3 = 4bpp, 4 = 8bpp)
+    # +0x18: u32 tile data size, +0x1C: u32 tile data offset (from +0x08)
+    off = find_block(data, 'CHAR')
+    if off < 0 or off + 0x20 > len(data):
+        return None
+    h, w, bpp = struct.unpack_from('<HHI', data, off + 0x08)
+    size, rel = struct.unpack_from('<II', data, off + 0x18)
+    bits = 8 if bpp == BPP_8 else 4
+    return {
+        'bpp': bits,
+        'tiles_w': w,
+        'tiles_h': h,
+        'data_offset': off + 0x08 + rel,
+        'data_size': size,
+        'tile_count': size // (bits * 8),
+    }
+
+
+def pltt_info(data):
+    # PLTT block:
+    # +0x08: u32 bpp (3 = 4bpp, 4 = 8bpp)
+    # +0x10: u32 palette data size, +0x14: u32 data offset (from +0x08)
+    off = find_block(data, 'PLTT')
+    if off < 0 or off + 0x18 > len(data):
+        return None
+    bpp, _ext, size, rel = struct.unpack_from('<IIII', data, off + 0x08)
+    return {
+        'bpp': 8 if bpp == BPP_8 else 4,
+        'data_offset': off + 0x08 + rel,
+        'data_size': size,
+        'color_count': size // 2,
+    }
+
+
+def scrn_info(data):
+    # SCRN block:
+    # +0x08: u16 width (px), +0x0A: u16 height (px)
+    # +0x0C: u16 color mode (0 = 16 colors, 1 = 256 colors), +0x0E: u16 bg type
+    # +0x10: u32 map data size, map data follows at +0x14
+    off = find_block(data, 'SCRN')
+    if off < 0 or off + 0x14 > len(data):
+        return None
+    w, h, mode, bg_type, size = struct.unpack_from('<HHHHI', data, off + 0x08)
+    return {
+        'width': w // 8,
+        'height': h // 8,
+        'bpp': 8 if mode == 1 else 4,
+        'bg_type': bg_type,
+        'data_offset': off + 0x14,
+        'data_size': min(size, len(data) - off - 0x14),
+    }
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+# BMG message table decoder.
+#
+# Header (0x20): 'MESGbmg1', u32 file size, u32 block count, u8 encoding, 15 bytes pad
+#   encoding: 1 = cp1252, 2 = UTF-16LE, 3 = Shift-JIS, 4 = UTF-8
+# INF1: magic, u32 size, u16 message count, u16 entry size, u32 file id,
+#       entries: u32 offset into DAT1 data (+ entry size - 4 bytes of attributes)
+# DAT1: magic, u32 size, string data at +8
+# Control codes start with 0x1A (one code unit), followed by a u8 total length in
+# bytes (including the 0x1A unit); the bytes in between are group / type / params.
+#
+# Messages are only decoded when accessed; INF1 is read once into an offset index.
+#
+# Exported string table (.stb, little endian, mmap friendly):
+#   'STB1', u32 count, u32 offsets[count + 1] (relative to the blob), UTF-8 blob
+#   Control codes are written as {group:type:params-hex}.
+
+ENCODINGS = {1: 'cp1252', 2: 'utf-16-le', 3: 'shift_jis', 4: 'utf-8'}
+STB_MAGIC = b'STB1'
+
+class BMGFile:
+    def __init__(self, data):
+        self.data = data
+        if bytes(data[0:8]) != b'MESGbmg1':
+            raise ValueError("Not a BMG file")
+        _size, blocks, enc = struct.unpack_from('<IIB', data, 8)
+        self.encoding = ENCODINGS.get(enc, 'utf-16-le')
+        self.unit = 2 if self.encoding == 'utf-16-le' else 1
+        self.esc = b'\x1a\x00' if self.unit == 2 else b'\x1a'
+        self.term = b'\0' * self.unit
+        self.offsets = array('I')
+        self.attributes = []
+        self.dat_start = -1
+        self.dat_end = -1
+        pos = 0x20
+        for _ in range(blocks):
+            if pos + 8 > len(data):
+                break
+            magic = bytes(data[pos:pos + 4])
+            size = struct.unpack_from('<I', data, pos + 4)[0]
+            if magic == b'INF1':
+                count, entry_size = struct.unpack_from('<HH', data, pos + 8)
+                base = pos + 0x10
+                if entry_size == 4:
+                    self.offsets.frombytes(bytes(data[base:base + count * 4]))
+                    if sys.byteorder != 'little':
+                        self.offsets.byteswap()
+                else:
+                    for i in range(count):
+                        e = base + i * entry_size
+                        self.offsets.append(struct.unpack_from('<I', data, e)[0])
+                        self.attributes.append(bytes(data[e + 4:e + entry_size]))
+            elif magic == b'DAT1':
+                self.dat_start = pos + 8
+                self.dat_end = min(pos + size, len(data))
+            if size < 8:
+                break
+            pos += size
+        if self.dat_start < 0:
+            raise ValueError("BMG has no DAT1 block")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _find(self, needle, pos, end):
+        # find() that only accepts hits on code unit boundaries (relative to pos)
+        while True:
+            i = self.data.find(needle, pos, end)
+            if i < 0 or (i - pos) % self.unit == 0:
+                return i
+            pos = i + 1
+
+    def raw(self, index):
+        # Bytes of message `index` up to (not including) its terminator.
+        # Control codes are skipped by length, so zero bytes in their params don't end the message.
+        start = self.dat_start + self.offsets[index]
+        pos = start
+        while True:
+            term = self._find(self.term, pos, self.dat_end)
+            if term < 0:
+                return bytes(self.data[start:self.dat_end])
+            esc = self._find(self.esc, pos, term)
+            if esc < 0:
+                return bytes(self.data[start:term])
+            length = self.data[esc + self.unit]
+            pos = esc + max(length + (length % self.unit), self.unit * 2)
+
+    def tokens(self, index):
+        # [str | (group, type, params bytes)] for message `index`
+        raw = self.raw(index)
+        esc = self.esc
+        out = []
+        pos = 0
+        while pos < len(raw):
+            i = raw.find(esc, pos)
+            while i >= 0 and (i - pos) % self.unit:
+                i = raw.find(esc, i + 1)
+            if i < 0:
+                out.append(raw[pos:].decode(self.encoding, errors='replace'))
+                break
+            if i > pos:
+                out.append(raw[pos:i].decode(self.encoding, errors='replace'))
+            length = raw[i + self.unit] if i + self.unit < len(raw) else 0
+            length = max(length, self.unit + 1)
+            body = raw[i + self.unit + 1:i + length]
+            group = body[0] if body else 0
+            ctype = struct.unpack_from('<H', body, 1)[0] if len(body) >= 3 else 0
+            out.append((group, ctype, body[3:]))
+            pos = i + length
+        return out
+
+    def text(self, index):
+        parts = []
+        for t in self.tokens(index):
+            if isinstance(t, str):
+                parts.append(t)
+            else:
+                parts.append(f"{{{t[0]}:{t[1]}:{t[2].hex()}}}")
+        return ''.join(parts)
+
+    def __getitem__(self, index):
+        return self.text(index)
+
+def open_bmg(path):
+    f = open(path, 'rb')
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    return BMGFile(data)
+
+def write_string_table(strings, out_path):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = array('I', [0])
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    with open(out_path, 'wb') as f:
+        f.write(STB_MAGIC + struct.pack('<I', len(blobs)))
+        f.write(offsets.tobytes())
+        for b in blobs:
+            f.write(b)
+
+class StringTable:
+    # Memory-mapped reader for .stb files; strings are decoded on access
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[0:4] != STB_MAGIC:
+            raise ValueError("Not a string table")
+        self.count = struct.unpack_from('<I', self.data, 4)[0]
+        self.blob = 8 + (self.count + 1) * 4
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start, end = struct.unpack_from('<II', self.data, 8 + index * 4)
+        return self.data[self.blob + start:self.blob + end].decode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode BMG message tables.')
+    parser.add_argument('--in', dest='input_file', required=True, help='Input BMG file')
+    parser.add_argument('--export', help='Write an mmap-able string table (.stb)')
+    parser.add_argument('--show', type=int, nargs='*', help='Print these message indices')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'parse_bmg')
+
+    if not os.path.exists(args.input_file):
+        print(f"Error: File {args.input_file} not found.")
+        sys.exit(1)
+
+    try:
+        with m.stage('header'):
+            bmg = open_bmg(args.input_file)
+    except (ValueError, struct.error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    m.count('messages', len(bmg))
+    print(f"Messages: {len(bmg)}, Encoding: {bmg.encoding}")
+
+    for i in args.show or []:
+        if 0 <= i < len(bmg):
+            print(f"  [{i}] {bmg[i]!r}")
+
+    if args.export:
+        with m.stage('decode'):
+            strings = [bmg[i] for i in range(len(bmg))]
+        m.read(len(bmg.data))
+        with m.stage('write'):
+            write_string_table(strings, args.export)
+        m.wrote(os.path.getsize(args.export))
+        print(f"String table written to {args.export}")
+
+if __name__ == "__main__":
+    main()
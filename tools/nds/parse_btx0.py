@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+from array import array
+
+try:
+    from .. import instrument
+    from .pngio import write_png
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from pngio import write_png
+
+log = logging.getLogger(__name__)
+
+# BTX0 / TEX0 texture decoder.
+#
+# Nitro 3D header: magic, u16 BOM, u16 version, u32 size, u16 header size, u16 block count,
+#                  u32 block offsets[block count] (TEX0 is also found inside BMD0 models)
+# TEX0 (offsets from block start):
+#   +0x0E u16 texture dict, +0x14 u32 texture data
+#   +0x24 u32 4x4 texel data, +0x28 u32 4x4 palette index data
+#   +0x34 u32 palette dict, +0x38 u32 palette data
+# Dict: u8 rev, u8 count, u16 size, tree block (u16 hdr, u16 size, u32 0x17F, u32 per entry),
+#       u16 entry size, u16 section size, entries, 16-byte names
+#   texture entry: u32 params (offset >> 3 bits 0-15, width 8 << bits 20-22, height 8 << bits 23-25,
+#                  format bits 26-28, color 0 transparent bit 29), u32 extra
+#   palette entry: u16 offset >> 3, u16 flags
+#
+# Formats: 1 A3I5, 2 4-color, 3 16-color, 4 256-color, 5 4x4 compressed, 6 A5I3, 7 direct
+# Every format is converted to RGBA with whole-buffer lookup tables (one join over the
+# texel bytes); 4x4 blocks are decoded a texel row at a time from a per-palette cache.
+
+FORMAT_NAMES = {1: 'a3i5', 2: 'pal4', 3: 'pal16', 4: 'pal256', 5: 'tex4x4', 6: 'a5i3', 7: 'direct'}
+BITS = {1: 8, 2: 2, 3: 4, 4: 8, 5: 2, 6: 8, 7: 16}
+
+def bgr555(val, alpha=255):
+    r = val & 0x1F
+    g = (val >> 5) & 0x1F
+    b = (val >> 10) & 0x1F
+    return bytes(((r << 3) | (r >> 2), (g << 3) | (g >> 2), (b << 3) | (b >> 2), alpha))
+
+_direct_lut = None
+
+def direct_lut():
+    # u16 texel -> RGBA, built once
+    global _direct_lut
+    if _direct_lut is None:
+        _direct_lut = [bgr555(v, 255 if v & 0x8000 else 0) for v in range(0x10000)]
+    return _direct_lut
+
+def read_dict(data, off):
+    count = data[off + 1]
+    # 4-byte dict header + tree block (u16 hdr, u16 size, u32 0x17F, u32 per entry)
+    entries = off + 12 + 4 * count
+    entry_size = struct.unpack_from('<H', data, entries)[0]
+    names_off = entries + 4 + entry_size * count
+    out = []
+    for i in range(count):
+        raw = data[entries + 4 + i * entry_size:entries + 4 + (i + 1) * entry_size]
+        name = data[names_off + i * 16:names_off + (i + 1) * 16].split(b'\0')[0].decode('ascii', errors='replace')
+        out.append((name, raw))
+    return out
+
+def find_tex0(data):
+    if data[0:4] == b'TEX0':
+        return 0
+    count = struct.unpack_from('<H', data, 0x0E)[0]
+    for off in struct.unpack_from(f'<{count}I', data, 0x10):
+        if data[off:off + 4] == b'TEX0':
+            return off
+    raise ValueError("TEX0 block not found")
+
+def parse_tex0(data):
+    base = find_tex0(data)
+    tex_dict, = struct.unpack_from('<H', data, base + 0x0E)
+    tex_data, = struct.unpack_from('<I', data, base + 0x14)
+    cmp_data, cmp_info = struct.unpack_from('<II', data, base + 0x24)
+    pal_dict, pal_data = struct.unpack_from('<II', data, base + 0x34)
+    textures = []
+    for name, raw in read_dict(data, base + tex_dict):
+        params = struct.unpack_from('<I', raw)[0]
+        textures.append({
+            'name': name,
+            'offset': (params & 0xFFFF) << 3,
+            'width': 8 << ((params >> 20) & 7),
+            'height': 8 << ((params >> 23) & 7),
+            'format': (params >> 26) & 7,
+            'transparent0': (params >> 29) & 1,
+        })
+    palettes = []
+    for name, raw in read_dict(data, base + pal_dict):
+        palettes.append({'name': name, 'offset': struct.unpack_from('<H', raw)[0] << 3})
+    return {
+        'base': base,
+        'tex_data': base + tex_data,
+        'cmp_data': base + cmp_data,
+        'cmp_info': base + cmp_info,
+        'pal_data': base + pal_data,
+        'textures': textures,
+        'palettes': palettes,
+    }
+
+def read_colors(data, start, count):
+    end = min(start + count * 2, len(data))
+    vals = array('H')
+    vals.frombytes(bytes(data[start:end - (end - start) % 2]))
+    if sys.byteorder != 'little':
+        vals.byteswap()
+    return [bgr555(v) for v in vals] + [b'\x00\x00\x00\x00'] * (count - len(vals))
+
+def paletted_lut(colors, bits, transparent0):
+    # texel byte -> RGBA bytes for all pixels packed in it (LSB first)
+    if transparent0:
+        colors = [b'\x00\x00\x00\x00'] + colors[1:]
+    per = 8 // bits
+    mask = (1 << bits) - 1
+    return [b''.join(colors[(b >> (bits * i)) & mask] for i in range(per)) for b in range(256)]
+
+def alpha_lut(colors, index_bits):
+    # A3I5 / A5I3: index in the low bits, alpha in the rest
+    alpha_bits = 8 - index_bits
+    amax = (1 << alpha_bits) - 1
+    out = []
+    for b in range(256):
+        c = colors[b & ((1 << index_bits) - 1)]
+        out.append(c[:3] + bytes(((b >> index_bits) * 255 // amax,)))
+    return out
+
+def decode_4x4(data, tex, info, colors_base):
+    w, h = tex['width'], tex['height']
+    blocks_w, blocks_h = w // 4, h // 4
+    texels = info['cmp_data'] + tex['offset']
+    pal_idx = info['cmp_info'] + tex['offset'] // 2
+    clear = b'\x00\x00\x00\x00'
+    row_cache = {}
+    # Texel row byte -> four 2-bit indices, LSB first
+    row_idx = [((b & 3), (b >> 2) & 3, (b >> 4) & 3, b >> 6) for b in range(256)]
+    out_rows = []
+    for by in range(blocks_h):
+        rows = [[], [], [], []]
+        for bx in range(blocks_w):
+            n = by * blocks_w + bx
+            pal = data[pal_idx + n * 2] | (data[pal_idx + n * 2 + 1] << 8)
+            table = row_cache.get(pal)
+            if table is None:
+                mode = pal >> 14
+                c = read_colors(data, colors_base + (pal & 0x3FFF) * 4, 4)
+                c0, c1 = c[0], c[1]
+                if mode == 0:
+                    cols = [c0, c1, c[2], clear]
+                elif mode == 1:
+                    cols = [c0, c1, bytes((a + b) // 2 for a, b in zip(c0, c1)), clear]
+                elif mode == 2:
+                    cols = c
+                else:
+                    cols = [c0, c1,
+                            bytes((5 * a + 3 * b) // 8 for a, b in zip(c0, c1)),
+                            bytes((3 * a + 5 * b) // 8 for a, b in zip(c0, c1))]
+                table = [b''.join(cols[i] for i in row_idx[b]) for b in range(256)]
+                row_cache[pal] = table
+            for r in range(4):
+                rows[r].append(table[data[texels + n * 4 + r]])
+        out_rows.extend(b''.join(r) for r in rows)
+    return bytearray(b''.join(out_rows))
+
+def decode_texture(data, info, tex, palette):
+    # -> bytearray RGBA (width * height * 4)
+    fmt = tex['format']
+    w, h = tex['width'], tex['height']
+    pal_base = info['pal_data'] + (palette['offset'] if palette else 0)
+    if fmt == 5:
+        return decode_4x4(data, tex, info, pal_base)
+    size = w * h * BITS.get(fmt, 8) // 8
+    start = info['tex_data'] + tex['offset']
+    raw = bytes(data[start:start + size])
+    if fmt == 7:
+        vals = array('H')
+        vals.frombytes(raw[:len(raw) // 2 * 2])
+        if sys.byteorder != 'little':
+            vals.byteswap()
+        return bytearray(b''.join(map(direct_lut().__getitem__, vals)))
+    if fmt in (1, 6):
+        index_bits = 5 if fmt == 1 else 3
+        lut = alpha_lut(read_colors(data, pal_base, 1 << index_bits), index_bits)
+    elif fmt in (2, 3, 4):
+        bits = BITS[fmt]
+        lut = paletted_lut(read_colors(data, pal_base, 1 << bits), bits, tex['transparent0'])
+    else:
+        raise ValueError(f"Unknown texture format {fmt}")
+    return bytearray(b''.join(map(lut.__getitem__, raw)))
+
+def pick_palette(tex, index, palettes):
+    # Palettes are usually named after their texture with a '_pl' suffix
+    by_name = {p['name']: p for p in palettes}
+    for key in (tex['name'] + '_pl', tex['name']):
+        if key in by_name:
+            return by_name[key]
+    if index < len(palettes):
+        return palettes[index]
+    return palettes[0] if palettes else None
+
+def decode_btx0(data, m=None):
+    # -> ([{'name', 'format', 'width', 'height', 'palette', 'rgba'}], texture count in the dict);
+    # textures that fail to decode are skipped with a warning
+    m = m or instrument.Metrics('parse_btx0')
+    with m.stage('header'):
+        info = parse_tex0(data)
+    out = []
+    for i, tex in enumerate(info['textures']):
+        palette = pick_palette(tex, i, info['palettes']) if tex['format'] != 7 else None
+        try:
+            with m.stage('decode'):
+                rgba = decode_texture(data, info, tex, palette)
+        except (ValueError, IndexError, struct.error) as e:
+            log.warning("%s failed: %s", tex['name'], e)
+            continue
+        out.append({
+            'name': tex['name'] or f'tex_{i}',
+            'format': FORMAT_NAMES.get(tex['format'], str(tex['format'])),
+            'width': tex['width'],
+            'height': tex['height'],
+            'palette': palette['name'] if palette else None,
+            'rgba': rgba,
+        })
+    m.count('textures', len(out))
+    return out, len(info['textures'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode BTX0 / TEX0 textures to PNG.')
+    parser.add_argument('--in', dest='input_file', required=True, help='BTX0 (or BMD0 with embedded TEX0) file')
+    parser.add_argument('--out_dir', required=True)
+    parser.add_argument('--offset', type=int, default=0, help='BTX0 offset inside the input (see pack_scan.json)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'parse_btx0')
+
+    if not os.path.exists(args.input_file):
+        print(f"Error: File {args.input_file} not found.")
+        sys.exit(1)
+
+    with open(args.input_file, 'rb') as f:
+        f.seek(args.offset)
+        data = f.read()
+    m.read(len(data))
+
+    try:
+        textures, total = decode_btx0(data, m)
+    except (ValueError, struct.error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    index = []
+    for tex in textures:
+        fname = f"{tex['name']}.png"
+        with m.stage('encode'):
+            write_png(tex['width'], tex['height'], tex['rgba'], os.path.join(args.out_dir, fname))
+        m.wrote(os.path.getsize(os.path.join(args.out_dir, fname)))
+        index.append({
+            'name': tex['name'],
+            'file': fname,
+            'format': tex['format'],
+            'size': [tex['width'], tex['height']],
+            'palette': tex['palette'],
+        })
+        print(f"{tex['name']}: {tex['format']} {tex['width']}x{tex['height']} -> {fname}")
+
+    with open(os.path.join(args.out_dir, 'textures.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+    print(f"Decoded {len(index)}/{total} textures.")
+
+if __name__ == "__main__":
+    main()
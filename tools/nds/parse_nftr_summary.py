@@ -1,11 +1,249 @@
 import argparse
+import json
 import os
 import struct
+import sys
+from array import array
+
+try:
+    from .. import instrument
+    from .nitro import read_header, iter_blocks
+    from .pngio import write_png
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from nitro import read_header, iter_blocks
+    from pngio import write_png
+
+# NFTR (Nitro font) decoder.
+#
+# FINF (+0x08 relative to block start):
+#   u8 font type, u8 line feed, u16 alt (fallback) glyph
+#   u8 default left, u8 default glyph width, u8 default advance, u8 encoding
+#   u32 CGLP offset, u32 CWDH offset, u32 CMAP offset (each points at block + 8)
+# CGLP: u8 cell width, u8 cell height, u16 cell size (bytes), u8 baseline,
+#       u8 max width, u8 bpp, u8 flags, glyph data at +0x10 (MSB-first bits, no row padding)
+# CWDH: u16 first glyph, u16 last glyph, u32 next CWDH, entries (left, width, advance) at +0x10
+# CMAP: u16 first code, u16 last code, u16 type, u16 pad, u32 next CMAP, data at +0x14
+#   type 0 (direct): u16 first glyph, glyph = code - first code + first glyph
+#   type 1 (table):  u16 glyph per code, 0xFFFF = none
+#   type 2 (scan):   u16 count, then (u16 code, u16 glyph) pairs
+
+ENCODINGS = {0: 'utf-8', 1: 'utf-16', 2: 'shift_jis', 3: 'cp1252'}
+
+NO_GLYPH = -1
+# Dense lookup when the mapped code range is at most this many codepoints
+DENSE_LIMIT = 0x10000
+
+# Baked metrics file (little endian):
+#   header  'GMT1', u16 glyph count, u8 cell w, u8 cell h, u8 line feed, u8 baseline,
+#           u16 atlas w, u16 atlas h, u32 code count
+#   glyphs  per atlas slot: s8 left, u8 glyph width, u8 advance, u8 pad, u16 x, u16 y, u8 w, u8 h
+#   codes   (u32 code, u16 slot, u16 pad) sorted by code, for binary search on the client
+METRICS_MAGIC = b'GMT1'
+METRICS_HEADER = struct.Struct('<4sHBBBBHHI')
+METRICS_GLYPH = struct.Struct('<bBBxHHBB')
+METRICS_CODE = struct.Struct('<IHxx')
+
+_unpack_luts = {}
+
+def unpack_lut(bpp):
+    # byte -> pixel values, MSB first, bpp bits each
+    lut = _unpack_luts.get(bpp)
+    if lut is None:
+        per_byte = 8 // bpp
+        mask = (1 << bpp) - 1
+        lut = [bytes((b >> (8 - bpp * (i + 1))) & mask for i in range(per_byte)) for b in range(256)]
+        _unpack_luts[bpp] = lut
+    return lut
+
+class NFTRFont:
+    def __init__(self):
+        self.font_type = 0
+        self.line_feed = 0
+        self.alt_glyph = 0
+        self.default_width = (0, 0, 0)
+        self.encoding = 'utf-16'
+        self.cell_width = 0
+        self.cell_height = 0
+        self.cell_size = 0
+        self.baseline = 0
+        self.max_width = 0
+        self.bpp = 1
+        self.glyph_count = 0
+        self.pixels = b''  # every glyph unpacked, one byte per pixel, cell_width * cell_height each
+        self.widths = {}  # glyph -> (left, glyph width, advance)
+        self.code_base = 0
+        self.code_table = None  # array('i') when dense, else None
+        self.code_map = {}  # code -> glyph when sparse
+
+    def glyph_index(self, code):
+        if self.code_table is not None:
+            i = code - self.code_base
+            if 0 <= i < len(self.code_table):
+                return self.code_table[i]
+            return NO_GLYPH
+        return self.code_map.get(code, NO_GLYPH)
+
+    def char_code(self, ch):
+        # CMAP codes are in the font's encoding (UTF-16 code units for most fonts)
+        if self.encoding == 'utf-16':
+            return ord(ch)
+        try:
+            return int.from_bytes(ch.encode(self.encoding), 'big')
+        except UnicodeEncodeError:
+            return -1
+
+    def glyph_pixels(self, glyph):
+        n = self.cell_width * self.cell_height
+        return self.pixels[glyph * n:(glyph + 1) * n]
+
+    def glyph_width(self, glyph):
+        return self.widths.get(glyph, self.default_width)
+
+    def codes(self):
+        # (code, glyph) for every mapped code
+        if self.code_table is not None:
+            return [(self.code_base + i, g) for i, g in enumerate(self.code_table) if g != NO_GLYPH]
+        return sorted(self.code_map.items())
+
+def parse_cglp(font, data, off, size):
+    cw, ch, cell_size, baseline, max_width, bpp, _flags = struct.unpack_from('<BBHBBBB', data, off + 8)
+    font.cell_width, font.cell_height = cw, ch
+    font.cell_size, font.baseline, font.max_width = cell_size, baseline, max_width
+    font.bpp = bpp if bpp in (1, 2, 4, 8) else 1
+    raw = data[off + 0x10:off + size]
+    if cell_size == 0:
+        return
+    font.glyph_count = len(raw) // cell_size
+    raw = raw[:font.glyph_count * cell_size]
+    # Unpack every glyph in one pass, then drop the per-cell padding bits
+    unpacked = b''.join(map(unpack_lut(font.bpp).__getitem__, raw))
+    stride = cell_size * (8 // font.bpp)
+    n = cw * ch
+    if stride == n:
+        font.pixels = unpacked
+    else:
+        font.pixels = b''.join(unpacked[g * stride:g * stride + n] for g in range(font.glyph_count))
+
+def parse_cwdh(font, data, off, size):
+    first, last = struct.unpack_from('<HH', data, off + 8)
+    count = max(0, last - first + 1)
+    pos = off + 0x10
+    count = min(count, (off + size - pos) // 3)
+    for i, (left, gw, adv) in enumerate(struct.iter_unpack('<bBB', data[pos:pos + count * 3])):
+        font.widths[first + i] = (left, gw, adv)
+
+def parse_cmap(mapping, data, off, size):
+    first, last, map_type = struct.unpack_from('<HHH', data, off + 8)
+    pos = off + 0x14
+    if map_type == 0:
+        base = struct.unpack_from('<H', data, pos)[0]
+        for code in range(first, last + 1):
+            mapping[code] = base + code - first
+    elif map_type == 1:
+        count = last - first + 1
+        table = struct.unpack_from(f'<{count}H', data, pos)
+        for i, g in enumerate(table):
+            if g != 0xFFFF:
+                mapping[first + i] = g
+    elif map_type == 2:
+        count = struct.unpack_from('<H', data, pos)[0]
+        pairs = struct.unpack_from(f'<{count * 2}H', data, pos + 2)
+        mapping.update(zip(pairs[0::2], pairs[1::2]))
+
+def build_lookup(font, mapping):
+    # Merge every CMAP into one O(1) table: dense array if the code range is compact, dict otherwise
+    if not mapping:
+        return
+    lo, hi = min(mapping), max(mapping)
+    if hi - lo < DENSE_LIMIT:
+        table = array('i', [NO_GLYPH]) * (hi - lo + 1)
+        for code, g in mapping.items():
+            table[code - lo] = g
+        font.code_base = lo
+        font.code_table = table
+    else:
+        font.code_map = mapping
+
+def decode_nftr(data):
+    header = read_header(data)
+    if header is None or header['magic'] not in ('NFTR', 'RTFN'):
+        raise ValueError("Not an NFTR file")
+    font = NFTRFont()
+    mapping = {}
+    for magic, off, size in iter_blocks(data):
+        if off + size > len(data):
+            size = len(data) - off
+        if magic == 'FINF':
+            (font.font_type, font.line_feed, font.alt_glyph, left, gw, adv,
+             enc) = struct.unpack_from('<BBHbBBB', data, off + 8)
+            font.default_width = (left, gw, adv)
+            font.encoding = ENCODINGS.get(enc, 'utf-16')
+        elif magic == 'CGLP':
+            parse_cglp(font, data, off, size)
+        elif magic == 'CWDH':
+            parse_cwdh(font, data, off, size)
+        elif magic == 'CMAP':
+            parse_cmap(mapping, data, off, size)
+    build_lookup(font, mapping)
+    return font
+
+def next_pow2(v):
+    p = 1
+    while p < v:
+        p <<= 1
+    return p
+
+def bake_font(font):
+    # Every glyph reachable from the CMAP goes into one grid atlas (white RGB, coverage in alpha).
+    # Returns (atlas_w, atlas_h, rgba, metrics_bytes).
+    codes = [(c, g) for c, g in font.codes() if 0 <= g < font.glyph_count]
+    glyphs = sorted({g for _, g in codes})
+    if font.alt_glyph < font.glyph_count and font.alt_glyph not in glyphs:
+        glyphs.insert(0, font.alt_glyph)
+    slots = {g: i for i, g in enumerate(glyphs)}
+
+    cw, ch = font.cell_width, font.cell_height
+    cols = max(1, next_pow2(int(len(glyphs) ** 0.5 * ch / max(cw, 1)) or 1))
+    while cols * cw > 4096 and cols > 1:
+        cols //= 2
+    rows = (len(glyphs) + cols - 1) // cols
+    atlas_w = next_pow2(cols * cw)
+    atlas_h = next_pow2(max(1, rows * ch))
+
+    # Coverage levels -> RGBA, expanded per glyph row with a single join
+    levels = (1 << font.bpp) - 1
+    texel = [b'\xff\xff\xff' + bytes((v * 255 // levels,)) if v <= levels else b'\xff\xff\xff\xff'
+             for v in range(256)]
+    rgba = bytearray(atlas_w * atlas_h * 4)
+    records = []
+    for i, g in enumerate(glyphs):
+        x = (i % cols) * cw
+        y = (i // cols) * ch
+        px = font.glyph_pixels(g)
+        for row in range(ch):
+            d = ((y + row) * atlas_w + x) * 4
+            rgba[d:d + cw * 4] = b''.join(map(texel.__getitem__, px[row * cw:(row + 1) * cw]))
+        left, gw, adv = font.glyph_width(g)
+        records.append(METRICS_GLYPH.pack(left, gw, adv, x, y, cw, ch))
+
+    out = bytearray(METRICS_HEADER.pack(METRICS_MAGIC, len(glyphs), cw, ch, font.line_feed,
+                                        font.baseline, atlas_w, atlas_h, len(codes)))
+    out += b''.join(records)
+    out += b''.join(METRICS_CODE.pack(c, slots[g]) for c, g in codes)
+    return atlas_w, atlas_h, rgba, bytes(out)
 
 def main():
-    parser = argparse.ArgumentParser(description='Parse summary of NFTR file.')
+    parser = argparse.ArgumentParser(description='Decode NFTR font file.')
     parser.add_argument('--in', dest='input_file', required=True, help='Input NFTR bin file')
+    parser.add_argument('--json', dest='json_out', help='Write decoded cmap / widths JSON')
+    parser.add_argument('--text', help='Print glyph indices for this text')
+    parser.add_argument('--atlas', help='Write pre-rendered glyph atlas PNG')
+    parser.add_argument('--glyph-metrics', dest='glyph_metrics', help='Write binary glyph metrics table (needs --atlas)')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    m = instrument.start(args, 'parse_nftr_summary')
 
     file_path = args.input_file
     if not os.path.exists(file_path):
@@ -14,118 +252,70 @@ def main():
 
     with open(file_path, 'rb') as f:
         data = f.read()
+    m.read(len(data))
 
-    file_size = len(data)
     print(f"解析文件: {file_path}")
-    print(f"文件总大小: {file_size} bytes")
+    print(f"文件总大小: {len(data)} bytes")
 
-    # Magic check
-    if len(data) < 4:
-        print("文件过小，无法读取 Magic。")
-        return
-        
-    magic = data[0:4].decode('ascii', errors='ignore')
-    print(f"Magic: {magic} ({'匹配' if magic == 'NFTR' else '不匹配'})")
-    
-    if magic != 'NFTR':
+    header = read_header(data)
+    if header is None or header['magic'] not in ('NFTR', 'RTFN'):
         print("非 NFTR 文件，停止解析。")
         return
 
-    # Basic Header (Nitro Header common format)
-    # 0x00: Magic (4)
-    # 0x04: Endian (2) - usually 0xFFFE
-    # 0x06: Version (2)
-    # 0x08: File Size (4)
-    # 0x0C: Header Size (2)
-    # 0x0E: Num Blocks (2)
-    
-    if len(data) < 16:
-        print("头部数据不足 16 字节。")
-        return
+    print(f"Version: 0x{header['version']:04X}")
+    print(f"Header Reported Size: {header['file_size']}")
+    print(f"Number of Blocks: {header['num_blocks']}")
+    for magic, off, size in iter_blocks(data):
+        print(f"-- Block Found: {magic} at {off}, size {size}")
 
     try:
-        endian = struct.unpack('<H', data[4:6])[0]
-        version = struct.unpack('<H', data[6:8])[0]
-        header_size = struct.unpack('<I', data[8:12])[0] # Careful, spec says u32 size at 0x8?
-        # Actually standard NDS header:
-        # 0x04: u16 endian
-        # 0x06: u16 version
-        # 0x08: u32 file_size
-        # 0x0C: u16 header_size
-        # 0x0E: u16 num_blocks
-        
-        reported_size = struct.unpack('<I', data[8:12])[0]
-        header_len = struct.unpack('<H', data[12:14])[0]
-        num_blocks = struct.unpack('<H', data[14:16])[0]
-        
-        print(f"Endian: 0x{endian:04X}")
-        print(f"Version: 0x{version:04X}")
-        print(f"Header Reported Size: {reported_size}")
-        print(f"Header Length: {header_len}")
-        print(f"Number of Blocks: {num_blocks}")
-
-        # Try to find FINF (Font Info) block
-        # Blocks usually follow the header.
-        current_offset = header_len
-        
-        # Limit search loop to prevent hang
-        for _ in range(num_blocks):
-            if current_offset + 8 > file_size:
-                break
-            
-            block_magic = data[current_offset:current_offset+4].decode('ascii', errors='ignore')
-            block_size = struct.unpack('<I', data[current_offset+4:current_offset+8])[0]
-            
-            print(f"-- Block Found: {block_magic} at {current_offset}, size {block_size}")
-            
-            if block_magic == 'FINF':
-                # Parse FINF summary
-                # FINF structure (approx):
-                # 0x00: Magic
-                # 0x04: Size
-                # 0x08: Unknown/Encoding?
-                # 0x0C: Height?
-                # ...
-                # Let's try to extract some bytes that might be meaningful
-                if block_size >= 0x20:
-                    finf_data = data[current_offset:current_offset+block_size]
-                    # Common fields in FINF:
-                    # +0x08: u8 fontType?
-                    # +0x09: u8 height?
-                    # +0x0A: u16 unknown
-                    # +0x0C: u8 defaultWidth?
-                    # +0x0D: u8 defaultHeight?
-                    
-                    # Just dumping some raw values for analysis
-                    try:
-                        u8_vals = struct.unpack('BBBBBB', finf_data[8:14])
-                        print(f"   FINF Raw Bytes [0x8:0xE]: {u8_vals}")
-                        print(f"   Possible Height: {u8_vals[1]}")
-                    except:
-                        print("   Unable to parse FINF details.")
-            
-            elif block_magic == 'CGLP':
-                # Character Glyph (Bitmaps)
-                # Usually contains width, height, bpp
-                if block_size >= 16:
-                    cglp_data = data[current_offset:current_offset+block_size]
-                    try:
-                        # +0x08: u8 cellWidth
-                        # +0x09: u8 cellHeight
-                        # +0x0A: u16 cellLen?
-                        cw, ch = struct.unpack('BB', cglp_data[8:10])
-                        print(f"   CGLP Cell Size: {cw}x{ch}")
-                    except:
-                        pass
-                        
-            elif block_magic == 'CMAP':
-                # Character Map
-                print("   Found Character Map info.")
-
-            current_offset += block_size
-
-    except Exception as e:
+        with m.stage('decode'):
+            font = decode_nftr(data)
+    except (ValueError, struct.error) as e:
         print(f"解析过程中遇到错误: {e}")
+        return
+
+    codes = font.codes()
+    m.count('glyphs', font.glyph_count)
+    m.count('codes', len(codes))
+    print(f"Line Feed: {font.line_feed}, Encoding: {font.encoding}, Alt Glyph: {font.alt_glyph}")
+    print(f"CGLP Cell Size: {font.cell_width}x{font.cell_height}, {font.bpp}bpp, {font.glyph_count} glyphs")
+    print(f"CWDH Entries: {len(font.widths)}")
+    print(f"CMAP Codes: {len(codes)} ({'dense' if font.code_table is not None else 'hashed'} lookup)")
+
+    if args.text:
+        for ch in args.text:
+            print(f"   U+{ord(ch):04X} {ch!r} -> glyph {font.glyph_index(font.char_code(ch))}")
+
+    if args.json_out:
+        result = {
+            'cell': [font.cell_width, font.cell_height],
+            'bpp': font.bpp,
+            'line_feed': font.line_feed,
+            'encoding': font.encoding,
+            'glyph_count': font.glyph_count,
+            'cmap': {str(code): g for code, g in codes},
+            'widths': {str(g): list(w) for g, w in sorted(font.widths.items())},
+        }
+        with m.stage('write'):
+            with open(args.json_out, 'w') as f:
+                json.dump(result, f, indent=2)
+        print(f"Decoded font written to {args.json_out}")
+
+    if args.atlas:
+        with m.stage('composite'):
+            atlas_w, atlas_h, rgba, metrics = bake_font(font)
+        with m.stage('encode'):
+            write_png(atlas_w, atlas_h, rgba, args.atlas, level=9)
+        m.wrote(os.path.getsize(args.atlas))
+        print(f"Glyph atlas written to {args.atlas} ({atlas_w}x{atlas_h})")
+        if args.glyph_metrics:
+            with m.stage('write'):
+                with open(args.glyph_metrics, 'wb') as f:
+                    m.wrote(f.write(metrics))
+            print(f"Glyph metrics written to {args.glyph_metrics} ({len(metrics)} bytes)")
+    elif args.glyph_metrics:
+        print("--glyph-metrics needs --atlas, skipped.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+# SDAT sound archive indexer.
+#
+# Header: 'SDAT', u16 BOM, u16 version, u32 file size, u16 header size, u16 block count,
+#         then (u32 offset, u32 size) for SYMB, INFO, FAT, FILE (offsets from the SDAT start)
+# SYMB / INFO: magic, u32 size, 8 x u32 record offsets (from block start), one per kind below
+#   SYMB record: u32 count, u32 name offsets (SEQARC: pairs of name offset, sub record offset)
+#   INFO record: u32 count, u32 entry offsets (0 = unused slot); every entry starts with u16 file id
+#     SEQ entry:  u16 file id, u16 unk, u16 bank id, u8 volume, ...
+#     BANK entry: u16 file id, u16 unk, u16 wave archive ids[4]
+# FAT: 'FAT ', u32 size, u32 count, entries of (u32 offset, u32 size, 8 bytes reserved)
+#
+# The archive is memory-mapped; members are returned as memoryview slices, nothing is
+# copied until a member is written out.
+
+KINDS = ['seq', 'seqarc', 'bank', 'wavearc', 'player', 'group', 'player2', 'strm']
+FILE_KINDS = {'seq', 'seqarc', 'bank', 'wavearc', 'strm'}
+EXTENSIONS = {'seq': 'sseq', 'seqarc': 'ssar', 'bank': 'sbnk', 'wavearc': 'swar', 'strm': 'strm'}
+
+class SDATArchive:
+    def __init__(self, data, base=0):
+        self.data = data
+        self.view = memoryview(data)
+        self.base = base
+        if bytes(data[base:base + 4]) != b'SDAT':
+            raise ValueError("Not an SDAT archive")
+        offsets = struct.unpack_from('<8I', data, base + 0x10)
+        self.symb = offsets[0] if offsets[1] else 0
+        self.info = offsets[2]
+        self.fat = offsets[4]
+        self.files = self._read_fat()
+        self.names = self._read_symb() if self.symb else {}
+        self.index = self._read_info()
+
+    def _u32(self, off):
+        return struct.unpack_from('<I', self.data, self.base + off)[0]
+
+    def _read_fat(self):
+        count = self._u32(self.fat + 8)
+        start = self.base + self.fat + 12
+        return [(off, size) for off, size, _, _ in
+                struct.iter_unpack('<IIII', self.data[start:start + count * 16])]
+
+    def _string(self, off):
+        start = self.base + off
+        end = self.data.find(b'\0', start)
+        return bytes(self.data[start:end]).decode('ascii', errors='replace')
+
+    def _read_symb(self):
+        names = {}
+        records = struct.unpack_from('<8I', self.data, self.base + self.symb + 8)
+        for kind, rec in zip(KINDS, records):
+            if rec == 0:
+                continue
+            count = self._u32(self.symb + rec)
+            step = 8 if kind == 'seqarc' else 4
+            kind_names = []
+            for i in range(count):
+                off = self._u32(self.symb + rec + 4 + i * step)
+                kind_names.append(self._string(self.symb + off) if off else None)
+            names[kind] = kind_names
+        return names
+
+    def _read_info(self):
+        index = {}
+        records = struct.unpack_from('<8I', self.data, self.base + self.info + 8)
+        for kind, rec in zip(KINDS, records):
+            entries = []
+            if rec:
+                count = self._u32(self.info + rec)
+                kind_names = self.names.get(kind, [])
+                for i in range(count):
+                    off = self._u32(self.info + rec + 4 + i * 4)
+                    if off == 0:
+                        continue
+                    entry = {'id': i, 'name': kind_names[i] if i < len(kind_names) and kind_names[i] else f"{kind}_{i:04d}"}
+                    if kind in FILE_KINDS:
+                        file_id = struct.unpack_from('<H', self.data, self.base + self.info + off)[0]
+                        entry['file_id'] = file_id
+                        if file_id < len(self.files):
+                            entry['offset'], entry['size'] = self.files[file_id]
+                    if kind == 'seq':
+                        entry['bank'] = struct.unpack_from('<H', self.data, self.base + self.info + off + 4)[0]
+                    elif kind == 'bank':
+                        entry['wavearcs'] = [w for w in struct.unpack_from('<4H', self.data, self.base + self.info + off + 4) if w != 0xFFFF]
+                    entries.append(entry)
+            index[kind] = entries
+        return index
+
+    def find(self, kind, key):
+        # key: entry name or numeric id
+        for entry in self.index.get(kind, []):
+            if entry['name'] == key or str(entry['id']) == str(key):
+                return entry
+        return None
+
+    def member(self, entry):
+        # Zero-copy view of a member's bytes
+        if 'offset' not in entry:
+            return None
+        start = self.base + entry['offset']
+        return self.view[start:start + entry['size']]
+
+def open_sdat(path, offset=0):
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return SDATArchive(data, offset)
+
+def main():
+    parser = argparse.ArgumentParser(description='Index an SDAT sound archive and extract members on demand.')
+    parser.add_argument('--in', dest='input_file', required=True, help='SDAT file, or a pack containing one')
+    parser.add_argument('--offset', type=int, default=0, help='SDAT offset inside the input (see pack_scan.json)')
+    parser.add_argument('--index', help='Write the member index JSON')
+    parser.add_argument('--extract', nargs='*', metavar='KIND:NAME', help='Members to write, e.g. strm:BGM_TOWN wavearc:3')
+    parser.add_argument('--out_dir', default='.', help='Directory for extracted members')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'parse_sdat')
+
+    if not os.path.exists(args.input_file):
+        print(f"Error: File {args.input_file} not found.")
+        sys.exit(1)
+
+    try:
+        with m.stage('index'):
+            sdat = open_sdat(args.input_file, args.offset)
+    except (ValueError, struct.error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    m.count('files', len(sdat.files))
+    for kind in KINDS:
+        if sdat.index.get(kind):
+            print(f"{kind}: {len(sdat.index[kind])}")
+
+    if args.index:
+        with open(args.index, 'w') as f:
+            json.dump({'offset': args.offset, 'files': len(sdat.files), 'members': sdat.index}, f, indent=2)
+        print(f"Index written to {args.index}")
+
+    if args.extract:
+        os.makedirs(args.out_dir, exist_ok=True)
+        root = os.path.realpath(args.out_dir)
+        for spec in args.extract:
+            kind, _, key = spec.partition(':')
+            entry = sdat.find(kind, key)
+            view = sdat.member(entry) if entry else None
+            if view is None:
+                print(f"Warning: {spec} not found.")
+                continue
+            # SYMB names come from the file: keep them to one plain file name inside out_dir
+            name = re.sub(r'[^\w.-]', '_', entry['name']).lstrip('.') or f"{kind}_{entry['id']}"
+            out_path = os.path.join(args.out_dir, f"{name}.{EXTENSIONS.get(kind, 'bin')}")
+            if not os.path.realpath(out_path).startswith(root + os.sep):
+                print(f"Warning: {spec}: name {entry['name']!r} leaves the output directory, skipped.")
+                continue
+            with m.stage('write'):
+                with open(out_path, 'wb') as f:
+                    m.wrote(f.write(view))
+            m.read(len(view))
+            m.count('extracted')
+            print(f"Extracted {spec} -> {out_path} ({entry['size']} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,234 @@
 #!/usr/bin/env python3
 import os
 import json
-import struct
 import sys
+import bisect
+from array import array
 
-def get_magic(path):
+try:
+    from .. import instrument
+    from .nitro import char_info, pltt_info, scrn_info
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from nitro import char_info, pltt_info, scrn_info
+
+# Header bytes needed to read CHAR / PLTT block info without loading the file
+HEAD_READ = 0x40
+
+def read_head(path, size=HEAD_READ):
     try:
         with open(path, 'rb') as f:
-            return f.read(4)
-    except:
+            return f.read(size)
+    except OSError:
         return b''
 
+def get_position(path):
+    # unpacked filenames format:
+    #   entry_NNN_MAGIC_OFFSET_SIZE.bin   (mm2r_pak_unpack_v2.py)
+    #   MAGIC_OFFSET_SIZE.bin             (extract_by_magic.py)
+    fname = os.path.basename(path)
+    parts = fname.split('_')
+    if len(parts) > 1 and parts[0] == 'entry' and parts[1].isdigit():
+        offset = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 0
+        return (int(parts[1]), offset)
+    if len(parts) > 1 and parts[1].isdigit():
+        return (9999, int(parts[1]))
+    return (9999, 0)
+
+def probe_rgcn(path, head):
+    info = char_info(head)
+    if info is None:
+        return None
+    return {'path': path, 'bpp': info['bpp'], 'tile_count': info['tile_count']}
+
+def probe_rlcn(path, head):
+    info = pltt_info(head)
+    if info is None:
+        return None
+    return {'path': path, 'bpp': info['bpp'], 'color_count': info['color_count']}
+
+def probe_rcsn(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    info = scrn_info(data)
+    if info is None:
+        return None
+    start = info['data_offset']
+    count = info['data_size'] // 2
+    entries = array('H')
+    entries.frombytes(data[start:start + count * 2])
+    if sys.byteorder != 'little':
+        entries.byteswap()
+    if not entries:
+        return None
+    # Tile index (10 bits), Flip X (1), Flip Y (1), Palette (4)
+    max_tile = max(v & 0x3FF for v in entries)
+    max_pal = max(v >> 12 for v in entries)
+    return {
+        'path': path,
+        'bpp': info['bpp'],
+        'width': info['width'],
+        'height': info['height'],
+        'max_tile': max_tile,
+        'max_pal': max_pal,
+    }
+
+def colors_needed(m):
+    # 4bpp maps select a 16-color bank per entry, 8bpp maps index a single 256-color palette
+    if m['bpp'] == 4:
+        return (m['max_pal'] + 1) * 16
+    return 256
+
+class PositionIndex:
+    # Candidates of one kind bucketed by bpp and sorted by pack position,
+    # so a map only looks at same-depth entries inside its distance window.
+    def __init__(self, items):
+        self.buckets = {}
+        for item in sorted(items, key=lambda x: x['pos']):
+            bucket = self.buckets.setdefault(item['bpp'], ([], []))
+            bucket[0].append(item['pos'])
+            bucket[1].append(item)
+
+    def near(self, bpp, pos, max_distance):
+        bucket = self.buckets.get(bpp)
+        if not bucket:
+            return []
+        positions, items = bucket
+        if max_distance is None:
+            return items
+        lo = bisect.bisect_left(positions, pos - max_distance)
+        hi = bisect.bisect_right(positions, pos + max_distance)
+        return items[lo:hi]
+
+def score_triplet(m, g, p):
+    # Tighter fits and closer pack neighbours score higher (max 1.0)
+    tile_fit = (m['max_tile'] + 1) / g['tile_count']
+    pal_fit = colors_needed(m) / p['color_count']
+    dist = abs(g['pos'] - m['pos']) + abs(p['pos'] - m['pos'])
+    proximity = 1.0 / (1.0 + dist)
+    return round(0.5 * proximity + 0.3 * tile_fit + 0.2 * pal_fit, 6)
+
+def match_triplets(rgcns, rlcns, rcsns, max_distance=None):
+    gindex = PositionIndex(rgcns)
+    pindex = PositionIndex(rlcns)
+    results = []
+    for m in rcsns:
+        need_tiles = m['max_tile'] + 1
+        need_colors = colors_needed(m)
+        graphics = [g for g in gindex.near(m['bpp'], m['pos'], max_distance) if g['tile_count'] >= need_tiles]
+        if not graphics:
+            continue
+        palettes = [p for p in pindex.near(m['bpp'], m['pos'], max_distance) if p['color_count'] >= need_colors]
+        for g in graphics:
+            for p in palettes:
+                results.append({
+                    'rgcn_path': g['path'],
+                    'rlcn_path': p['path'],
+                    'rcsn_path': m['path'],
+                    'score': score_triplet(m, g, p),
+                    'bpp': m['bpp'],
+                    'map_size': [m['width'], m['height']],
+                    'tiles_used': need_tiles,
+                    'tile_count': g['tile_count'],
+                    'colors_used': need_colors,
+                    'color_count': p['color_count'],
+                })
+    results.sort(key=lambda r: -r['score'])
+    return results
+
+def select_triplets(in_dir, max_distance=16, top=0, m=None):
+    # -> {'rgcn_path', 'rlcn_path', 'rcsn_path', 'reason', 'candidates', 'triplets'}, or None when no
+    # RGCN + RLCN pair exists. max_distance None / < 0 = unlimited, top 0 = keep all triplets.
+    m = m or instrument.Metrics('pick_tilemap_triplet')
+    files = sorted(f for f in os.listdir(in_dir) if f.endswith('.bin'))
+
+    rgcn_list = []
+    rlcn_list = []
+    rcsn_list = []
+
+    with m.stage('scan'):
+        for f in files:
+            path = os.path.join(in_dir, f)
+            head = read_head(path)
+            m.read(len(head))
+            magic = head[:4]
+            if magic == b'RGCN':
+                item = probe_rgcn(path, head)
+                if item: rgcn_list.append(item)
+            elif magic == b'RLCN':
+                item = probe_rlcn(path, head)
+                if item: rlcn_list.append(item)
+            elif magic == b'RCSN':
+                item = probe_rcsn(path)
+                if item: rcsn_list.append(item)
+
+    # Pack position = rank in (entry index, offset) order, so distance counts entries in between
+    with m.stage('match'):
+        everything = rgcn_list + rlcn_list + rcsn_list
+        everything.sort(key=lambda x: get_position(x['path']))
+        for rank, item in enumerate(everything):
+            item['pos'] = rank
+
+        if max_distance is not None and max_distance < 0:
+            max_distance = None
+        triplets = match_triplets(rgcn_list, rlcn_list, rcsn_list, max_distance)
+        if top > 0:
+            triplets = triplets[:top]
+
+    m.count('files', len(files))
+    m.count('triplets', len(triplets))
+
+    selected = {}
+
+    if triplets:
+        best = triplets[0]
+        selected['rgcn_path'] = best['rgcn_path']
+        selected['rlcn_path'] = best['rlcn_path']
+        selected['rcsn_path'] = best['rcsn_path']
+        selected['reason'] = f"Best compatibility score {best['score']} of {len(triplets)} triplets"
+    elif rgcn_list and rlcn_list:
+        # No compatible map: fall back to the closest same-depth graphics + palette pair
+        pairs = [(abs(g['pos'] - p['pos']), g, p) for g in rgcn_list for p in rlcn_list if g['bpp'] == p['bpp']]
+        if pairs:
+            _, g, p = min(pairs, key=lambda x: x[0])
+            selected['rgcn_path'] = g['path']
+            selected['rlcn_path'] = p['path']
+            selected['rcsn_path'] = None
+            selected['reason'] = "No compatible RCSN found, closest RGCN+RLCN pair (renderer uses a linear map)"
+
+    if not selected:
+        return None
+
+    selected['candidates'] = {'rgcn': len(rgcn_list), 'rlcn': len(rlcn_list), 'rcsn': len(rcsn_list)}
+    selected['triplets'] = triplets
+    return selected
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--in_dir", required=True)
     parser.add_argument("--out", required=True)
+    parser.add_argument("--max-distance", type=int, default=16,
+                        help="Max pack distance (in entries) between map and graphics/palette, -1 = unlimited")
+    parser.add_argument("--top", type=int, default=0, help="Keep only the N best triplets (0 = all)")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    m = instrument.start(args, 'pick_tilemap_triplet')
 
-    files = [f for f in os.listdir(args.in_dir) if f.endswith('.bin')]
-    
-    rgcn_list = []
-    rlcn_list = []
-    rcsn_list = []
-    
-    for f in files:
-        path = os.path.join(args.in_dir, f)
-        magic = get_magic(path)
-        if magic == b'RGCN':
-            rgcn_list.append(path)
-        elif magic == b'RLCN':
-            rlcn_list.append(path)
-        elif magic == b'RCSN':
-            rcsn_list.append(path)
-        
-    # Heuristic: Pick first available triplet
-    # Better: Pick ones that appear consecutively in unpacked filenames (if indexed)
-    # unpacked filenames format: entry_NNN_MAGIC_OFFSET_SIZE.bin
-    
-    # Sort by index
-    def get_index(path):
-        fname = os.path.basename(path)
-        parts = fname.split('_')
-        if len(parts) > 1 and parts[1].isdigit():
-            return int(parts[1])
-        return 9999
-
-    rgcn_list.sort(key=get_index)
-    rlcn_list.sort(key=get_index)
-    rcsn_list.sort(key=get_index)
-    
-    selected = {}
-    
-    if rgcn_list and rlcn_list:
-        selected['rgcn_path'] = rgcn_list[0]
-        selected['rlcn_path'] = rlcn_list[0]
-        # RCSN is optional but preferred
-        if rcsn_list:
-            selected['rcsn_path'] = rcsn_list[0]
-        else:
-             selected['rcsn_path'] = None # Handle missing RCSN later if needed, but task requirement says triplet
-             # Wait, task says "找到至少一组：1个RGCN + 1个RLCN + 1个RCSN"
-             # If no RCSN, we fail requirement?
-             # Let's hope there is one.
-             pass
-        
-        selected['reason'] = "First available sorted by index"
-        
-        if not rcsn_list:
-             selected['reason'] += " (No RCSN found, using placeholder if supported)"
-             # But script must find one.
-             # If B4 found RCSN: 1, then we are good.
-
+    selected = select_triplets(args.in_dir, args.max_distance, args.top, m)
     if not selected:
         print("Could not find RGCN+RLCN pair.")
         sys.exit(1)
-        
-    with open(args.out, 'w') as f:
-        json.dump(selected, f, indent=2)
-        
-    print(f"Selected: {selected}")
+
+    with m.stage('write'):
+        with open(args.out, 'w') as f:
+            json.dump(selected, f, indent=2)
+
+    c = selected['candidates']
+    print(f"Candidates: RGCN={c['rgcn']} RLCN={c['rlcn']} RCSN={c['rcsn']}")
+    print(f"Triplets: {len(selected['triplets'])}")
+    print(f"Selected: {selected['rgcn_path']}, {selected['rlcn_path']}, {selected['rcsn_path']} ({selected['reason']})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,126 @@
+import struct
+import zlib
+
+# Minimal PNG reader / writer for the asset tools.
+# Images are handled as (width, height, rgba) with rgba a flat bytearray, 4 bytes per pixel.
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def _chunk(tag, payload):
+    crc = zlib.crc32(tag + payload) & 0xffffffff
+    return struct.pack(">I", len(payload)) + tag + payload + struct.pack(">I", crc)
+
+def encode_png(width, height, rgba, level=6):
+    # 8-bit RGBA (color type 6), filter 0 on every scanline
+    stride = width * 4
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)
+        raw += rgba[y * stride:(y + 1) * stride]
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (PNG_SIGNATURE + _chunk(b'IHDR', ihdr) +
+            _chunk(b'IDAT', zlib.compress(bytes(raw), level)) + _chunk(b'IEND', b''))
+
+def write_png(width, height, rgba, out_path, level=6):
+    with open(out_path, 'wb') as f:
+        f.write(encode_png(width, height, rgba, level))
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+def _unfilter(raw, height, stride, bpp):
+    out = bytearray(height * stride)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        ftype = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if ftype == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xFF
+        elif ftype == 2:
+            for i in range(stride):
+                line[i] = (line[i] + prev[i]) & 0xFF
+        elif ftype == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                up_left = prev[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + _paeth(left, prev[i], up_left)) & 0xFF
+        elif ftype != 0:
+            raise ValueError(f"Unsupported PNG filter {ftype}")
+        out[y * stride:(y + 1) * stride] = line
+        prev = line
+    return out
+
+def decode_png(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    pos = 8
+    idat = bytearray()
+    plte = b''
+    trns = b''
+    width = height = depth = ctype = interlace = None
+    while pos + 8 <= len(data):
+        length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+        payload = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if tag == b'IHDR':
+            width, height, depth, ctype, _, _, interlace = struct.unpack(">IIBBBBB", payload)
+        elif tag == b'PLTE':
+            plte = payload
+        elif tag == b'tRNS':
+            trns = payload
+        elif tag == b'IDAT':
+            idat += payload
+        elif tag == b'IEND':
+            break
+    if width is None:
+        raise ValueError("PNG missing IHDR")
+    if depth != 8 or interlace:
+        raise ValueError(f"Only 8-bit non-interlaced PNGs are supported (depth={depth}, interlace={interlace})")
+
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[ctype]
+    px = _unfilter(zlib.decompress(bytes(idat)), height, width * channels, channels)
+
+    if ctype == 6:
+        return width, height, px
+    rgba = bytearray(width * height * 4)
+    if ctype == 2:
+        rgba[0::4] = px[0::3]
+        rgba[1::4] = px[1::3]
+        rgba[2::4] = px[2::3]
+        rgba[3::4] = b'\xff' * (width * height)
+    elif ctype == 0:
+        rgba[0::4] = px
+        rgba[1::4] = px
+        rgba[2::4] = px
+        rgba[3::4] = b'\xff' * (width * height)
+    elif ctype == 4:
+        rgba[0::4] = px[0::2]
+        rgba[1::4] = px[0::2]
+        rgba[2::4] = px[0::2]
+        rgba[3::4] = px[1::2]
+    else:
+        # Palette: build one RGBA entry per index and expand with a single join
+        alpha = trns + b'\xff' * (256 - len(trns))
+        table = [plte[i * 3:i * 3 + 3] + alpha[i:i + 1] for i in range(len(plte) // 3)]
+        table += [b'\x00\x00\x00\xff'] * (256 - len(table))
+        rgba = bytearray(b''.join(map(table.__getitem__, px)))
+    return width, height, rgba
+
+def read_png(path):
+    with open(path, 'rb') as f:
+        return decode_png(f.read())
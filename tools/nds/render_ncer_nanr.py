@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import struct
+import sys
+
+try:
+    from .. import instrument
+    from .nitro import read_header, iter_blocks, char_info, pltt_info
+    from .pngio import write_png
+    from .build_atlas import pack_rects, next_pow2, blit
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from nitro import read_header, iter_blocks, char_info, pltt_info
+    from pngio import write_png
+    from build_atlas import pack_rects, next_pow2, blit
+
+# NCER (cells) + NANR (animations) -> spritesheet + frame timing table.
+#
+# CEBK (+0x08): u16 cell count, u16 bank attr (1 = 16-byte cell entries with bounds),
+#               u32 cell data offset (from +0x08), u32 mapping mode: 0-3 = 1D (tile boundary
+#               32 << mode bytes), 4 = 2D (character VRAM is a grid 32 tiles of 32 bytes wide, an
+#               OBJ's tile rows are 32 tile numbers apart)
+#   cell entry: u16 OAM count, u16 attr, u32 OAM offset (from end of the cell table) [, s16 x2 y2 x1 y1]
+#   OAM (6 bytes): attr0 (Y s8, color mode bit 13, shape bits 14-15)
+#                  attr1 (X s9, flip X bit 12, flip Y bit 13, size bits 14-15)
+#                  attr2 (tile bits 0-9, palette bits 12-15)
+# ABNK (+0x08): u16 anim count, u16 frame count, u32 anim offset, u32 frame offset, u32 position offset
+#   anim (16 bytes): u32 frames, u16 loop start, u16 position type, u32 play mode, u32 first frame offset
+#   frame (8 bytes): u32 position offset, u16 duration (1/60 s), u16 pad
+#   position: type 0 = u16 cell; type 1 = u16 cell, u16 rot, s32 sx, s32 sy, s16 x, s16 y; type 2 = u16 cell, u16 pad, s16 x, s16 y
+
+OBJ_SIZES = {
+    0: [(8, 8), (16, 16), (32, 32), (64, 64)],
+    1: [(16, 8), (32, 8), (32, 16), (64, 32)],
+    2: [(8, 16), (8, 32), (16, 32), (32, 64)],
+}
+POSITION_SIZES = {0: 4, 1: 16, 2: 8}
+PLAY_MODES = {1: 'forward', 2: 'loop', 3: 'pingpong', 4: 'pingpong_loop'}
+MAPPING_2D = 4
+
+_nibble_lut = [bytes((b & 0xF, b >> 4)) for b in range(256)]
+
+def decode_tiles(data):
+    # RGCN -> (bpp, pixel index bytes, one byte per pixel, 64 per tile)
+    info = char_info(data)
+    if info is None:
+        raise ValueError("RGCN CHAR block not found")
+    raw = data[info['data_offset']:info['data_offset'] + info['data_size']]
+    if info['bpp'] == 4:
+        return 4, b''.join(map(_nibble_lut.__getitem__, raw))
+    return 8, bytes(raw)
+
+def decode_palette(data):
+    # RLCN -> list of RGBA bytes (BGR555 expanded to 8 bits)
+    info = pltt_info(data)
+    if info is None:
+        raise ValueError("RLCN PLTT block not found")
+    start = info['data_offset']
+    colors = []
+    for (val,) in struct.iter_unpack('<H', data[start:start + info['color_count'] * 2]):
+        r = val & 0x1F
+        g = (val >> 5) & 0x1F
+        b = (val >> 10) & 0x1F
+        colors.append(bytes(((r << 3) | (r >> 2), (g << 3) | (g >> 2), (b << 3) | (b >> 2), 255)))
+    colors += [b'\xff\x00\xff\xff'] * (256 - len(colors))
+    return colors
+
+def block(data, name):
+    for magic, off, size in iter_blocks(data):
+        if magic == name:
+            return off, min(size, len(data) - off)
+    raise ValueError(f"{name} block not found")
+
+def read_labels(data, count):
+    try:
+        off, size = block(data, 'LABL')
+    except ValueError:
+        return []
+    if count <= 0 or 8 + count * 4 > size:
+        return []
+    offsets = struct.unpack_from(f'<{count}I', data, off + 8)
+    base = off + 8 + count * 4
+    names = []
+    for o in offsets:
+        end = data.find(b'\0', base + o, off + size)
+        names.append(data[base + o:end if end >= 0 else off + size].decode('ascii', errors='replace'))
+    return names
+
+def parse_ncer(data):
+    header = read_header(data)
+    if header is None or header['magic'] not in ('NCER', 'RECN'):
+        raise ValueError("Not an NCER file")
+    off, _ = block(data, 'CEBK')
+    count, attr, rel, mapping = struct.unpack_from('<HHII', data, off + 8)
+    entry_size = 16 if attr == 1 else 8
+    table = off + 8 + rel
+    oam_base = table + count * entry_size
+    cells = []
+    for i in range(count):
+        n_oam, _, oam_off = struct.unpack_from('<HHI', data, table + i * entry_size)
+        objs = []
+        for attr0, attr1, attr2 in struct.iter_unpack('<HHH', data[oam_base + oam_off:oam_base + oam_off + n_oam * 6]):
+            y = attr0 & 0xFF
+            x = attr1 & 0x1FF
+            w, h = OBJ_SIZES.get(attr0 >> 14, OBJ_SIZES[0])[attr1 >> 14]
+            objs.append({
+                'x': x - 0x200 if x & 0x100 else x,
+                'y': y - 0x100 if y & 0x80 else y,
+                'w': w,
+                'h': h,
+                'bpp': 8 if attr0 & 0x2000 else 4,
+                'fh': (attr1 >> 12) & 1,
+                'fv': (attr1 >> 13) & 1,
+                'tile': attr2 & 0x3FF,
+                'pal': attr2 >> 12,
+            })
+        cells.append(objs)
+    if mapping > MAPPING_2D:
+        raise ValueError(f"Unknown CEBK mapping mode {mapping}")
+    return {'cells': cells, 'mapping': mapping, 'labels': read_labels(data, count)}
+
+def parse_nanr(data):
+    header = read_header(data)
+    if header is None or header['magic'] not in ('NANR', 'RNAN'):
+        raise ValueError("Not an NANR file")
+    off, _ = block(data, 'ABNK')
+    count, _total, anim_rel, frame_rel, pos_rel = struct.unpack_from('<HHIII', data, off + 8)
+    anim_base = off + 8 + anim_rel
+    frame_base = off + 8 + frame_rel
+    pos_base = off + 8 + pos_rel
+    labels = read_labels(data, count)
+    anims = []
+    for i in range(count):
+        n_frames, loop_start, pos_type, mode, first = struct.unpack_from('<IHHII', data, anim_base + i * 16)
+        frames = []
+        for f in range(n_frames):
+            pos_off, duration, _ = struct.unpack_from('<IHH', data, frame_base + first + f * 8)
+            p = pos_base + pos_off
+            cell = struct.unpack_from('<H', data, p)[0]
+            dx = dy = 0
+            if pos_type == 1:
+                dx, dy = struct.unpack_from('<hh', data, p + 12)
+            elif pos_type == 2:
+                dx, dy = struct.unpack_from('<hh', data, p + 4)
+            frames.append([cell, duration, dx, dy])
+        anims.append({
+            'name': labels[i] if i < len(labels) else f"anim_{i}",
+            'mode': PLAY_MODES.get(mode, str(mode)),
+            'loop_start': loop_start,
+            'frames': frames,
+        })
+    return anims
+
+def cell_bounds(objs):
+    if not objs:
+        return 0, 0, 1, 1
+    x0 = min(o['x'] for o in objs)
+    y0 = min(o['y'] for o in objs)
+    x1 = max(o['x'] + o['w'] for o in objs)
+    y1 = max(o['y'] + o['h'] for o in objs)
+    return x0, y0, x1 - x0, y1 - y0
+
+def render_cell(objs, tile_pixels, tile_bpp, palette, mapping):
+    # Returns (origin_x, origin_y, w, h, rgba). Earlier OAMs are drawn on top.
+    x0, y0, w, h = cell_bounds(objs)
+    idx = bytearray(w * h)  # palette index per pixel, 0 = transparent
+    bank_of = bytearray(w * h)
+    tile_count = len(tile_pixels) // 64
+    if mapping == MAPPING_2D:
+        # Tile numbers count 32-byte units and each tile row of the OBJ starts 32 units (1 KiB) on
+        boundary, stride = 32, 1024 // (tile_bpp * 8)
+    else:
+        # Tile numbers are in units of the mapping boundary (32 << mode bytes), tiles are consecutive
+        boundary, stride = 32 << mapping, None
+    for o in reversed(objs):
+        tiles_w = o['w'] // 8
+        base = o['tile'] * boundary // (tile_bpp * 8)
+        obj = bytearray(o['w'] * o['h'])
+        for t in range(tiles_w * (o['h'] // 8)):
+            src = base + t if stride is None else base + (t // tiles_w) * stride + t % tiles_w
+            if src >= tile_count:
+                continue
+            tx, ty = (t % tiles_w) * 8, (t // tiles_w) * 8
+            tile = tile_pixels[src * 64:(src + 1) * 64]
+            for row in range(8):
+                d = (ty + row) * o['w'] + tx
+                obj[d:d + 8] = tile[row * 8:(row + 1) * 8]
+        rows = [obj[r * o['w']:(r + 1) * o['w']] for r in range(o['h'])]
+        if o['fv']:
+            rows.reverse()
+        if o['fh']:
+            rows = [r[::-1] for r in rows]
+        bank = o['pal'] if o['bpp'] == 4 else 0
+        for r, line in enumerate(rows):
+            d = (o['y'] - y0 + r) * w + (o['x'] - x0)
+            for c, v in enumerate(line):
+                if v:
+                    idx[d + c] = v
+                    bank_of[d + c] = bank
+    rgba = bytearray(w * h * 4)
+    for i, v in enumerate(idx):
+        if v:
+            rgba[i * 4:i * 4 + 4] = palette[(bank_of[i] * 16 + v) & 0xFF]
+    return x0, y0, w, h, rgba
+
+def render_spritesheet(ncer, anims, tile_bpp, tile_pixels, palette, max_size=1024, m=None):
+    # -> (pages [(w, h, rgba)], cells {cell: [page, x, y, w, h, origin x, origin y]})
+    # Each cell referenced by an animation (every cell without animations) is rendered once.
+    m = m or instrument.Metrics('render_ncer_nanr')
+    cells = ncer['cells']
+    with m.stage('composite'):
+        used = sorted({fr[0] for a in anims for fr in a['frames'] if fr[0] < len(cells)}) if anims else range(len(cells))
+        rendered = {}
+        for c in used:
+            rendered[c] = render_cell(cells[c], tile_pixels, tile_bpp, palette, ncer['mapping'])
+
+        placements, sizes = pack_rects([(c, r[2], r[3]) for c, r in rendered.items()], next_pow2(max_size), 1)
+        pages = [bytearray(w * h * 4) for w, h in sizes]
+        for c, (ox, oy, w, h, rgba) in rendered.items():
+            page, x, y = placements[c]
+            blit(pages[page], sizes[page][0], rgba, w, h, x, y)
+
+    placed = {}
+    for c, (ox, oy, w, h, _) in sorted(rendered.items()):
+        page, x, y = placements[c]
+        # [page, x, y, w, h, origin x, origin y]: draw at (pos + origin)
+        placed[str(c)] = [page, x, y, w, h, ox, oy]
+    m.count('cells', len(rendered))
+    return [(w, h, pages[i]) for i, (w, h) in enumerate(sizes)], placed
+
+def main():
+    parser = argparse.ArgumentParser(description='Render NCER cells / NANR animations to spritesheets.')
+    parser.add_argument('--ncer', required=True)
+    parser.add_argument('--nanr', required=False)
+    parser.add_argument('--rgcn', required=True, help='Sprite tiles (NCGR/RGCN)')
+    parser.add_argument('--rlcn', required=True, help='Sprite palette (NCLR/RLCN)')
+    parser.add_argument('--out_dir', required=True)
+    parser.add_argument('--name', default='sprite', help='Output file prefix')
+    parser.add_argument('--max-size', type=int, default=1024)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'render_ncer_nanr')
+
+    def load(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        m.read(len(data))
+        return data
+
+    try:
+        with m.stage('decode'):
+            ncer = parse_ncer(load(args.ncer))
+            tile_bpp, tile_pixels = decode_tiles(load(args.rgcn))
+            palette = decode_palette(load(args.rlcn))
+            anims = []
+            if args.nanr:
+                anims = parse_nanr(load(args.nanr))
+    except (ValueError, struct.error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    pages, placed = render_spritesheet(ncer, anims, tile_bpp, tile_pixels, palette, args.max_size, m)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    sheet = {'pages': [], 'cells': placed, 'animations': anims}
+    with m.stage('encode'):
+        for i, (w, h, rgba) in enumerate(pages):
+            fname = f"{args.name}_{i}.png"
+            write_png(w, h, rgba, os.path.join(args.out_dir, fname), level=9)
+            m.wrote(os.path.getsize(os.path.join(args.out_dir, fname)))
+            sheet['pages'].append([fname, w, h])
+
+    with m.stage('write'):
+        with open(os.path.join(args.out_dir, f"{args.name}.json"), 'w') as f:
+            json.dump(sheet, f, separators=(',', ':'))
+
+    total_frames = sum(len(a['frames']) for a in anims)
+    m.count('frames', total_frames)
+    print(f"Cells: {len(ncer['cells'])} ({len(placed)} rendered), Animations: {len(anims)}, Frames: {total_frames}")
+    print(f"Spritesheet: {len(pages)} page(s) -> {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
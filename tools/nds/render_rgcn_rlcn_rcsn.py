@@ -7,17 +7,29 @@ import math
 import logging
 from datetime import datetime
 
-# Setup logging
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = f"logs/b5_render_{timestamp}.log"
-logging.basicConfig(filename=log_file, level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-console = logging.StreamHandler()
-console.setLevel(logging.WARNING) # Only warnings to console to keep output clean
-logging.getLogger('').addHandler(console)
+try:
+    from .. import instrument
+    from .map_pyramid import build_pyramid, rows_to_rgba
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from map_pyramid import build_pyramid, rows_to_rgba
 
-def write_png(width, height, pixels, out_path):
-    # Minimal PNG writer (RGB888)
+log = logging.getLogger(__name__)
+
+def setup_logging():
+    # Only when run as a script, so other tools can import the parsers
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs("logs", exist_ok=True)
+    log_file = f"logs/b5_render_{timestamp}.log"
+    logging.basicConfig(filename=log_file, level=logging.INFO, 
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    console = logging.StreamHandler()
+    console.setLevel(logging.WARNING) # Only warnings to console to keep output clean
+    logging.getLogger('').addHandler(console)
+
+def encode_rgb_png(width, height, pixels):
+    # Minimal PNG encoder (RGB888)
     # Using zlib if available, else uncompressed (not recommended but simple)
     # But python usually has zlib.
     import zlib
@@ -50,11 +62,11 @@ def write_png(width, height, pixels, out_path):
     iend_crc = zlib.crc32(b'IEND' + iend_data) & 0xffffffff
     iend = struct.pack(">I", len(iend_data)) + b'IEND' + iend_data + struct.pack(">I", iend_crc)
     
+    return png_signature + ihdr + idat + iend
+
+def write_png(width, height, pixels, out_path):
     with open(out_path, 'wb') as f:
-        f.write(png_signature)
-        f.write(ihdr)
-        f.write(idat)
-        f.write(iend)
+        f.write(encode_rgb_png(width, height, pixels))
 
 def bgr555_to_rgb888(val):
     b = (val >> 10) & 0x1F
@@ -69,7 +81,7 @@ def bgr555_to_rgb888(val):
 
 def parse_rlcn(data):
     # Try to find PLTT chunk
-    logging.info(f"Parsing RLCN, size {len(data)}")
+    log.info(f"Parsing RLCN, size {len(data)}")
     palette = [(0,0,0)] * 256 # Default black
     
     # Scan for 'TTLP' (PLTT backwards in LE?) or 'PLTT'
@@ -79,7 +91,7 @@ def parse_rlcn(data):
     while offset < len(data) - 4:
         chunk_magic = data[offset:offset+4]
         if chunk_magic == b'TTLP' or chunk_magic == b'PLTT':
-            logging.info(f"Found PLTT at {offset}")
+            log.info(f"Found PLTT at {offset}")
             # Chunk size at +4
             chunk_size = struct.unpack('<I', data[offset+4:offset+8])[0]
             # Data starts at +8? Or header size?
@@ -99,7 +111,7 @@ def parse_rlcn(data):
         offset += 4
         
     # Fallback: Read last 512 bytes
-    logging.warning("PLTT not found, using fallback")
+    log.warning("PLTT not found, using fallback")
     p_start = max(0, len(data) - 512)
     for i in range((len(data) - p_start) // 2):
         val = struct.unpack('<H', data[p_start + i*2 : p_start + i*2 + 2])[0]
@@ -108,7 +120,7 @@ def parse_rlcn(data):
     return palette
 
 def parse_rgcn(data):
-    logging.info(f"Parsing RGCN, size {len(data)}")
+    log.info(f"Parsing RGCN, size {len(data)}")
     tiles = [] # List of 8x8 tiles (each is 64 bytes for 8bpp, or 32 bytes for 4bpp)
     
     # Scan for 'RAHC' (CHAR)
@@ -117,7 +129,7 @@ def parse_rgcn(data):
     
     while offset < len(data) - 4:
         if data[offset:offset+4] == b'RAHC' or data[offset:offset+4] == b'CHAR':
-            logging.info(f"Found CHAR at {offset}")
+            log.info(f"Found CHAR at {offset}")
             # Chunk size at +4
             # Header usually 0x18 bytes or so?
             # Tile data follows
@@ -151,11 +163,11 @@ def parse_rgcn(data):
         tiles.append(t_pixels)
         curr += bytes_per_tile
         
-    logging.info(f"Parsed {len(tiles)} tiles (4bpp assumption)")
+    log.info(f"Parsed {len(tiles)} tiles (4bpp assumption)")
     return tiles
 
 def parse_rcsn(data):
-    logging.info(f"Parsing RCSN, size {len(data)}")
+    log.info(f"Parsing RCSN, size {len(data)}")
     width = 32
     height = 24
     map_data = []
@@ -166,12 +178,14 @@ def parse_rcsn(data):
     
     while offset < len(data) - 4:
         if data[offset:offset+4] == b'NRCS' or data[offset:offset+4] == b'SCRN':
-            logging.info(f"Found SCRN at {offset}")
+            log.info(f"Found SCRN at {offset}")
             # Header might contain width/height?
             # Usually width/height is fixed for BG unless specified in display control
             # But SCRN chunk has size.
             # Let's assume data follows header.
-            map_offset = offset + 16 # Skip
+            # SCRN header: Magic(4), Size(4), Width px (2), Height px (2),
+            # Color mode (2), BG type (2), Data size (4), then map data at +0x14
+            map_offset = offset + 0x14
             
             # Read u16 entries
             # Each entry: Tile Index (10 bits), Flip X (1), Flip Y (1), Palette (4)
@@ -179,11 +193,18 @@ def parse_rcsn(data):
             remaining = len(data) - map_offset
             count = remaining // 2
             
+            hdr_w, hdr_h = struct.unpack('<HH', data[offset+8:offset+12]) if offset + 12 <= len(data) else (0, 0)
+            
             # Try to deduce width
+            # Prefer the header size; otherwise:
             # If count == 32*24 (768), then 32x24
             # If count == 32*32 (1024), then 32x32
             
-            if count == 1024:
+            if hdr_w and hdr_h and (hdr_w // 8) * (hdr_h // 8) <= count:
+                width = hdr_w // 8
+                height = hdr_h // 8
+                count = width * height
+            elif count == 1024:
                 height = 32
             elif count == 2048:
                 width = 64 # or 32x64
@@ -205,53 +226,52 @@ def parse_rcsn(data):
         offset += 4
         
     if not scrn_found:
-        logging.warning("SCRN chunk not found, generating dummy map")
+        log.warning("SCRN chunk not found, generating dummy map")
         # Dummy linear map
         for i in range(width * height):
             map_data.append({'tile': i, 'pal': 0, 'fh': 0, 'fv': 0})
             
     return width, height, map_data
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--rgcn", required=True)
-    parser.add_argument("--rlcn", required=True)
-    parser.add_argument("--rcsn", required=False) # Optional
-    parser.add_argument("--out", required=True)
-    args = parser.parse_args()
-    
-    try:
-        with open(args.rgcn, 'rb') as f: rgcn_data = f.read()
-        with open(args.rlcn, 'rb') as f: rlcn_data = f.read()
-        rcsn_data = None
-        if args.rcsn and os.path.exists(args.rcsn):
-            with open(args.rcsn, 'rb') as f: rcsn_data = f.read()
-            
+def render_tilemap(rgcn_data, rlcn_data, rcsn_data=None, m=None):
+    # -> (width, height, rows of (r, g, b)); without RCSN the tiles are laid out linearly on 32x24
+    m = m or instrument.Metrics('render_rgcn_rlcn_rcsn')
+    with m.stage('decode'):
         palette = parse_rlcn(rlcn_data)
         tiles = parse_rgcn(rgcn_data)
         
         if rcsn_data:
             map_w, map_h, tile_map = parse_rcsn(rcsn_data)
         else:
-            # Default map if no RCSN
-            map_w, map_h = 32, 24
-            tile_map = [{'tile': i % len(tiles), 'pal': 0, 'fh': 0, 'fv': 0} for i in range(map_w*map_h)]
-            
-        # Render
-        # Output image dimensions
-        out_w = map_w * 8
-        out_h = map_h * 8
-        pixels = [[(0,0,0) for _ in range(out_w)] for _ in range(out_h)]
+            map_w, map_h, tile_map = linear_map(len(tiles))
+    return compose_tilemap(tiles, palette, map_w, map_h, tile_map, m)
+
+def linear_map(tile_count, map_w=32, map_h=24):
+    # Default map if no RCSN
+    return map_w, map_h, [{'tile': i % tile_count, 'pal': 0, 'fh': 0, 'fv': 0} for i in range(map_w*map_h)]
+
+def compose_tilemap(tiles, palette, map_w, map_h, tile_map, m=None):
+    # tiles / palette / map as returned by parse_rgcn / parse_rlcn / parse_rcsn
+    m = m or instrument.Metrics('render_rgcn_rlcn_rcsn')
+    m.count('tiles', len(tiles))
+    m.count('map_entries', len(tile_map))
         
+    # Render
+    # Output image dimensions
+    out_w = map_w * 8
+    out_h = map_h * 8
+    with m.stage('composite'):
+        pixels = [[(0,0,0) for _ in range(out_w)] for _ in range(out_h)]
+    
         for i, entry in enumerate(tile_map):
             if i >= len(tile_map): break
-            
+        
             tx = (i % map_w) * 8
             ty = (i // map_w) * 8
-            
+        
             t_idx = entry['tile']
             # pal_bank = entry['pal'] # Not implementing palette banking for 4bpp yet, assume 0
-            
+        
             if t_idx < len(tiles):
                 tile_pixels = tiles[t_idx] # 64 indices
                 for py in range(8):
@@ -260,23 +280,62 @@ def main():
                         # 0 is transparent usually, but we render black or bg color
                         # Palette lookup
                         color = palette[c_idx] if c_idx < len(palette) else (255, 0, 255)
-                        
+                    
                         # Handle flips (simple)
                         dest_x = tx + (7 - px if entry['fh'] else px)
                         dest_y = ty + (7 - py if entry['fv'] else py)
-                        
+                    
                         if dest_y < out_h and dest_x < out_w:
                             pixels[dest_y][dest_x] = color
             else:
                 # Missing tile, red placeholder
                 pass
+    return out_w, out_h, pixels
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rgcn", required=True)
+    parser.add_argument("--rlcn", required=True)
+    parser.add_argument("--rcsn", required=False) # Optional
+    parser.add_argument("--out")
+    parser.add_argument("--chunks", help="Also write a chunked multi-resolution pyramid here (see map_pyramid.py)")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    if not args.out and not args.chunks:
+        parser.error("one of --out / --chunks is required")
+    m = instrument.start(args, 'render_rgcn_rlcn_rcsn')
+    setup_logging()
+    
+    try:
+        with m.stage('read'):
+            with open(args.rgcn, 'rb') as f: rgcn_data = f.read()
+            with open(args.rlcn, 'rb') as f: rlcn_data = f.read()
+            rcsn_data = None
+            if args.rcsn and os.path.exists(args.rcsn):
+                with open(args.rcsn, 'rb') as f: rcsn_data = f.read()
+            m.read(len(rgcn_data) + len(rlcn_data) + len(rcsn_data or b''))
+            
+        out_w, out_h, pixels = render_tilemap(rgcn_data, rlcn_data, rcsn_data, m)
                 
-        write_png(out_w, out_h, pixels, args.out)
-        logging.info(f"Rendered to {args.out}")
-        print(f"Rendered: {args.out} ({out_w}x{out_h})")
+        if args.out:
+            with m.stage('encode'):
+                write_png(out_w, out_h, pixels, args.out)
+            m.wrote(os.path.getsize(args.out))
+            logging.info(f"Rendered to {args.out}")
+            print(f"Rendered: {args.out} ({out_w}x{out_h})")
+        if args.chunks:
+            manifest = build_pyramid(out_w, out_h, rows_to_rgba(out_w, out_h, pixels), args.chunks,
+                                     args.chunk_size, m=m)
+            s = manifest['stats']
+            print(f"Chunks: {args.chunks} ({len(manifest['levels'])} levels, {s['encoded']} encoded, "
+                  f"{s['reused']} unchanged, {s['fill']} solid)")
         
     except Exception as e:
         logging.error(f"Render failed: {e}", exc_info=True)
+        if not args.out:
+            print(f"Render failed: {e}")
+            sys.exit(1)
         # Create a dummy failure image
         write_png(32, 32, [[(255,0,0)]*32]*32, args.out)
         print(f"Render failed but created fallback: {args.out}")
@@ -0,0 +1,40 @@
+# Pack / pak tools as a library.
+#
+#   from tools import pack
+#   probe = pack.probe_pak(data)
+#   count, magics = pack.unpack_pak(data, probe, 'out/')
+#
+# Submodules are imported on first attribute access, the same way as tools.nds.
+
+import importlib
+
+_EXPORTS = {
+    'guess_table': 'unpack_pack',
+    'find_signatures': 'unpack_pack',
+    'probe_pak': 'mm2r_pak_probe',
+    'probe_filenames': 'mm2r_pak_probe',
+    'unpack_pak': 'mm2r_pak_unpack_v2',
+    'slice_by_magic': 'extract_by_magic',
+    'correct_probe': 'generate_correct_probe',
+    'ContentPack': 'content_pack',
+    'write_content_pack': 'content_pack',
+    'PatchSource': 'patch_pack',
+    'build_patch': 'patch_pack',
+    'read_patch': 'patch_pack',
+    'apply_patch': 'patch_pack',
+    'make_delta': 'patch_pack',
+    'apply_delta': 'patch_pack',
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
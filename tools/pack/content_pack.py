@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+# Content pack file with per-entry compression and random access.
+#
+# Layout: header '<4sHHIQQ' (magic 'CPAK', version, 0, entry count, index offset, index size),
+# the compressed blocks, then the index (JSON):
+#   {"version", "codec", "level", "blockSize",
+#    "entries": [{"name", "size", "sha256", "codec", "blocks": [[offset, stored length], ...]}]}
+# Every entry is compressed on its own ("none", "zlib", or raw LZMA2 "lzma"), in blocks of
+# blockSize uncompressed bytes (the last one shorter) that are compressed independently, so
+# reading a range only decompresses the blocks it overlaps. "sha256" is the hash of the
+# uncompressed entry (packs written before it was added have none; sha256() computes it).
+#
+# An entry is stored uncompressed when it starts with the magic of an already compressed
+# format, when it looks like high-entropy data (a sample from its middle shrinks by less than
+# MIN_SAVING under zlib level 1), or when compressing it saves less than MIN_SAVING.
+
+MAGIC = b'CPAK'
+HEADER = struct.Struct('<4sHHIQQ')
+BLOCK_SIZE = 64 * 1024
+SAMPLE = 16 * 1024
+MIN_SAVING = 0.05
+COMPRESSED_MAGICS = (b'\x89PNG', b'PK\x03\x04', b'\x1f\x8b', b'\xfd7zXZ', b'BZh', b'OggS', b'\xff\xd8\xff', b'CPAK', b'MPAT')
+
+def lzma_filters(level):
+    return [{'id': lzma.FILTER_LZMA2, 'preset': level}]
+
+def compress(codec, data, level):
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'lzma':
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=lzma_filters(level))
+    return bytes(data)
+
+def decompress(codec, data, level):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        # Raw streams carry no header: decode with the filters (dictionary size) they were written with
+        return lzma.decompress(data, format=lzma.FORMAT_RAW, filters=lzma_filters(level))
+    return bytes(data)
+
+def sample_ratio(data, sample=SAMPLE):
+    # Compressed / raw size of a sample from the middle of data (fast level, as an entropy estimate)
+    start = max(0, len(data) // 2 - sample // 2)
+    chunk = data[start:start + sample]
+    return len(zlib.compress(chunk, 1)) / len(chunk) if chunk else 0.0
+
+def should_compress(data):
+    # -> (compress?, reason when not)
+    if bytes(data[:4]).startswith(COMPRESSED_MAGICS):
+        return False, 'compressed format'
+    if sample_ratio(data) > 1 - MIN_SAVING:
+        return False, 'high entropy'
+    return True, None
+
+def write_content_pack(files, out_path, codec='zlib', level=6, block_size=BLOCK_SIZE, m=None):
+    # files: [(name, path)] -> summary {'entries', 'raw', 'stored', 'skipped': {reason: count}}
+    m = m or instrument.Metrics('content_pack')
+    entries = []
+    summary = {'entries': 0, 'raw': 0, 'stored': 0, 'skipped': {}}
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, 1, 0, 0, 0, 0))
+        pos = HEADER.size
+        for name, path in files:
+            with open(path, 'rb') as f:
+                data = f.read()
+            m.read(len(data))
+            entry_codec = codec
+            if codec != 'none':
+                ok, reason = should_compress(data)
+                if not ok:
+                    entry_codec = 'none'
+                    summary['skipped'][reason] = summary['skipped'].get(reason, 0) + 1
+            with m.stage('compress'):
+                blocks = [compress(entry_codec, data[i:i + block_size], level)
+                          for i in range(0, len(data), block_size)]
+            if entry_codec != 'none' and sum(map(len, blocks)) > len(data) * (1 - MIN_SAVING):
+                entry_codec = 'none'
+                blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)]
+                summary['skipped']['no gain'] = summary['skipped'].get('no gain', 0) + 1
+            table = []
+            with m.stage('write'):
+                for b in blocks:
+                    out.write(b)
+                    table.append([pos, len(b)])
+                    pos += len(b)
+            entries.append({'name': name, 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(),
+                            'codec': entry_codec, 'blocks': table})
+            summary['entries'] += 1
+            summary['raw'] += len(data)
+            summary['stored'] += sum(len(b) for b in blocks)
+        index = json.dumps({'version': 1, 'codec': codec, 'level': level, 'blockSize': block_size,
+                            'entries': entries}, separators=(',', ':')).encode('utf-8')
+        out.write(index)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, 1, 0, len(entries), pos, len(index)))
+        m.wrote(pos + len(index))
+    os.replace(tmp, out_path)
+    m.count('entries', summary['entries'])
+    return summary
+
+def directory_files(root):
+    # -> [(relative name, path)] for every file under root, sorted
+    out = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            full = os.path.join(dirpath, fn)
+            out.append((os.path.relpath(full, root).replace(os.sep, '/'), full))
+    return out
+
+class ContentPack:
+    # Memory-mapped reader: names(), size(name), sha256(name), read(name, offset=0, length=None).
+    # Safe to share between threads.
+    def __init__(self, path):
+        self._f = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._f.close()
+            raise ValueError(f"{path}: empty file")
+        magic, version, _, count, index_off, index_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != 1:
+            self.close()
+            raise ValueError(f"{path}: not a v1 content pack")
+        index = json.loads(self._mm[index_off:index_off + index_len].decode('utf-8'))
+        self.block_size = index['blockSize']
+        self.level = index['level']
+        self.entries = {e['name']: e for e in index['entries']}
+        self._last = (None, None)  # (name, block) -> decompressed bytes, for sequential reads
+
+    def names(self):
+        return list(self.entries)
+
+    def size(self, name):
+        return self.entries[name]['size']
+
+    def sha256(self, name):
+        entry = self.entries[name]
+        if 'sha256' not in entry:
+            entry['sha256'] = hashlib.sha256(self.read(name)).hexdigest()
+        return entry['sha256']
+
+    def fileno(self):
+        # For os.sendfile() of uncompressed entries (their bytes are at blocks[0][0])
+        return self._f.fileno()
+
+    def _block(self, entry, k):
+        key = (entry['name'], k)
+        last = self._last
+        if last[0] == key:
+            return last[1]
+        off, length = entry['blocks'][k]
+        data = decompress(entry['codec'], self._mm[off:off + length], self.level)
+        self._last = (key, data)
+        return data
+
+    def read(self, name, offset=0, length=None):
+        # Bytes [offset, offset + length) of an entry; only the overlapping blocks are decompressed
+        entry = self.entries[name]
+        end = entry['size'] if length is None else min(entry['size'], offset + length)
+        if offset >= end:
+            return b''
+        bs = self.block_size
+        parts = []
+        for k in range(offset // bs, (end - 1) // bs + 1):
+            block = self._block(entry, k)
+            parts.append(block[max(offset - k * bs, 0):end - k * bs])
+        return b''.join(parts)
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or read content packs with per-entry compression.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Pack every file under a directory')
+    build.add_argument('--in', dest='input_dir', required=True)
+    build.add_argument('--out', required=True, help='Pack file to write')
+    build.add_argument('--codec', choices=['zlib', 'lzma', 'none'], default='zlib')
+    build.add_argument('--level', type=int, default=6, help='zlib level (0-9) / lzma preset (0-9)')
+    build.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Uncompressed bytes per block')
+    ls = sub.add_parser('list', help='List the entries of a pack')
+    ls.add_argument('--pack', required=True)
+    get = sub.add_parser('extract', help='Write one entry (or a byte range of it)')
+    get.add_argument('--pack', required=True)
+    get.add_argument('--name', required=True)
+    get.add_argument('--offset', type=int, default=0)
+    get.add_argument('--length', type=int)
+    get.add_argument('--out', required=True)
+    for p in (build, ls, get):
+        instrument.add_arguments(p)
+    args = parser.parse_args()
+    m = instrument.start(args, 'content_pack')
+
+    if args.command == 'build':
+        if not os.path.isdir(args.input_dir):
+            print(f"Error: {args.input_dir} is not a directory.")
+            sys.exit(1)
+        s = write_content_pack(directory_files(args.input_dir), args.out, args.codec, args.level,
+                               args.block_size, m)
+        ratio = s['stored'] / s['raw'] if s['raw'] else 1.0
+        skipped = ', '.join(f"{v} {k}" for k, v in s['skipped'].items()) or 'none'
+        print(f"{args.out}: {s['entries']} entries, {s['raw']} -> {s['stored']} bytes ({ratio:.1%}); "
+              f"stored uncompressed: {skipped}")
+        return
+
+    try:
+        pack = ContentPack(args.pack)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    with pack:
+        if args.command == 'list':
+            for e in pack.entries.values():
+                stored = sum(b[1] for b in e['blocks'])
+                print(f"{e['codec']:<5} {e['size']:>10} {stored:>10}  {len(e['blocks']):>4} blocks  {e['name']}")
+            return
+        if args.name not in pack.entries:
+            print(f"Error: {args.name} not in {args.pack}")
+            sys.exit(1)
+        data = pack.read(args.name, args.offset, args.length)
+    with open(args.out, 'wb') as f:
+        m.wrote(f.write(data))
+    print(f"{args.name}: {len(data)} bytes -> {args.out}")
+
+if __name__ == "__main__":
+    main()
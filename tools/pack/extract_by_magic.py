@@ -2,43 +2,37 @@ import argparse
 import os
 import struct
 import json
+import sys
+import logging
 
-def main():
-    parser = argparse.ArgumentParser(description='Extract slices from pack based on magic offsets.')
-    parser.add_argument('--in', dest='input_file', required=True, help='Input pack file')
-    parser.add_argument('--out_dir', required=True, help='Output directory for slices')
-    args = parser.parse_args()
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
 
-    input_path = args.input_file
-    out_dir = args.out_dir
-    
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
-
-    # Magic list we care about
-    target_magics = ["NFTR", "NSCR", "RGCN", "RLCN", "RCSN"]
-    
-    # Read pack_scan.json to get offsets
-    # Assumption: pack_scan.json is in the same dir as the pack or a known location. 
-    # For this task, we can try to infer it or re-scan if needed.
-    # But based on instructions, we should rely on the previous step's output if possible?
-    # Actually, the instructions say "Step 1... 3) 对每个 offset". It implies we have a list of offsets.
-    # We will read contentpacks/poc/pack_scan.json as generated in Step 0.
-    
-    scan_file = 'contentpacks/poc/pack_scan.json'
-    if not os.path.exists(scan_file):
-        print(f"Error: {scan_file} not found. Please run Step 0 first.")
-        return
+log = logging.getLogger(__name__)
 
-    with open(scan_file, 'r') as f:
-        scan_data = json.load(f)
+# Magic list we care about
+TARGET_MAGICS = ["NFTR", "NSCR", "RGCN", "RLCN", "RCSN"]
 
-    with open(input_path, 'rb') as f:
-        file_content = f.read()
-        file_len = len(file_content)
+def load_scan(path):
+    # pack_scan.json from unpack_pack.py ({'stats', 'locations': {magic: [offset]}}) or a plain
+    # [{'magic', 'offset'}] list -> [{'magic', 'offset'}]
+    with open(path, 'r') as f:
+        scan = json.load(f)
+    if isinstance(scan, dict):
+        scan = [{'magic': magic, 'offset': off} for magic, offsets in scan.get('locations', {}).items() for off in offsets]
+    return scan
 
+def slice_by_magic(file_content, scan_data, out_dir, target_magics=TARGET_MAGICS, m=None):
+    # scan_data: [{'magic', 'offset'}]
+    # -> [{'magic', 'offset', 'size', 'path', 'method'}] for every slice written to out_dir
+    m = m or instrument.Metrics('extract_by_magic')
     slices_index = []
     
+    file_len = len(file_content)
+    
     # Group offsets by magic to help finding next magic
     # Actually scan_data is sorted by offset already (from Step 0 code)
     sorted_offsets = sorted(scan_data, key=lambda x: x['offset'])
@@ -53,7 +47,7 @@ def main():
         # Verify magic
         f_magic = file_content[offset:offset+4].decode('ascii', errors='ignore')
         if f_magic != magic:
-            print(f"Warning: Magic mismatch at {offset}, expected {magic}, got {f_magic}. Skipping.")
+            log.warning("Magic mismatch at %d, expected %s, got %s. Skipping.", offset, magic, f_magic)
             continue
             
         # Determine size
@@ -88,15 +82,16 @@ def main():
                      size = file_len - offset
                      method = "to_end"
                  else:
-                     print(f"Warning: Could not determine valid size for {magic} at {offset}. Skipping.")
+                     log.warning("Could not determine valid size for %s at %d. Skipping.", magic, offset)
                      continue
 
         # Final write
         out_filename = f"{magic}_{offset}_{size}.bin"
         out_path = os.path.join(out_dir, out_filename)
         
-        with open(out_path, 'wb') as out_f:
-            out_f.write(file_content[offset:offset+size])
+        with m.stage('write'):
+            with open(out_path, 'wb') as out_f:
+                m.wrote(out_f.write(file_content[offset:offset+size]))
             
         slices_index.append({
             "magic": magic,
@@ -105,7 +100,40 @@ def main():
             "path": out_path,
             "method": method
         })
-        print(f"Extracted {magic} at {offset}, size={size} ({method}) -> {out_filename}")
+
+    m.count('slices', len(slices_index))
+    return slices_index
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract slices from pack based on magic offsets.')
+    parser.add_argument('--in', dest='input_file', required=True, help='Input pack file')
+    parser.add_argument('--out_dir', required=True, help='Output directory for slices')
+    parser.add_argument('--scan', dest='scan_file', default='contentpacks/poc/pack_scan.json',
+                        help='Signature scan of the pack (pack_scan.json from unpack_pack.py)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'extract_by_magic')
+
+    input_path = args.input_file
+    out_dir = args.out_dir
+    
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    if not os.path.exists(args.scan_file):
+        print(f"Error: {args.scan_file} not found. Run unpack_pack.py on the pack first.")
+        return
+
+    scan_data = load_scan(args.scan_file)
+
+    with m.stage('read'):
+        with open(input_path, 'rb') as f:
+            file_content = f.read()
+    m.read(len(file_content))
+
+    slices_index = slice_by_magic(file_content, scan_data, out_dir, m=m)
+    for item in slices_index:
+        print(f"Extracted {item['magic']} at {item['offset']}, size={item['size']} ({item['method']}) -> {os.path.basename(item['path'])}")
 
     # Write index
     index_path = os.path.join(out_dir, 'index.json')
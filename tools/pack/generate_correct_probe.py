@@ -1,22 +1,24 @@
 #!/usr/bin/env python3
+import argparse
 import json
 import struct
 import os
+import sys
 
-def main():
-    pak_path = "contentpacks/poc/raw/pack_data.pak"
-    out_path = "contentpacks/poc/pak_probe.json"
-    
-    with open(pak_path, 'rb') as f:
-        data = f.read()
-        
-    table_start = 288
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+def correct_probe(data, table_start=288, count=16):
+    # -> probe dict for mm2r_pak_unpack_v2, read from the known (size, offset) table
     entry_size = 8
     entries = []
     
     # Format: Size, Offset
     
-    for i in range(16):
+    for i in range(count):
         pos = table_start + i * entry_size
         if pos + 8 > len(data): break
         
@@ -44,7 +46,7 @@ def main():
             "magic": magic
         })
 
-    result = {
+    return {
         "file_size": len(data),
         "name_count": 13,
         "name_end_offset": 184,
@@ -53,11 +55,29 @@ def main():
         "entries": entries,
         "note": "Manually corrected table start & swapped (Size, Offset)"
     }
+
+def main():
+    parser = argparse.ArgumentParser(description='Write pak_probe.json with the manually corrected table layout.')
+    parser.add_argument('--in', dest='pak_path', default='contentpacks/poc/raw/pack_data.pak', help='Input PAK file')
+    parser.add_argument('--out', dest='out_path', default='contentpacks/poc/pak_probe.json', help='Output probe JSON')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'generate_correct_probe')
+
+    pak_path = args.pak_path
+    out_path = args.out_path
+    
+    with open(pak_path, 'rb') as f:
+        data = f.read()
+    m.read(len(data))
+        
+    result = correct_probe(data)
     
     with open(out_path, 'w') as f:
         json.dump(result, f, indent=2)
     
-    print(f"Generated probe json with {len(entries)} entries.")
+    m.count('entries', len(result['entries']))
+    print(f"Generated probe json with {len(result['entries'])} entries.")
 
 if __name__ == "__main__":
     main()
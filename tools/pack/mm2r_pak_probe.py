@@ -3,13 +3,24 @@ import sys
 import argparse
 import json
 import struct
+import os
 import re
+import logging
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
+log = logging.getLogger(__name__)
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Probe MM2R PAK structure")
     parser.add_argument("--in", dest="input_file", required=True, help="Input PAK file")
     parser.add_argument("--scan", dest="scan_file", required=True, help="Existing pack_scan.json for reference")
     parser.add_argument("--out", dest="output_file", required=True, help="Output probe JSON")
+    instrument.add_arguments(parser)
     return parser.parse_args()
 
 def is_valid_filename(b_str):
@@ -140,67 +151,69 @@ def extract_entries(data, table_start, mode, count, file_size):
         
     return entries
 
-def main():
-    args = parse_args()
-    
-    with open(args.input_file, 'rb') as f:
-        data = f.read()
-        
+def probe_pak(data, m=None):
+    # -> probe dict (name table end, table start / entry mode guesses, entries) as written to probe.json
+    m = m or instrument.Metrics('mm2r_pak_probe')
     # 1. Probe names
-    names, name_end = probe_filenames(data)
+    with m.stage('names'):
+        names, name_end = probe_filenames(data)
     
     # 2. Find anchor: RGCN at 4424
-    anchor_offset = 4424
-    # Verify anchor
-    if data[anchor_offset:anchor_offset+4] != b'RGCN':
-        # Search for first RGCN
-        idx = data.find(b'RGCN')
-        if idx != -1:
-            anchor_offset = idx
-        else:
-            print("RGCN anchor not found")
-            anchor_offset = -1
+    with m.stage('anchor'):
+        anchor_offset = 4424
+        # Verify anchor
+        if data[anchor_offset:anchor_offset+4] != b'RGCN':
+            # Search for first RGCN
+            idx = data.find(b'RGCN')
+            if idx != -1:
+                anchor_offset = idx
+            else:
+                log.warning("RGCN anchor not found")
+                anchor_offset = -1
             
-    table_hits = []
-    if anchor_offset != -1:
-        table_hits = find_table_by_target(data, anchor_offset)
+        table_hits = []
+        if anchor_offset != -1:
+            table_hits = find_table_by_target(data, anchor_offset)
         
-    mode = "unknown"
-    table_start_guess = -1
-    final_entries = []
+    with m.stage('table'):
+        mode = "unknown"
+        table_start_guess = -1
+        final_entries = []
     
-    if table_hits:
-        # 假设命中点是某个 entry 的 offset 字段
-        # 我们可以尝试向前推导 table start
-        # 假设 table 紧接在 name_end 之后，并对齐
+        if table_hits:
+            # 假设命中点是某个 entry 的 offset 字段
+            # 我们可以尝试向前推导 table start
+            # 假设 table 紧接在 name_end 之后，并对齐
         
-        # 既然我们有 names 数量，假设 entry 数量 = name 数量
-        # 如果 hit 是第 k 个文件的 offset
-        # 我们可以尝试匹配。
+            # 既然我们有 names 数量，假设 entry 数量 = name 数量
+            # 如果 hit 是第 k 个文件的 offset
+            # 我们可以尝试匹配。
         
-        # 简单起见，我们取最后一个 hit（通常如果只有一个）或者最像在 table 区域的 hit
-        # The hit should be after name_end
-        valid_hits = [h for h in table_hits if h >= name_end]
+            # 简单起见，我们取最后一个 hit（通常如果只有一个）或者最像在 table 区域的 hit
+            # The hit should be after name_end
+            valid_hits = [h for h in table_hits if h >= name_end]
         
-        if valid_hits:
-            hit = valid_hits[0]
-            # Detect mode at hit
-            mode = probe_entries_around_hit(data, hit, len(data))
+            if valid_hits:
+                hit = valid_hits[0]
+                # Detect mode at hit
+                mode = probe_entries_around_hit(data, hit, len(data))
             
-            if mode != "unknown":
-                stride = 8
-                # Backtrack to find table start based on name count
-                # Assuming the RGCN file corresponds to one of the names.
-                # Which one?
-                # This is tricky. 
-                # Let's assume table starts at name_end aligned to 4
-                table_start_guess = (name_end + 3) & ~3
+                if mode != "unknown":
+                    stride = 8
+                    # Backtrack to find table start based on name count
+                    # Assuming the RGCN file corresponds to one of the names.
+                    # Which one?
+                    # This is tricky. 
+                    # Let's assume table starts at name_end aligned to 4
+                    table_start_guess = (name_end + 3) & ~3
                 
-                # Verify if table_start_guess leads to a valid structure
-                # We can just read from table_start_guess
-                final_entries = extract_entries(data, table_start_guess, mode, len(names), len(data))
+                    # Verify if table_start_guess leads to a valid structure
+                    # We can just read from table_start_guess
+                    final_entries = extract_entries(data, table_start_guess, mode, len(names), len(data))
 
-    result = {
+    m.count('names', len(names))
+    m.count('entries', len(final_entries))
+    return {
         "file_size": len(data),
         "name_count": len(names),
         "name_end_offset": name_end,
@@ -209,11 +222,24 @@ def main():
         "entries": final_entries,
         "debug_hits": table_hits
     }
+
+def main():
+    args = parse_args()
+    m = instrument.start(args, 'mm2r_pak_probe')
+    
+    with m.stage('read'):
+        with open(args.input_file, 'rb') as f:
+            data = f.read()
+        m.read(len(data))
+        
+    result = probe_pak(data, m)
     
-    with open(args.output_file, 'w') as f:
-        json.dump(result, f, indent=2)
+    with m.stage('write'):
+        with open(args.output_file, 'w') as f:
+            json.dump(result, f, indent=2)
 
-    print(f"Names: {len(names)}, End: {name_end}, Table: {table_start_guess}, Mode: {mode}, Entries: {len(final_entries)}")
+    print(f"Names: {result['name_count']}, End: {result['name_end_offset']}, Table: {result['table_start_guess']}, "
+          f"Mode: {result['entry_mode_guess']}, Entries: {len(result['entries'])}")
 
 if __name__ == "__main__":
     main()
@@ -5,35 +5,32 @@ import json
 import os
 import struct
 
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Unpack MM2R PAK based on probe")
     parser.add_argument("--in", dest="input_file", required=True, help="Input PAK file")
     parser.add_argument("--probe", dest="probe_file", required=True, help="Probe JSON")
     parser.add_argument("--out", dest="output_dir", required=True, help="Output directory")
     parser.add_argument("--limit", type=int, default=200, help="Max files to unpack")
+    instrument.add_arguments(parser)
     return parser.parse_args()
 
-def main():
-    args = parse_args()
-    
-    with open(args.probe_file, 'r') as f:
-        probe = json.load(f)
-        
-    if probe['entry_mode_guess'] not in ['offset_size', 'start_end']:
-        print("Probe entry mode unknown, skipping unpack.")
-        return
-
-    os.makedirs(args.output_dir, exist_ok=True)
+def unpack_pak(data, probe, out_dir, limit=200, m=None):
+    # -> (files written, {magic: count}); each entry gets a .bin and a .json sidecar
+    m = m or instrument.Metrics('mm2r_pak_unpack_v2')
+    os.makedirs(out_dir, exist_ok=True)
     
-    with open(args.input_file, 'rb') as f:
-        data = f.read()
-        
     entries = probe['entries']
     count = 0
     magic_stats = {}
     
     for i, entry in enumerate(entries):
-        if count >= args.limit: break
+        if count >= limit: break
         
         off = entry['offset']
         size = entry['size']
@@ -59,27 +56,49 @@ def main():
         
         # Write
         fname = f"entry_{i:03d}_{magic}_{off}_{size}.bin"
-        out_path = os.path.join(args.output_dir, fname)
+        out_path = os.path.join(out_dir, fname)
         
-        with open(out_path, 'wb') as out_f:
-            out_f.write(data[off:off+size])
-            
-        # Meta
-        meta = {
-            "offset": off,
-            "size": size,
-            "magic": magic,
-            "index": i
-        }
-        with open(out_path + ".json", 'w') as meta_f:
-            json.dump(meta, meta_f, indent=2)
+        with m.stage('write'):
+            with open(out_path, 'wb') as out_f:
+                m.wrote(out_f.write(data[off:off+size]))
+                
+            # Meta
+            meta = {
+                "offset": off,
+                "size": size,
+                "magic": magic,
+                "index": i
+            }
+            with open(out_path + ".json", 'w') as meta_f:
+                json.dump(meta, meta_f, indent=2)
             
         count += 1
         
+    m.count('files', count)
+    return count, magic_stats
+
+def main():
+    args = parse_args()
+    m = instrument.start(args, 'mm2r_pak_unpack_v2')
+    
+    with open(args.probe_file, 'r') as f:
+        probe = json.load(f)
+        
+    if probe['entry_mode_guess'] not in ['offset_size', 'start_end']:
+        print("Probe entry mode unknown, skipping unpack.")
+        return
+
+    with m.stage('read'):
+        with open(args.input_file, 'rb') as f:
+            data = f.read()
+    m.read(len(data))
+        
+    count, magic_stats = unpack_pak(data, probe, args.output_dir, args.limit, m)
+    
     print(f"Unpacked {count} files.")
     print("Magic stats:")
-    for m, c in magic_stats.items():
-        print(f"  {m}: {c}")
+    for magic, c in magic_stats.items():
+        print(f"  {magic}: {c}")
 
 if __name__ == "__main__":
     main()
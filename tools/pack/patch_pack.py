@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+try:
+    from .. import instrument
+    from ..nds.extract_nds import read_rom_tables
+    from .mm2r_pak_probe import probe_pak
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+    from nds.extract_nds import read_rom_tables
+    from mm2r_pak_probe import probe_pak
+
+# Delta patch packs between two extractions / ROM revisions / paks.
+#
+# A source is a set of named entries:
+#   directory   every file under it, named by relative path (an extract_nds.py output, an unpacked
+#               pak, a content pack)
+#   .nds ROM    every NitroFS file, named raw/<path> as extract_nds.py writes them
+#   pak         every probed entry, named entry_NNN.bin by its probe index (--probe JSON, or probed
+#               on the fly), plus gap_NNN.bin for the bytes no entry claims (header, table,
+#               padding), so the entries and gaps in file order make up the whole pak
+# Entries are compared by size and sha256; the patch holds only what differs:
+#   add / replace   the new entry, zlib-compressed (stored as-is if that does not shrink it)
+#   delta           copy / insert ops against the old entry (zlib-compressed), used when
+#                   smaller than the stored entry
+#   delete          nothing but the name
+#
+# Patch file: '<4sHHI' magic 'MPAT', version, 0, index length; the index (JSON: from / to
+# source digests, entries with op, codec, size, sha256, baseSha256, offset, length into the data);
+# data.
+# Delta ops: b'C' '<II' (old offset, length) | b'I' '<I' length + bytes.
+#
+# Directory and ROM patches apply to a directory holding the old entries (e.g. the old
+# extraction): every entry the patch touches is checked against baseSha256 and every result
+# against sha256 before any file is written, then new files replace the old ones atomically
+# (os.replace). Pak patches (both sides paks; the index then also holds the new pak's layout,
+# size and sha256) rebuild the new pak from the old one: unchanged entries and gaps are copied
+# from the old pak, and the result is checked against the new pak's sha256 before it replaces
+# --out.
+
+MAGIC = b'MPAT'
+HEADER = struct.Struct('<4sHHI')
+COPY = struct.Struct('<II')
+BLOCK = 32
+
+class PatchSource:
+    # name -> bytes-like, backed by mmaps where possible; close() releases them
+    def __init__(self, path, probe=None, m=None):
+        self.path = path
+        self.entries = {}
+        self.kind = 'dir'
+        self.layout = None
+        self._maps = []
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    full = os.path.join(dirpath, fn)
+                    self.entries[os.path.relpath(full, path).replace(os.sep, '/')] = full
+            return
+        mm = self._map(path)
+        if path.lower().endswith('.nds'):
+            self.kind = 'rom'
+            with open(path, 'rb') as f:
+                for e in read_rom_tables(f, m)['files']:
+                    self.entries['raw/' + e['path'].lstrip('/\\').replace(os.sep, '/')] = (mm, e['start'], e['size'])
+            return
+        if probe:
+            with open(probe, 'r') as f:
+                probe_doc = json.load(f)
+        else:
+            probe_doc = probe_pak(mm, m)
+        self.kind = 'pak'
+        self.size = len(mm)
+        self.sha256 = hashlib.sha256(mm).hexdigest()
+        spans = []
+        for i, e in enumerate(probe_doc['entries']):
+            if e['size'] > 0 and e['offset'] + e['size'] <= len(mm):
+                name = f"entry_{e.get('index', i):03d}.bin"
+                self.entries[name] = (mm, e['offset'], e['size'])
+                spans.append((e['offset'], e['offset'] + e['size'], name))
+        self.layout = self._pak_layout(mm, spans)
+
+    def _pak_layout(self, mm, spans):
+        # -> entry / gap names covering the pak in file order; bytes of an entry that overlaps an
+        #    earlier one are covered by a gap
+        layout = []
+        pos = 0
+
+        def gap(end):
+            name = f"gap_{sum(n.startswith('gap_') for n in layout):03d}.bin"
+            self.entries[name] = (mm, pos, end - pos)
+            layout.append(name)
+
+        for start, end, name in sorted(spans):
+            if start >= pos:
+                if start > pos:
+                    gap(start)
+                layout.append(name)
+                pos = end
+            elif end > pos:
+                gap(end)
+                pos = end
+        if pos < len(mm):
+            gap(len(mm))
+        return layout
+
+    def _map(self, path):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+        self._maps.append(mm)
+        return mm
+
+    def read(self, name):
+        ref = self.entries[name]
+        if isinstance(ref, str):
+            with open(ref, 'rb') as f:
+                return f.read()
+        mm, start, size = ref
+        return mm[start:start + size]
+
+    def index(self, m=None):
+        # -> {name: (size, sha256)}
+        m = m or instrument.Metrics('patch_pack')
+        out = {}
+        with m.stage('hash'):
+            for name in self.entries:
+                data = self.read(name)
+                m.read(len(data))
+                out[name] = (len(data), hashlib.sha256(data).hexdigest())
+        return out
+
+    def close(self):
+        for mm in self._maps:
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        self._maps = []
+
+def digest_index(index):
+    h = hashlib.sha256()
+    for name in sorted(index):
+        h.update(f"{name}\0{index[name][1]}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def make_delta(old, new, block=BLOCK, max_literal=0.5):
+    # -> delta ops (bytes) turning old into new, or None when more than max_literal of new
+    #    would have to be inserted as-is
+    old, new = bytes(old), bytes(new)
+    blocks = {}
+    for off in range(0, len(old) - block + 1, block):
+        blocks.setdefault(old[off:off + block], off)
+    ops = []
+    literal = 0
+    limit = int(len(new) * max_literal)
+    lit_start = i = 0
+    end = len(new) - block
+    while i <= end:
+        j = blocks.get(new[i:i + block])
+        if j is None:
+            i += 1
+            if i - lit_start + literal > limit:
+                return None
+            continue
+        # Extend the match backwards into the pending literal, then forwards
+        while i > lit_start and j > 0 and new[i - 1] == old[j - 1]:
+            i -= 1
+            j -= 1
+        n = block
+        while i + n + 256 <= len(new) and j + n + 256 <= len(old) and new[i + n:i + n + 256] == old[j + n:j + n + 256]:
+            n += 256
+        while i + n < len(new) and j + n < len(old) and new[i + n] == old[j + n]:
+            n += 1
+        if i > lit_start:
+            ops.append(b'I' + struct.pack('<I', i - lit_start) + new[lit_start:i])
+            literal += i - lit_start
+        ops.append(b'C' + COPY.pack(j, n))
+        i += n
+        lit_start = i
+    if lit_start < len(new):
+        literal += len(new) - lit_start
+        if literal > limit:
+            return None
+        ops.append(b'I' + struct.pack('<I', len(new) - lit_start) + new[lit_start:])
+    return b''.join(ops)
+
+def apply_delta(old, delta):
+    out = bytearray()
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        if op == b'C':
+            off, n = COPY.unpack_from(delta, pos + 1)
+            if off + n > len(old):
+                raise ValueError(f"delta copy {off}+{n} past the end of the old entry ({len(old)} bytes)")
+            out += old[off:off + n]
+            pos += 1 + COPY.size
+        elif op == b'I':
+            n, = struct.unpack_from('<I', delta, pos + 1)
+            out += delta[pos + 5:pos + 5 + n]
+            pos += 5 + n
+        else:
+            raise ValueError(f"bad delta op {op!r} at {pos}")
+    return bytes(out)
+
+def build_patch(old, new, level=9, m=None):
+    # old / new: PatchSource -> (patch bytes, summary)
+    m = m or instrument.Metrics('patch_pack')
+    if (old.kind == 'pak') != (new.kind == 'pak'):
+        raise ValueError("a pak can only be diffed against another pak")
+    old_index = old.index(m)
+    new_index = new.index(m)
+    entries = []
+    data = bytearray()
+    summary = {'add': 0, 'replace': 0, 'delta': 0, 'delete': 0, 'same': 0}
+    for name in sorted(set(old_index) | set(new_index)):
+        before, after = old_index.get(name), new_index.get(name)
+        if after is None:
+            entries.append({'name': name, 'op': 'delete', 'baseSha256': before[1]})
+            summary['delete'] += 1
+            continue
+        if before == after:
+            summary['same'] += 1
+            continue
+        body = new.read(name)
+        with m.stage('compress'):
+            payload = zlib.compress(body, level)
+        codec = 'zlib'
+        if len(payload) >= len(body):
+            codec, payload = 'raw', bytes(body)
+        op = 'add' if before is None else 'replace'
+        if before is not None:
+            with m.stage('delta'):
+                delta = make_delta(old.read(name), body)
+            if delta is not None:
+                delta = zlib.compress(delta, level)
+                if len(delta) < len(payload):
+                    op, codec, payload = 'delta', 'zlib', delta
+        entry = {'name': name, 'op': op, 'codec': codec, 'size': after[0], 'sha256': after[1],
+                 'offset': len(data), 'length': len(payload)}
+        if before is not None:
+            entry['baseSha256'] = before[1]
+        entries.append(entry)
+        data += payload
+        summary[op] += 1
+    to = {'source': os.path.basename(new.path.rstrip('/')), 'digest': digest_index(new_index),
+          'entries': len(new_index)}
+    if new.kind == 'pak':
+        to.update({'size': new.size, 'sha256': new.sha256, 'layout': new.layout})
+    index = json.dumps({
+        'version': 1,
+        'kind': new.kind,
+        'from': {'source': os.path.basename(old.path.rstrip('/')), 'digest': digest_index(old_index),
+                 'entries': len(old_index)},
+        'to': to,
+        'entries': entries,
+    }, separators=(',', ':')).encode('utf-8')
+    return HEADER.pack(MAGIC, 1, 0, len(index)) + index + bytes(data), summary
+
+def read_patch(blob):
+    # -> (index dict, data memoryview)
+    if len(blob) < HEADER.size:
+        raise ValueError("patch too short")
+    magic, version, _, index_len = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != 1:
+        raise ValueError(f"not a v1 patch pack (magic {magic!r}, version {version})")
+    index = json.loads(bytes(blob[HEADER.size:HEADER.size + index_len]).decode('utf-8'))
+    return index, memoryview(blob)[HEADER.size + index_len:]
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def decode_entry(e, data, old, m):
+    # -> the new content of a patch entry (old: the old content, needed for delta entries)
+    payload = bytes(data[e['offset']:e['offset'] + e['length']])
+    if e['codec'] == 'zlib':
+        with m.stage('decompress'):
+            payload = zlib.decompress(payload)
+    if e['op'] == 'delta':
+        with m.stage('delta'):
+            payload = apply_delta(old, payload)
+    if len(payload) != e['size'] or hashlib.sha256(payload).hexdigest() != e['sha256']:
+        raise ValueError(f"{e['name']}: result hash mismatch")
+    return payload
+
+def apply_patch(blob, target_dir, dry_run=False, m=None):
+    # -> {op: count}; raises ValueError (nothing written) if any base or result hash mismatches
+    m = m or instrument.Metrics('patch_pack')
+    index, data = read_patch(blob)
+    if index.get('kind') == 'pak':
+        raise ValueError("this patch was built from paks; rebuild the pak with apply --pak <old.pak> --out <new.pak>")
+    root = os.path.realpath(target_dir)
+    staged = []
+    summary = {'add': 0, 'replace': 0, 'delta': 0, 'delete': 0}
+    for e in index['entries']:
+        path = os.path.realpath(os.path.join(root, e['name']))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"{e['name']}: path outside the target directory")
+        exists = os.path.isfile(path)
+        if e['op'] == 'add':
+            if exists and sha256_file(path) != e['sha256']:
+                raise ValueError(f"{e['name']}: already exists with other content")
+        elif not exists:
+            raise ValueError(f"{e['name']}: missing from {target_dir}")
+        elif sha256_file(path) != e['baseSha256']:
+            raise ValueError(f"{e['name']}: base hash mismatch (not the source this patch was made from)")
+        if e['op'] == 'delete':
+            staged.append((path, None))
+            summary['delete'] += 1
+            continue
+        old = None
+        if e['op'] == 'delta':
+            with open(path, 'rb') as f:
+                old = f.read()
+        payload = decode_entry(e, data, old, m)
+        staged.append((path, payload))
+        summary[e['op']] += 1
+    if dry_run:
+        return summary
+    with m.stage('write'):
+        for path, payload in staged:
+            if payload is None:
+                os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.patch-tmp'
+            with open(tmp, 'wb') as f:
+                m.wrote(f.write(payload))
+            os.replace(tmp, path)
+    return summary
+
+def apply_pak_patch(blob, old_pak, out_path, probe=None, dry_run=False, m=None):
+    # -> {op: count}; rebuilds the new pak from old_pak (probed the same way as at diff time) and
+    #    the patch, raises ValueError (nothing written) if old_pak or the result does not match
+    m = m or instrument.Metrics('patch_pack')
+    index, data = read_patch(blob)
+    if index.get('kind') != 'pak':
+        raise ValueError("this patch was not built from paks; apply it with --dir")
+    old = PatchSource(old_pak, probe, m)
+    try:
+        if old.kind != 'pak':
+            raise ValueError(f"{old_pak} is not a pak")
+        if digest_index(old.index(m)) != index['from']['digest']:
+            raise ValueError(f"{old_pak} is not the pak this patch was made from "
+                             "(entry hashes differ; was it diffed with another --old-probe?)")
+        changed = {}
+        summary = {'add': 0, 'replace': 0, 'delta': 0, 'delete': 0}
+        for e in index['entries']:
+            summary[e['op']] += 1
+            if e['op'] != 'delete':
+                changed[e['name']] = decode_entry(e, data, old.read(e['name']) if e['op'] == 'delta' else None, m)
+        h = hashlib.sha256()
+        tmp = out_path + '.patch-tmp'
+        with m.stage('write'):
+            f = None if dry_run else open(tmp, 'wb')
+            try:
+                for name in index['to']['layout']:
+                    piece = changed[name] if name in changed else old.read(name)
+                    h.update(piece)
+                    if f:
+                        m.wrote(f.write(piece))
+            finally:
+                if f:
+                    f.close()
+            if h.hexdigest() != index['to']['sha256']:
+                if f:
+                    os.remove(tmp)
+                raise ValueError("rebuilt pak hash mismatch")
+            if f:
+                os.replace(tmp, out_path)
+    finally:
+        old.close()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or apply delta patch packs between two content revisions.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    diff = sub.add_parser('diff', help='Build a patch from --old to --new')
+    diff.add_argument('--old', required=True, help='Old extraction directory, .nds ROM or pak')
+    diff.add_argument('--new', required=True, help='New extraction directory, .nds ROM or pak')
+    diff.add_argument('--old-probe', help='Probe JSON for an old pak (default: probe it)')
+    diff.add_argument('--new-probe', help='Probe JSON for a new pak (default: probe it)')
+    diff.add_argument('--out', required=True, help='Patch file to write')
+    diff.add_argument('--level', type=int, default=9, help='zlib level')
+    apply = sub.add_parser('apply', help='Apply a patch to a directory holding the old entries, or rebuild a pak')
+    apply.add_argument('--patch', required=True)
+    target = apply.add_mutually_exclusive_group(required=True)
+    target.add_argument('--dir', help='Directory to update in place (directory / ROM patches)')
+    target.add_argument('--pak', help='Old pak to rebuild the new one from (pak patches, needs --out)')
+    apply.add_argument('--probe', help='Probe JSON for the old pak (the --old-probe used by diff; default: probe it)')
+    apply.add_argument('--out', help='New pak to write (with --pak)')
+    apply.add_argument('--dry-run', action='store_true', help='Verify hashes only')
+    info = sub.add_parser('info', help='Show a patch index')
+    info.add_argument('--patch', required=True)
+    for p in (diff, apply, info):
+        instrument.add_arguments(p)
+    args = parser.parse_args()
+    m = instrument.start(args, 'patch_pack')
+
+    if args.command == 'diff':
+        for path in (args.old, args.new):
+            if not os.path.exists(path):
+                print(f"Error: {path} not found.")
+                sys.exit(1)
+        old = PatchSource(args.old, args.old_probe, m)
+        new = PatchSource(args.new, args.new_probe, m)
+        try:
+            blob, summary = build_patch(old, new, args.level, m)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        finally:
+            old.close()
+            new.close()
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'wb') as f:
+            m.wrote(f.write(blob))
+        print(f"{args.out}: {len(blob)} bytes, " + ', '.join(f"{v} {k}" for k, v in summary.items()))
+        return
+
+    with open(args.patch, 'rb') as f:
+        blob = f.read()
+    m.read(len(blob))
+    if args.command == 'info':
+        index, _ = read_patch(blob)
+        print(f"from {index['from']['source']} ({index['from']['digest'][:16]}) "
+              f"to {index['to']['source']} ({index['to']['digest'][:16]})")
+        for e in index['entries']:
+            print(f"  {e['op']:<8} {e['name']}" + (f"  {e['length']} -> {e['size']} bytes" if 'length' in e else ''))
+        return
+    if args.pak and not args.out:
+        print("Error: --pak needs --out for the rebuilt pak.")
+        sys.exit(1)
+    try:
+        if args.pak:
+            summary = apply_pak_patch(blob, args.pak, args.out, args.probe, args.dry_run, m)
+        else:
+            summary = apply_patch(blob, args.dir, args.dry_run, m)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    verb = 'Verified' if args.dry_run else 'Applied'
+    target = f"{args.pak} -> {args.out}" if args.pak else args.dir
+    print(f"{verb} {args.patch} on {target}: " + ', '.join(f"{v} {k}" for k, v in summary.items()))
+
+if __name__ == "__main__":
+    main()
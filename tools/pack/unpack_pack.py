@@ -5,6 +5,12 @@ import os
 import json
 import argparse
 
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import instrument
+
 def ensure_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -33,14 +39,15 @@ def try_unpack_narc(f, out_dir, limit):
     print("Detected NARC format. (Full parser not implemented in this minimal script, skipping to scan/guess for safety)")
     return False 
 
-def try_table_guess(f, file_size, out_dir, limit):
+def guess_table(f, file_size):
+    # -> [{'offset', 'size', 'id'}] if the file starts with a plausible count + (offset, size) table, else None
     f.seek(0)
     count_candidate = read_u32(f)
-    if count_candidate is None: return False
+    if count_candidate is None: return None
     
     # Heuristic: File count reasonable?
     if not (1 <= count_candidate <= 20000):
-        return False
+        return None
         
     entries = []
     
@@ -104,10 +111,17 @@ def try_table_guess(f, file_size, out_dir, limit):
     # If the first u32 is huge, table guess failed.
     
     if count_candidate > 20000:
-        return False
+        return None
 
     if valid_a and entries_a:
-        print(f"Table Guess (Offset/Size) seems valid. Count: {count_candidate}")
+        return entries_a
+    return None
+
+def try_table_guess(f, file_size, out_dir, limit, m=None):
+    m = m or instrument.Metrics('unpack_pack')
+    entries_a = guess_table(f, file_size)
+    if entries_a:
+        print(f"Table Guess (Offset/Size) seems valid. Count: {len(entries_a)}")
         target_dir = os.path.join(out_dir, "table_guess")
         ensure_dir(target_dir)
         
@@ -117,16 +131,19 @@ def try_table_guess(f, file_size, out_dir, limit):
             
             f.seek(e['offset'])
             data = f.read(e['size'])
+            m.read(len(data))
             name = f"file_{e['id']:06d}.bin"
             with open(os.path.join(target_dir, name), 'wb') as out_f:
-                out_f.write(data)
+                m.wrote(out_f.write(data))
             extracted_count += 1
         return True
 
     return False
 
-def scan_signatures(f, file_size, out_dir):
-    sigs = [b"NARC", b"BMG", b"BTX0", b"RGCN", b"RLCN", b"RCSN", b"SDAT", b"NFTR", b"NCLR", b"NCGR", b"NSCR"]
+def find_signatures(f, m=None):
+    # -> {'stats': {magic: hits}, 'locations': {magic: [offset, ...]}} (4-byte aligned hits only)
+    m = m or instrument.Metrics('unpack_pack')
+    sigs = [b"NARC", b"BMG", b"MESGbmg1", b"BTX0", b"RGCN", b"RLCN", b"RCSN", b"SDAT", b"NFTR", b"NCLR", b"NCGR", b"NSCR"]
     stats = {s.decode(): 0 for s in sigs}
     locations = {s.decode(): [] for s in sigs}
     
@@ -139,6 +156,7 @@ def scan_signatures(f, file_size, out_dir):
     while True:
         data = f.read(chunk_size)
         if not data: break
+        m.read(len(data))
         
         for s in sigs:
             s_str = s.decode()
@@ -151,6 +169,7 @@ def scan_signatures(f, file_size, out_dir):
                 # Basic alignment check? Usually 4-byte aligned
                 if abs_offset % 4 == 0:
                     stats[s_str] += 1
+                    m.count('signatures')
                     if len(locations[s_str]) < 200:
                         locations[s_str].append(abs_offset)
                 
@@ -165,14 +184,16 @@ def scan_signatures(f, file_size, out_dir):
             
     # Filter stats > 0
     final_stats = {k: v for k, v in stats.items() if v > 0}
-    
-    print("Signature Scan Results:")
-    print(json.dumps(final_stats, indent=2))
-    
-    report = {
+    return {
         'stats': final_stats,
         'locations': locations
     }
+
+def scan_signatures(f, file_size, out_dir, m=None):
+    report = find_signatures(f, m)
+    
+    print("Signature Scan Results:")
+    print(json.dumps(report['stats'], indent=2))
     
     with open(os.path.join(out_dir, '..', 'pack_scan.json'), 'w') as jf:
         json.dump(report, jf, indent=2)
@@ -184,7 +205,9 @@ def main():
     parser.add_argument('--in', dest='input', required=True)
     parser.add_argument('--out', required=True)
     parser.add_argument('--limit', type=int, default=200)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    m = instrument.start(args, 'unpack_pack')
 
     in_path = args.input
     out_dir = args.out
@@ -198,18 +221,23 @@ def main():
     
     with open(in_path, 'rb') as f:
         # 1. Try NARC
-        if try_unpack_narc(f, out_dir, args.limit):
+        with m.stage('narc'):
+            is_narc = try_unpack_narc(f, out_dir, args.limit)
+        if is_narc:
             print("Unpacked as NARC")
             sys.exit(0)
             
         # 2. Try Table Guess
-        if try_table_guess(f, file_size, out_dir, args.limit):
+        with m.stage('table_guess'):
+            is_table = try_table_guess(f, file_size, out_dir, args.limit, m)
+        if is_table:
             print("Unpacked using Table Guess")
             sys.exit(0)
             
         # 3. Signature Scan
         print("Structure unknown. Running signature scan...")
-        scan_signatures(f, file_size, out_dir)
+        with m.stage('scan'):
+            scan_signatures(f, file_size, out_dir, m)
         print("Scan complete. Check pack_scan.json")
 
 if __name__ == '__main__':
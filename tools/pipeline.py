@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from . import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from tools import instrument
+
+# Content build pipeline: ROM -> extract -> pak scan / probe -> unpack -> triplet pick -> render
+# -> pack (unpacked entries and renders in one compressed content pack, see pack/content_pack.py),
+# plus a collision grid for the selected tilemap when a --solidity table is given.
+#
+# Each stage declares its inputs (files, or files / directories produced by another stage)
+# and params. Its key is sha256 over the stage name, params, the code it runs (this file, the
+# tool sources the stage lists or imports and every tools/ module those import in turn) and
+# the content hash of every input; outputs live in <out>/.pipeline/<stage>/<key> and
+# <out>/<stage> links to the current one. A stage whose key already has outputs is not run,
+# and since downstream keys use the *output* hashes of upstream stages, a stage that re-runs
+# but produces identical files does not invalidate anything after it.
+#
+# Stages run in worker processes as soon as their inputs are ready (--jobs). Input file
+# hashes are cached by (path, size, mtime) in <out>/.pipeline/hashes.json so an unchanged
+# ROM is not re-read on every invocation.
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+META = '.stage.json'
+
+class Stage:
+    def __init__(self, name, fn, inputs, params=None, code=()):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs      # {name: ('file', path) | ('stage', stage name, path inside its output)}
+        self.params = params or {}
+        self.code = code          # tool sources (relative to tools/) that are part of the key
+
+    def deps(self):
+        return sorted({ref[1] for ref in self.inputs.values() if ref[0] == 'stage'})
+
+# --- stage bodies (run in worker processes; inputs are resolved paths, m collects tool timings) ---
+
+def stage_extract(inputs, params, out, m):
+    from tools.nds.extract_nds import extract_rom
+    manifest = extract_rom(inputs['rom'], out, params['limit'] or sys.maxsize, m)
+    return {'files': manifest['extracted']}
+
+def stage_scan(inputs, params, out, m):
+    from tools.pack.unpack_pack import find_signatures
+    with open(inputs['pak'], 'rb') as f:
+        report = find_signatures(f, m)
+    with open(os.path.join(out, 'pack_scan.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return {'signatures': sum(report['stats'].values())}
+
+def stage_slices(inputs, params, out, m):
+    from tools.pack.extract_by_magic import load_scan, slice_by_magic
+    with open(inputs['pak'], 'rb') as f:
+        data = f.read()
+    index = slice_by_magic(data, load_scan(inputs['scan']), out, m=m)
+    for item in index:
+        item['path'] = os.path.basename(item['path'])
+    with open(os.path.join(out, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+    return {'slices': len(index)}
+
+def stage_probe(inputs, params, out, m):
+    from tools.pack.mm2r_pak_probe import probe_pak
+    with open(inputs['pak'], 'rb') as f:
+        probe = probe_pak(f.read(), m)
+    with open(os.path.join(out, 'probe.json'), 'w') as f:
+        json.dump(probe, f, indent=2)
+    return {'entries': len(probe['entries']), 'mode': probe['entry_mode_guess']}
+
+def stage_unpack(inputs, params, out, m):
+    from tools.pack.mm2r_pak_unpack_v2 import unpack_pak
+    with open(inputs['probe'], 'r') as f:
+        probe = json.load(f)
+    if probe['entry_mode_guess'] not in ['offset_size', 'start_end']:
+        raise ValueError("probe entry mode unknown, pass --probe with a corrected table")
+    with open(inputs['pak'], 'rb') as f:
+        data = f.read()
+    count, magics = unpack_pak(data, probe, out, params['limit'] or sys.maxsize, m)
+    return {'files': count, 'magics': len(magics)}
+
+def stage_triplets(inputs, params, out, m):
+    from tools.nds.pick_tilemap_triplet import select_triplets
+    selected = select_triplets(inputs['unpacked'], params['max_distance'], params['top'], m)
+    if not selected:
+        raise ValueError("no RGCN + RLCN pair in the unpacked entries")
+    # Keep names only: the unpack directory is keyed and may move
+    for key in ('rgcn_path', 'rlcn_path', 'rcsn_path'):
+        if selected[key]:
+            selected[key] = os.path.basename(selected[key])
+    for t in selected['triplets']:
+        for key in ('rgcn_path', 'rlcn_path', 'rcsn_path'):
+            t[key] = os.path.basename(t[key])
+    with open(os.path.join(out, 'selection.json'), 'w') as f:
+        json.dump(selected, f, indent=2)
+    return {'triplets': len(selected['triplets']), 'rgcn': selected['rgcn_path']}
+
+def stage_render(inputs, params, out, m):
+    from tools.nds.render_rgcn_rlcn_rcsn import render_tilemap, write_png
+    with open(inputs['selection'], 'r') as f:
+        selected = json.load(f)
+    def read(name):
+        if not name:
+            return None
+        with open(os.path.join(inputs['unpacked'], name), 'rb') as f:
+            return f.read()
+    w, h, pixels = render_tilemap(read(selected['rgcn_path']), read(selected['rlcn_path']), read(selected['rcsn_path']), m)
+    write_png(w, h, pixels, os.path.join(out, 'screen.png'))
+    return {'size': [w, h]}
+
+def stage_collision(inputs, params, out, m):
+    from tools.nds.build_collision import load_solidity, build_collision, encode_binary
+    from tools.nds.render_rgcn_rlcn_rcsn import parse_rcsn
+    with open(inputs['selection'], 'r') as f:
+        selected = json.load(f)
+    if not selected['rcsn_path']:
+        raise ValueError("the selected triplet has no RCSN tilemap")
+    with open(os.path.join(inputs['unpacked'], selected['rcsn_path']), 'rb') as f:
+        map_w, map_h, tile_map = parse_rcsn(f.read())
+    default, exceptions = load_solidity(inputs['solidity'])
+    grid = build_collision(tile_map, map_w, map_h, default, exceptions, params['tile_size'])
+    base = os.path.join(out, params['room'])
+    with open(base + '.collision.json', 'w') as f:
+        json.dump(grid, f, separators=(',', ':'))
+    with open(base + '.collision.bin', 'wb') as f:
+        f.write(encode_binary(grid))
+    return {'size': [map_w, map_h], 'solid': grid['solidCount'], 'rects': len(grid['rects'])}
+
+def stage_pack(inputs, params, out, m):
+    from tools.pack.content_pack import directory_files, write_content_pack
+    files = []
+    for prefix in ('unpacked', 'render'):
+        files += [(f'{prefix}/{name}', path) for name, path in directory_files(inputs[prefix])
+                  if os.path.basename(name) != META]
+    summary = write_content_pack(files, os.path.join(out, 'content.cpak'), params['codec'], params['level'],
+                                 params['block_size'], m)
+    return {'entries': summary['entries'], 'raw': summary['raw'], 'stored': summary['stored']}
+
+def build_stages(args):
+    stages = []
+    if args.rom:
+        stages.append(Stage('extract', stage_extract, {'rom': ('file', args.rom)},
+                            {'limit': args.limit}, ['nds/extract_nds.py']))
+    if args.pak:
+        pak = ('file', args.pak)
+    elif args.rom and args.pak_in_rom:
+        pak = ('stage', 'extract', os.path.join('raw', args.pak_in_rom.lstrip('/')))
+    else:
+        return stages
+    stages.append(Stage('scan', stage_scan, {'pak': pak}, code=['pack/unpack_pack.py']))
+    stages.append(Stage('slices', stage_slices, {'pak': pak, 'scan': ('stage', 'scan', 'pack_scan.json')},
+                        code=['pack/extract_by_magic.py']))
+    if args.probe:
+        probe = ('file', args.probe)
+    else:
+        stages.append(Stage('probe', stage_probe, {'pak': pak}, code=['pack/mm2r_pak_probe.py']))
+        probe = ('stage', 'probe', 'probe.json')
+    stages.append(Stage('unpack', stage_unpack, {'pak': pak, 'probe': probe},
+                        {'limit': args.limit}, ['pack/mm2r_pak_unpack_v2.py']))
+    stages.append(Stage('triplets', stage_triplets, {'unpacked': ('stage', 'unpack', '')},
+                        {'max_distance': args.max_distance, 'top': args.top},
+                        ['nds/pick_tilemap_triplet.py', 'nds/nitro.py']))
+    stages.append(Stage('render', stage_render,
+                        {'unpacked': ('stage', 'unpack', ''), 'selection': ('stage', 'triplets', 'selection.json')},
+                        code=['nds/render_rgcn_rlcn_rcsn.py']))
+    if args.solidity:
+        stages.append(Stage('collision', stage_collision,
+                            {'unpacked': ('stage', 'unpack', ''), 'selection': ('stage', 'triplets', 'selection.json'),
+                             'solidity': ('file', args.solidity)},
+                            {'room': args.room, 'tile_size': args.tile_size},
+                            ['nds/build_collision.py', 'nds/render_rgcn_rlcn_rcsn.py']))
+    stages.append(Stage('pack', stage_pack,
+                        {'unpacked': ('stage', 'unpack', ''), 'render': ('stage', 'render', '')},
+                        {'codec': args.pack_codec, 'level': args.pack_level, 'block_size': args.pack_block_size},
+                        ['pack/content_pack.py']))
+    return stages
+
+# --- hashing ---
+
+class HashCache:
+    # sha256 of files, remembered by (size, mtime_ns)
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def file(self, path):
+        full = os.path.realpath(path)
+        st = os.stat(full)
+        hit = self.entries.get(full)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        digest = sha256_file(full)
+        self.entries[full] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f)
+
+def imported_tools(source, where):
+    # -> tool sources (relative to tools/) imported by `source`, a module living in directory `where`.
+    # Covers the package forms (from .x / from .. / from tools.x import ...) and the script
+    # fallbacks (import instrument, from nitro import ...: a sibling module, else one in tools/).
+    found = []
+    def add(base, dotted):
+        path = os.path.join(base, *dotted.split('.'))
+        for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+            if os.path.isfile(candidate):
+                found.append(os.path.relpath(candidate, TOOLS).replace(os.sep, '/'))
+                return True
+        return False
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                add(where, alias.name) or add(TOOLS, alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                bases = [where]
+                for _ in range(node.level - 1):
+                    bases = [os.path.dirname(bases[0])]
+            elif (node.module or '').split('.')[0] == 'tools':
+                bases = [os.path.dirname(TOOLS)]
+            else:
+                bases = [where, TOOLS]
+            for base in bases:
+                hit = bool(node.module) and add(base, node.module)
+                # from package import module
+                package = os.path.join(base, *node.module.split('.')) if node.module else base
+                for alias in node.names:
+                    hit = add(package, alias.name) or hit
+                if hit:
+                    break
+    return [f for f in found if not f.startswith('..')]
+
+_closures = {}
+
+def code_closure(roots):
+    # -> sorted tool sources reachable from `roots` (relative to tools/) through their imports
+    key = tuple(sorted(roots))
+    if key not in _closures:
+        seen = set()
+        todo = list(roots)
+        while todo:
+            rel = todo.pop()
+            if rel in seen:
+                continue
+            seen.add(rel)
+            path = os.path.join(TOOLS, rel)
+            with open(path, 'r', encoding='utf-8') as f:
+                todo.extend(imported_tools(f.read(), os.path.dirname(path)))
+        _closures[key] = sorted(seen)
+    return _closures[key]
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_outputs(out_dir):
+    # -> {relative path: sha256} for every file a stage wrote
+    files = {}
+    for dirpath, _, names in os.walk(out_dir):
+        for name in names:
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, out_dir).replace(os.sep, '/')
+            if rel != META:
+                files[rel] = sha256_file(full)
+    return files
+
+def digest_of(files):
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        h.update(f"{rel}\0{files[rel]}\n".encode('utf-8'))
+    return h.hexdigest()
+
+# --- runner ---
+
+class Pipeline:
+    def __init__(self, stages, out_dir, jobs=None):
+        self.stages = {s.name: s for s in stages}
+        self.out_dir = out_dir
+        self.cache_dir = os.path.join(out_dir, '.pipeline')
+        self.jobs = jobs
+        self.hashes = HashCache(os.path.join(self.cache_dir, 'hashes.json'))
+        self.results = {}  # stage -> {'key', 'dir', 'files', 'digest', 'status', ...}
+
+    def input_digest(self, ref):
+        if ref[0] == 'file':
+            return self.hashes.file(ref[1])
+        upstream = self.results[ref[1]]
+        rel = ref[2].replace(os.sep, '/').strip('/')
+        if not rel:
+            return upstream['digest']
+        if rel in upstream['files']:
+            return upstream['files'][rel]
+        # A directory inside the upstream output
+        prefix = rel + '/'
+        return digest_of({k: v for k, v in upstream['files'].items() if k.startswith(prefix)})
+
+    def resolve(self, ref):
+        if ref[0] == 'file':
+            return os.path.abspath(ref[1])
+        return os.path.join(self.results[ref[1]]['dir'], ref[2])
+
+    def key(self, stage):
+        code = ['pipeline.py'] + code_closure(list(stage.code) + imported_tools(inspect.getsource(stage.fn), TOOLS))
+        spec = {
+            'stage': stage.name,
+            'params': stage.params,
+            'code': {c: self.hashes.file(os.path.join(TOOLS, c)) for c in code},
+            'inputs': {n: self.input_digest(ref) for n, ref in sorted(stage.inputs.items())},
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def stage_dir(self, stage, key):
+        return os.path.join(self.cache_dir, stage.name, key[:16])
+
+    def cached(self, stage, key):
+        meta = os.path.join(self.stage_dir(stage, key), META)
+        if not os.path.exists(meta):
+            return None
+        with open(meta, 'r') as f:
+            return json.load(f)
+
+    def select(self, targets):
+        # targets plus everything they depend on
+        wanted = set()
+        todo = list(targets or self.stages)
+        while todo:
+            name = todo.pop()
+            if name in wanted:
+                continue
+            if name not in self.stages:
+                raise ValueError(f"unknown stage {name} (have: {', '.join(self.stages)})")
+            wanted.add(name)
+            todo.extend(self.stages[name].deps())
+        return [n for n in self.stages if n in wanted]
+
+    def run(self, targets=None, force=(), dry_run=False):
+        order = self.select(targets)
+        pending = list(order)
+        running = {}
+        failed = set()
+        stale = set()  # dry run: stages that would run, so their outputs (and downstream keys) are unknown
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if any(d in stale for d in stage.deps()):
+                        pending.remove(name)
+                        stale.add(name)
+                        self.results[name] = {'status': 'would run'}
+                        self.report(name)
+                        continue
+                    if any(d in failed for d in stage.deps()):
+                        pending.remove(name)
+                        failed.add(name)
+                        self.results[name] = {'status': 'skipped'}
+                        self.report(name)
+                        continue
+                    if not all(d in self.results for d in stage.deps()):
+                        continue
+                    pending.remove(name)
+                    key = self.key(stage)
+                    meta = None if name in force else self.cached(stage, key)
+                    if meta is not None:
+                        self.results[name] = dict(meta, dir=self.stage_dir(stage, key), status='cached')
+                        self.report(name)
+                    elif dry_run:
+                        stale.add(name)
+                        self.results[name] = {'status': 'would run', 'key': key}
+                        self.report(name)
+                    else:
+                        tmp = self.stage_dir(stage, key) + f".tmp{os.getpid()}"
+                        shutil.rmtree(tmp, ignore_errors=True)
+                        os.makedirs(tmp)
+                        inputs = {n: self.resolve(ref) for n, ref in stage.inputs.items()}
+                        running[pool.submit(run_stage, stage.fn, inputs, stage.params, tmp)] = (name, key, tmp)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key, tmp = running.pop(future)
+                    try:
+                        summary, seconds, stages = future.result()
+                    except Exception as e:
+                        shutil.rmtree(tmp, ignore_errors=True)
+                        failed.add(name)
+                        self.results[name] = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                    else:
+                        self.results[name] = dict(self.commit(self.stages[name], key, tmp, summary, seconds, stages),
+                                                  status='ran')
+                    self.report(name)
+        self.hashes.save()
+        if not dry_run:
+            self.write_state(order)
+        return not any(self.results[n]['status'] == 'failed' for n in order)
+
+    def commit(self, stage, key, tmp, summary, seconds, stages):
+        files = hash_outputs(tmp)
+        meta = {
+            'stage': stage.name,
+            'key': key,
+            'params': stage.params,
+            'summary': summary,
+            'seconds': round(seconds, 3),
+            'timings': stages,
+            'files': files,
+            'digest': digest_of(files),
+        }
+        with open(os.path.join(tmp, META), 'w') as f:
+            json.dump(meta, f, indent=2)
+        final = self.stage_dir(stage, key)
+        shutil.rmtree(final, ignore_errors=True)  # forced re-run
+        os.replace(tmp, final)
+        return dict(meta, dir=final)
+
+    def report(self, name):
+        r = self.results[name]
+        status = r['status']
+        detail = ''
+        if status == 'ran':
+            detail = f"{r['seconds']:.2f}s {json.dumps(r['summary'])}"
+        elif status == 'cached':
+            detail = r['key'][:16]
+        elif status == 'failed':
+            detail = r['error']
+        print(f"  {name:<10} {status:<9} {detail}")
+
+    def write_state(self, order):
+        state = {}
+        for name in order:
+            r = self.results[name]
+            state[name] = {k: r[k] for k in ('status', 'key', 'digest', 'seconds', 'summary', 'error') if k in r}
+            if 'dir' in r:
+                state[name]['dir'] = os.path.relpath(r['dir'], self.out_dir)
+                self.link(name, r['dir'])
+        with open(os.path.join(self.out_dir, 'pipeline.json'), 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def link(self, name, target):
+        # <out>/<stage> -> current outputs
+        path = os.path.join(self.out_dir, name)
+        if os.path.islink(path):
+            os.unlink(path)
+        elif os.path.exists(path):
+            print(f"Warning: {path} exists and is not a link, leaving it alone.")
+            return
+        try:
+            os.symlink(os.path.relpath(target, self.out_dir), path, target_is_directory=True)
+        except OSError as e:  # e.g. no symlink privilege on Windows
+            print(f"Warning: could not link {path}: {e}")
+
+    def gc(self):
+        # Drop every cached output that is not the current one of its stage
+        current = {r['dir'] for r in self.results.values() if 'dir' in r}
+        removed = 0
+        for name in self.stages:
+            stage_root = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(stage_root):
+                continue
+            for entry in os.listdir(stage_root):
+                path = os.path.join(stage_root, entry)
+                if path not in current:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+def run_stage(fn, inputs, params, out):
+    # Worker side -> (summary, seconds, wall time per tool stage)
+    m = instrument.Metrics(fn.__name__)
+    start = time.perf_counter()
+    summary = fn(inputs, params, out, m)
+    return summary, time.perf_counter() - start, {k: round(v['wall_s'], 4) for k, v in m.to_dict()['stages'].items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the ROM -> content pack build with cached, parallel stages.')
+    parser.add_argument('--rom', help='NDS ROM to extract')
+    parser.add_argument('--pak-in-rom', help='Path of the pak inside the ROM, e.g. data/pack_data.pak')
+    parser.add_argument('--pak', help='Pak file (instead of --rom / --pak-in-rom)')
+    parser.add_argument('--probe', help='Corrected probe JSON for the pak (skips the probe stage)')
+    parser.add_argument('--out', default='contentpacks/poc', help='Output directory')
+    parser.add_argument('--limit', type=int, default=0, help='Max files per extract / unpack (0 = all)')
+    parser.add_argument('--max-distance', type=int, default=16, help='pick_tilemap_triplet --max-distance')
+    parser.add_argument('--top', type=int, default=0, help='pick_tilemap_triplet --top')
+    parser.add_argument('--solidity', help='Tile solidity table; adds the collision stage (see nds/build_collision.py)')
+    parser.add_argument('--room', default='poc_world', help='Room id the collision grid is written for')
+    parser.add_argument('--tile-size', type=int, default=8, help='World units per map cell in the collision grid')
+    parser.add_argument('--pack-codec', choices=['zlib', 'lzma', 'none'], default='zlib',
+                        help='Compression of the content pack entries')
+    parser.add_argument('--pack-level', type=int, default=6)
+    parser.add_argument('--pack-block-size', type=int, default=64 * 1024,
+                        help='Uncompressed bytes per independently compressed block')
+    parser.add_argument('--jobs', type=int, default=None, help='Parallel stages (default: CPU count)')
+    parser.add_argument('--force', nargs='*', default=[], metavar='STAGE', help='Re-run these stages even if cached')
+    parser.add_argument('--dry-run', action='store_true', help='Only report which stages are cached')
+    parser.add_argument('--gc', action='store_true', help='Remove cached outputs that are not current')
+    parser.add_argument('targets', nargs='*', help='Stages to build (default: all)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'pipeline')
+
+    stages = build_stages(args)
+    if not stages:
+        parser.error('nothing to do: pass --rom and/or --pak (or --pak-in-rom)')
+    os.makedirs(args.out, exist_ok=True)
+
+    pipeline = Pipeline(stages, args.out, args.jobs)
+    try:
+        with m.stage('run'):
+            ok = pipeline.run(args.targets, set(args.force), args.dry_run)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for name, r in pipeline.results.items():
+        m.count(r['status'].replace(' ', '_'))
+    if args.gc and not args.dry_run:
+        print(f"Removed {pipeline.gc()} stale cache entries.")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
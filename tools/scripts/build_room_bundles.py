@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+
+try:
+    from .. import instrument
+    from ..pack.content_pack import ContentPack, write_content_pack
+    from .validate_content_schema import iter_objects, is_content
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from tools import instrument
+    from tools.pack.content_pack import ContentPack, write_content_pack
+    from validate_content_schema import iter_objects, is_content
+
+# Per-room asset bundles with preload manifests.
+#
+# Rooms are the server's roomIds, scoped the way server/src/index.js fills them: an object
+# belongs to its own "roomId", else to its file's "roomId", else to every room. The rooms
+# bundled are --room (default poc_world, the server's default room) plus every roomId the
+# inputs name. The assets a room references, in first-use order:
+#   1. the world_objects files themselves (the client loads them before drawing anything)
+#   2. the map image: maps/<room>.png, else <room>/screen.png, else screen.png (the pipeline's
+#      render output, drawn by the client's map page)
+#   3. per object, sorted by distance from the spawn point (the centre of the server's random
+#      50-350 spawn square), so what is on screen first comes first:
+#        pickup "itemId"  -> the item's icon, a file named after the item (items/gem_ruby.png)
+#        npc "id"         -> its spritesheet from tools/nds/render_ncer_nanr.py --name <id>:
+#                            <id>.json and the pages it lists
+# An access trace (--trace, JSON lines {"room", "asset"} in request order, e.g. from a client
+# session) overrides that order for the assets it contains. References are paths under
+# --assets-root; a bare name ("gem_ruby") resolves to the only file with that stem. References
+# with no file yet (the POC content has no item icons or NPC sprites) are listed as unresolved.
+# tools/scripts/fixtures/room_bundles has a small content set that resolves all of them.
+#
+# Each room gets <out>/<room>.cpak (a content pack, see tools/pack/content_pack.py, with the
+# entries stored in that order, so a streamed download delivers them in the order they are
+# needed) and <out>/<room>.bundle.json:
+#   {"room", "bundle", "bytes", "sha256", "key", "entries": [{"name", "offset", "stored", "size", "sha256"}],
+#    "prefetch": [rooms linked by a portal "targetRoom"], "unresolved": [...]}
+# Entry offset / stored give the byte range of each entry's blocks in the bundle; the entry sha256
+# is what tools/asset_server.py uses as its ETag (and accepts as ?v= for immutable URLs). A room whose
+# inputs (assets, order, codec) are unchanged keeps its bundle.
+
+DEFAULT_ROOM = 'poc_world'
+SPAWN = (200, 200)
+MAP_IMAGES = ('maps/{room}.png', '{room}/screen.png', 'screen.png')
+
+def room_of(obj, doc):
+    return obj.get('roomId') or doc.get('roomId') or None
+
+def room_names(docs, default_rooms):
+    # -> server roomIds to bundle: the given ones plus every roomId the content scopes objects to
+    rooms = list(default_rooms)
+    for _, doc in docs:
+        for _, _, obj in iter_objects(doc):
+            room = room_of(obj, doc) if isinstance(obj, dict) else None
+            if room and room not in rooms:
+                rooms.append(room)
+    return rooms
+
+def object_refs(kind, obj):
+    if kind == 'pickup' and isinstance(obj.get('itemId'), str):
+        return [obj['itemId']]
+    if kind == 'npc' and isinstance(obj.get('id'), str):
+        return [obj['id'] + '.json']
+    return []
+
+def room_refs(docs, room):
+    # docs: [(path relative to the assets root or None, doc)] -> asset references in first-use order;
+    # a tuple is a list of alternatives (the first existing one is used)
+    refs = [rel for rel, _ in docs if rel]
+    refs.append(tuple(m.format(room=room) for m in MAP_IMAGES))
+    objects = []
+    for d, (_, doc) in enumerate(docs):
+        for i, (kind, _, obj) in enumerate(iter_objects(doc)):
+            if not isinstance(obj, dict) or room_of(obj, doc) not in (None, room):
+                continue
+            x, y = obj.get('x'), obj.get('y')
+            dist = math.hypot(x - SPAWN[0], y - SPAWN[1]) \
+                if isinstance(x, (int, float)) and isinstance(y, (int, float)) else math.inf
+            objects.append((dist, d, i, kind, obj))
+    for _, _, _, kind, obj in sorted(objects, key=lambda o: o[:3]):
+        refs += object_refs(kind, obj)
+    return list(dict.fromkeys(refs))
+
+def linked_rooms(docs, room):
+    out = []
+    for _, doc in docs:
+        for kind, _, obj in iter_objects(doc):
+            if kind != 'portal' or not isinstance(obj, dict) or room_of(obj, doc) not in (None, room):
+                continue
+            target = obj.get('targetRoom')
+            if isinstance(target, str) and target != room and target not in out:
+                out.append(target)
+    return out
+
+class AssetIndex:
+    # Resolves references to files under the assets root: exact relative path, else unique stem
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.by_stem = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for fn in sorted(filenames):
+                rel = os.path.relpath(os.path.join(dirpath, fn), root).replace(os.sep, '/')
+                self.by_stem.setdefault(os.path.splitext(fn)[0], []).append(rel)
+
+    def sheet_pages(self, name):
+        # Page images listed by a render_ncer_nanr.py spritesheet ({"pages": [[file, w, h]], "cells"}), else []
+        try:
+            with open(os.path.join(self.root, name), 'r') as f:
+                sheet = json.load(f)
+            pages = [p[0] for p in sheet['pages']] if isinstance(sheet.get('cells'), dict) else []
+        except (OSError, ValueError, AttributeError, KeyError, TypeError, IndexError):
+            return []
+        base = os.path.dirname(name)
+        return [n for n in (self.resolve(f"{base}/{p}" if base else p, exact=True) for p in pages) if n]
+
+    def resolve(self, ref, exact=False):
+        # -> relative path or None (missing or ambiguous)
+        path = os.path.realpath(os.path.join(self.root, ref))
+        if path.startswith(self.root + os.sep) and os.path.isfile(path):
+            return os.path.relpath(path, self.root).replace(os.sep, '/')
+        if exact:
+            return None
+        matches = self.by_stem.get(os.path.splitext(os.path.basename(ref))[0], [])
+        return matches[0] if len(matches) == 1 else None
+
+def load_trace(path):
+    # -> {room: [asset, ...]} in first-access order
+    out = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            seen = out.setdefault(rec['room'], [])
+            if rec['asset'] not in seen:
+                seen.append(rec['asset'])
+    return out
+
+def apply_trace(names, traced):
+    # Traced assets first, in trace order; the rest keep their static order
+    first = [n for n in traced if n in names]
+    return first + [n for n in names if n not in first]
+
+def bundle_key(root, names, codec, level):
+    h = hashlib.sha256(f"{codec}:{level}\n".encode())
+    for name in names:
+        st = os.stat(os.path.join(root, name))
+        h.update(f"{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def build_bundle(room, names, root, out_dir, prefetch, unresolved, codec='zlib', level=6, m=None):
+    # -> (manifest, rebuilt?)
+    key = bundle_key(root, names, codec, level)
+    bundle = os.path.join(out_dir, room + '.cpak')
+    manifest_path = os.path.join(out_dir, room + '.bundle.json')
+    try:
+        with open(manifest_path, 'r') as f:
+            old = json.load(f)
+        if old.get('key') == key and os.path.exists(bundle):
+            old.update(prefetch=prefetch, unresolved=unresolved)
+            with open(manifest_path, 'w') as f:
+                json.dump(old, f, indent=2)
+            return old, False
+    except (OSError, ValueError):
+        pass
+    write_content_pack([(n, os.path.join(root, n)) for n in names], bundle, codec, level, m=m)
+    entries = []
+    with ContentPack(bundle) as pack:
+        for name in names:
+            blocks = pack.entries[name]['blocks']
+            entries.append({'name': name, 'offset': blocks[0][0] if blocks else 0,
+                            'stored': sum(b[1] for b in blocks), 'size': pack.size(name),
+                            'sha256': pack.sha256(name)})
+    h = hashlib.sha256()
+    with open(bundle, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    manifest = {
+        'room': room,
+        'bundle': os.path.basename(bundle),
+        'bytes': os.path.getsize(bundle),
+        'sha256': h.hexdigest(),
+        'key': key,
+        'entries': entries,
+        'prefetch': prefetch,
+        'unresolved': unresolved,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest, True
+
+def resolve_room(index, docs, room):
+    # -> (asset names in first-use order, unresolved references)
+    names, unresolved = [], []
+    for ref in room_refs(docs, room):
+        if isinstance(ref, tuple):
+            name = next((n for n in (index.resolve(r, exact=True) for r in ref) if n), None)
+        else:
+            name = index.resolve(ref)
+        if name is None:
+            unresolved.append(' | '.join(ref) if isinstance(ref, tuple) else ref)
+            continue
+        names += [n for n in [name] + index.sheet_pages(name) if n not in names]
+    return names, unresolved
+
+def main():
+    parser = argparse.ArgumentParser(description='Bundle the assets each room references, in first-use order.')
+    parser.add_argument('inputs', nargs='+', help='world_objects JSON files (as loaded by the server)')
+    parser.add_argument('--assets-root', required=True, help='Directory asset references are relative to')
+    parser.add_argument('--out_dir', required=True)
+    parser.add_argument('--room', nargs='*', default=[DEFAULT_ROOM],
+                        help=f'Rooms to bundle besides the roomIds in the content (default: {DEFAULT_ROOM})')
+    parser.add_argument('--trace', help='Access trace (JSON lines {"room", "asset"}) to order entries by')
+    parser.add_argument('--codec', choices=['zlib', 'lzma', 'none'], default='zlib')
+    parser.add_argument('--level', type=int, default=6)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'build_room_bundles')
+
+    if not os.path.isdir(args.assets_root):
+        print(f"Error: {args.assets_root} is not a directory.")
+        sys.exit(1)
+    with m.stage('scan'):
+        index = AssetIndex(args.assets_root)
+        trace = load_trace(args.trace) if args.trace else {}
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    failed = False
+    docs = []
+    for path in args.inputs:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error: {path}: {e}")
+            failed = True
+            continue
+        if not is_content(doc):
+            print(f"Skipping {path}: not a world objects file")
+            continue
+        rel = os.path.relpath(os.path.realpath(path), index.root)
+        docs.append((None if rel.startswith('..') else rel.replace(os.sep, '/'), doc))
+
+    rooms = room_names(docs, args.room)
+    for room in rooms:
+        with m.stage('scan'):
+            names, unresolved = resolve_room(index, docs, room)
+            names = apply_trace(names, trace.get(room, []))
+            prefetch = linked_rooms(docs, room)
+        missing = [r for r in prefetch if r not in rooms]
+        if missing:
+            print(f"Warning: {room}: portals lead to rooms not among the inputs: {', '.join(missing)}")
+        with m.stage('pack'):
+            manifest, rebuilt = build_bundle(room, names, args.assets_root, args.out_dir, prefetch, unresolved,
+                                             args.codec, args.level, m)
+        m.count('rooms')
+        m.count('assets', len(names))
+        state = 'built' if rebuilt else 'unchanged'
+        print(f"{room}: {len(names)} assets, {manifest['bytes']} bytes ({state}), "
+              f"prefetch {prefetch or '-'}, {len(unresolved)} unresolved")
+        if unresolved:
+            print(f"  unresolved: {', '.join(unresolved)}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
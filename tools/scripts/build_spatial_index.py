@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+import os
+import re
+import struct
+import sys
+
+try:
+    from .. import instrument
+    from .validate_content_schema import iter_objects, is_content
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from tools import instrument
+    from validate_content_schema import iter_objects, is_content
+
+# Spatial index for world objects, built at content-build time.
+#
+# One uniform grid per room, scoped the way server/src/index.js fills rooms: an object belongs
+# to its own "roomId", else to the file's "roomId", else to every room. Each room that scoped
+# objects name gets a grid of those plus the shared ones; "*" holds the shared objects alone,
+# for every other room. Grids are stored CSR-style: objects sorted by cell,
+# cellStart[c]..cellStart[c + 1] is the slice of `items` in cell c (c = cy * cols + cx). A
+# collision / interest query of radius r visits the cells overlapping the query square widened
+# by the largest object extent, [x - r - e, x + r + e] x [y - r - e, y + r + e], instead of
+# every object.
+#
+# The cell size follows object density: sqrt(occupied area * target per cell / objects),
+# clamped to at least the side of that widened square, 2 * (r + e), so a query touches at
+# most 2x2 cells, and rounded up to a multiple of 16.
+#
+# Output next to the input (or in --out_dir): <name>.grid.json ({"version": 2, "rooms":
+# {room: grid}}), read by server/src/index.js, and one binary file per room with the same data,
+# <name>.grid.bin for "*" and <name>.grid.<room>.bin for the others:
+#   header  '<4sHHIIIIIIf' magic 'SGI1', version, 0, cell size, cols, rows, width, height,
+#           object count, max extent (largest portal width / height, for widening queries)
+#   objects count x '<ffB' (x, y, type), then u32 cellStart[cols * rows + 1], u32 items[count]
+#   ids     count x (u16 length, utf-8 bytes)
+
+TYPES = {'portal': 0, 'npc': 1, 'pickup': 2}
+BIN_HEADER = struct.Struct('<4sHHIIIIIIf')
+BIN_MAGIC = b'SGI1'
+
+def collect_objects(doc):
+    # -> [(id, type code, x, y, extent, room or None)] for every well-formed object
+    out = []
+    for kind, _, obj in iter_objects(doc):
+        if kind not in TYPES or not isinstance(obj, dict):
+            continue
+        x, y = obj.get('x'), obj.get('y')
+        if not isinstance(obj.get('id'), str) or not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+            continue
+        extent = max(obj.get('width', 0) or 0, obj.get('height', 0) or 0)
+        room = obj.get('roomId') or doc.get('roomId') or None
+        out.append((obj['id'], TYPES[kind], float(x), float(y), float(extent), room))
+    return out
+
+def choose_cell_size(objects, query_radius=50, target=8, max_cell=1024):
+    min_cell = 2 * (query_radius + max((o[4] for o in objects), default=0.0))
+    if not objects:
+        return max(min_cell, 16)
+    xs = [o[2] for o in objects]
+    ys = [o[3] for o in objects]
+    area = (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+    cell = math.sqrt(area * target / len(objects))
+    cell = min(max(cell, min_cell), max(max_cell, min_cell))
+    return int(math.ceil(cell / 16) * 16)
+
+def build_grid(objects, width, height, cell_size):
+    cols = max(1, int(math.ceil(width / cell_size)))
+    rows = max(1, int(math.ceil(height / cell_size)))
+    counts = [0] * (cols * rows)
+    cell_of = []
+    for _, _, x, y, _, _ in objects:
+        # Objects outside the world are clamped into the edge cells
+        cx = min(max(int(x // cell_size), 0), cols - 1)
+        cy = min(max(int(y // cell_size), 0), rows - 1)
+        c = cy * cols + cx
+        cell_of.append(c)
+        counts[c] += 1
+    cell_start = [0] * (cols * rows + 1)
+    for c, n in enumerate(counts):
+        cell_start[c + 1] = cell_start[c] + n
+    fill = cell_start[:-1]
+    items = [0] * len(objects)
+    for i, c in enumerate(cell_of):
+        items[fill[c]] = i
+        fill[c] += 1
+    return {
+        'cellSize': cell_size,
+        'cols': cols,
+        'rows': rows,
+        'cellStart': cell_start,
+        'items': items,
+        'occupied': sum(1 for n in counts if n),
+        'maxPerCell': max(counts) if counts else 0,
+    }
+
+def query(index, x, y, r):
+    # -> object indexes within r of (x, y); reference implementation of the server lookup
+    cs, cols, rows = index['cellSize'], index['cols'], index['rows']
+    r2 = r + index['maxExtent']
+    x0, x1 = max(int((x - r2) // cs), 0), min(int((x + r2) // cs), cols - 1)
+    y0, y1 = max(int((y - r2) // cs), 0), min(int((y + r2) // cs), rows - 1)
+    out = []
+    for cy in range(y0, y1 + 1):
+        base = cy * cols
+        for c in range(base + x0, base + x1 + 1):
+            for i in index['items'][index['cellStart'][c]:index['cellStart'][c + 1]]:
+                dx = index['x'][i] - x
+                dy = index['y'][i] - y
+                if dx * dx + dy * dy < r * r:
+                    out.append(i)
+    return out
+
+def build_index(objects, room, width, height, query_radius=50, target=8, cell_size=None):
+    cell = cell_size or choose_cell_size(objects, query_radius, target)
+    grid = build_grid(objects, width, height, cell)
+    return dict({
+        'room': room,
+        'width': width,
+        'height': height,
+        'queryRadius': query_radius,
+        'maxExtent': max((o[4] for o in objects), default=0.0),
+        'count': len(objects),
+        'ids': [o[0] for o in objects],
+        'types': [o[1] for o in objects],
+        'x': [o[2] for o in objects],
+        'y': [o[3] for o in objects],
+    }, **grid)
+
+def build_room_indexes(doc, width, height, query_radius=50, target=8, cell_size=None):
+    # -> {room: index}; "*" (shared objects only) is left out when every object is scoped
+    objects = collect_objects(doc)
+    shared = [o for o in objects if o[5] is None]
+    rooms = sorted({o[5] for o in objects if o[5] is not None})
+    indexes = {}
+    if shared or not rooms:
+        indexes['*'] = build_index(shared, '*', width, height, query_radius, target, cell_size)
+    for room in rooms:
+        scoped = [o for o in objects if o[5] in (None, room)]
+        indexes[room] = build_index(scoped, room, width, height, query_radius, target, cell_size)
+    return indexes
+
+def encode_binary(index):
+    out = bytearray(BIN_HEADER.pack(BIN_MAGIC, 1, 0, index['cellSize'], index['cols'], index['rows'],
+                                    index['width'], index['height'], index['count'], index['maxExtent']))
+    rec = struct.Struct('<ffB')
+    for x, y, t in zip(index['x'], index['y'], index['types']):
+        out += rec.pack(x, y, t)
+    out += struct.pack(f"<{len(index['cellStart'])}I", *index['cellStart'])
+    out += struct.pack(f"<{len(index['items'])}I", *index['items'])
+    for oid in index['ids']:
+        raw = oid.encode('utf-8')
+        out += struct.pack('<H', len(raw)) + raw
+    return bytes(out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build per-room uniform-grid spatial indexes for world objects.')
+    parser.add_argument('inputs', nargs='+', help='world_objects JSON files (one room each)')
+    parser.add_argument('--out_dir', help='Output directory (default: next to each input)')
+    parser.add_argument('--world-width', type=int, default=5000)
+    parser.add_argument('--world-height', type=int, default=5000)
+    parser.add_argument('--query-radius', type=int, default=50, help='Pickup / interaction radius used by the server')
+    parser.add_argument('--target', type=int, default=8, help='Target objects per occupied cell')
+    parser.add_argument('--cell-size', type=int, help='Fixed cell size instead of the density-based choice')
+    parser.add_argument('--format', choices=['json', 'bin', 'both'], default='both')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'build_spatial_index')
+
+    failed = False
+    for path in args.inputs:
+        try:
+            with m.stage('read'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    doc = json.load(f)
+                m.read(os.path.getsize(path))
+        except (OSError, ValueError) as e:
+            print(f"Error: {path}: {e}")
+            failed = True
+            continue
+        if not is_content(doc):
+            print(f"Skipping {path}: not a world objects file")
+            continue
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        with m.stage('build'):
+            indexes = build_room_indexes(doc, args.world_width, args.world_height,
+                                         args.query_radius, args.target, args.cell_size)
+        m.count('files')
+        m.count('rooms', len(indexes))
+        m.count('objects', sum(index['count'] for index in indexes.values()))
+        out_dir = args.out_dir or os.path.dirname(path) or '.'
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, stem + '.grid')
+        with m.stage('write'):
+            if args.format in ('json', 'both'):
+                with open(base + '.json', 'w') as f:
+                    m.wrote(f.write(json.dumps({'version': 2, 'rooms': indexes}, separators=(',', ':'))))
+            if args.format in ('bin', 'both'):
+                for room, index in indexes.items():
+                    suffix = '' if room == '*' else '.' + re.sub(r'[^\w-]', '_', room)
+                    with open(base + suffix + '.bin', 'wb') as f:
+                        m.wrote(f.write(encode_binary(index)))
+
+        for room, index in indexes.items():
+            per_cell = index['count'] / index['occupied'] if index['occupied'] else 0
+            print(f"{stem} [{room}]: {index['count']} objects, cell {index['cellSize']} ({index['cols']}x{index['rows']}), "
+                  f"{index['occupied']} occupied, {per_cell:.1f} avg / {index['maxPerCell']} max per cell")
+        print(f"  -> {base}.*")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import argparse
+import fnmatch
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from tools import instrument
+
+# Offline compaction of the game server's player state (server/src/persistence.js).
+#
+# Reads the current state the way the server does: world_state.snapshot.json (or, before the first
+# compaction, the old whole-map world_state.json) with world_state.log replayed over it (JSON lines
+# {"k": playerKey, ...changed fields}; a torn last line is skipped). Writes:
+#   world_state.snapshot.json   {"version": 1, "compactedAt", "rooms": {roomId: players},
+#                               "players": {playerKey: state}}, no indentation, positions
+#                               rounded to --precision decimals
+#   world_state.log             emptied (lines the server appended during the run are kept)
+#   <shards>/<room>.json        {"version": 1, "room", "players"} per roomId, with index.json
+#                               {roomId: {"file", "players"}}; shards of rooms that are gone
+#                               are removed
+# world_state.json is renamed to world_state.json.migrated once a snapshot replaces it. Run it
+# while the server is stopped: a running server keeps pruned players in memory and writes them
+# back at its next compaction.
+#
+# Pruning: an entry goes when it is older (now - ts) than its maximum age, the smallest of the
+# policy default and the first matching rule in "keys" (playerKey glob) and in "rooms" (roomId
+# glob). maxAgeDays 0 drops every match; entries without a ts count as infinitely old.
+
+SNAPSHOT = 'world_state.snapshot.json'
+LOG = 'world_state.log'
+LEGACY = 'world_state.json'
+DAY_MS = 24 * 3600 * 1000
+DEFAULT_POLICY = {
+    'maxAgeDays': 180,
+    'keys': [
+        {'match': 'bot_persist_test_*', 'maxAgeDays': 1},  # tools/w2_persistence_test.js
+        {'match': 'loadgen-*', 'maxAgeDays': 1},           # tools/bench/ws_load.py
+        {'match': 'pk-*', 'maxAgeDays': 30},               # players who connected without a playerKey
+    ],
+    'rooms': [
+        {'match': '*test*', 'maxAgeDays': 1},
+    ],
+}
+
+def read_log(path):
+    # -> (entries [(key, fields)], bytes read)
+    entries = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    for line in data.split(b'\n'):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(rec, dict) and 'k' in rec:
+            key = rec.pop('k')
+            entries.append((key, rec))
+    return entries, len(data)
+
+def load_state(data_dir):
+    # -> (state, base file or None, log entries replayed, log bytes read)
+    snapshot, legacy, log = (os.path.join(data_dir, n) for n in (SNAPSHOT, LEGACY, LOG))
+    base = snapshot if os.path.exists(snapshot) else legacy if os.path.exists(legacy) else None
+    state = {}
+    if base:
+        with open(base, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        state = doc.get('players', {}) if base == snapshot else doc
+    replayed, log_size = [], 0
+    if os.path.exists(log):
+        replayed, log_size = read_log(log)
+        for key, fields in replayed:
+            state.setdefault(key, {}).update(fields)
+    return state, base, len(replayed), log_size
+
+def first_match(rules, value):
+    for rule in rules:
+        if fnmatch.fnmatchcase(value, rule['match']):
+            return rule
+    return None
+
+def prune(state, policy, now_ms):
+    # -> (kept state, {rule label: pruned count})
+    kept, pruned = {}, {}
+    for key, entry in state.items():
+        limits = [('maxAgeDays', policy.get('maxAgeDays'))]
+        rule = first_match(policy.get('keys', []), key)
+        if rule:
+            limits.append((f"key {rule['match']}", rule['maxAgeDays']))
+        rule = first_match(policy.get('rooms', []), str(entry.get('roomId', '')))
+        if rule:
+            limits.append((f"room {rule['match']}", rule['maxAgeDays']))
+        limits = [(label, days) for label, days in limits if days is not None]
+        ts = entry.get('ts')
+        age = now_ms - ts if isinstance(ts, (int, float)) else float('inf')
+        if limits:
+            label, days = min(limits, key=lambda l: l[1])
+            if age > days * DAY_MS or days == 0:
+                pruned[label] = pruned.get(label, 0) + 1
+                continue
+        kept[key] = entry
+    return kept, pruned
+
+def round_positions(state, precision):
+    if precision < 0:
+        return
+    for entry in state.values():
+        for axis in ('x', 'y'):
+            if isinstance(entry.get(axis), float):
+                entry[axis] = round(entry[axis], precision)
+
+def shard_name(room):
+    return re.sub(r'[^\w-]', '_', room) or '_'
+
+def write_json(path, doc):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, separators=(',', ':'), ensure_ascii=False)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+def write_shards(state, shard_dir):
+    # -> {room: {"file", "players"}}; shards listed in the previous index but not this one are removed
+    by_room = {}
+    for key, entry in state.items():
+        by_room.setdefault(str(entry.get('roomId', '')), {})[key] = entry
+    os.makedirs(shard_dir, exist_ok=True)
+    index_path = os.path.join(shard_dir, 'index.json')
+    try:
+        with open(index_path, 'r') as f:
+            old = {v['file'] for v in json.load(f).values()}
+    except (OSError, ValueError, AttributeError, KeyError, TypeError):
+        old = set()
+    index, used = {}, set()
+    for room in sorted(by_room):
+        name = shard_name(room)
+        while name + '.json' in used:
+            name += '_'
+        used.add(name + '.json')
+        write_json(os.path.join(shard_dir, name + '.json'), {'version': 1, 'room': room, 'players': by_room[room]})
+        index[room] = {'file': name + '.json', 'players': len(by_room[room])}
+    for stale in old - used:
+        try:
+            os.remove(os.path.join(shard_dir, stale))
+        except OSError:
+            pass
+    write_json(index_path, index)
+    return index
+
+def restart_log(log_path, consumed):
+    # Replaces the log with whatever was appended after the first `consumed` bytes
+    tail = b''
+    if os.path.exists(log_path):
+        with open(log_path, 'rb') as f:
+            f.seek(consumed)
+            tail = f.read()
+    tmp = log_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(tail)
+    os.replace(tmp, log_path)
+    return len(tail)
+
+def load_policy(path, max_age_days):
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if path:
+        with open(path, 'r') as f:
+            policy.update(json.load(f))
+    if max_age_days is not None:
+        policy['maxAgeDays'] = max_age_days
+    for section in ('keys', 'rooms'):
+        for rule in policy.get(section, []):
+            if not isinstance(rule.get('match'), str) or not isinstance(rule.get('maxAgeDays'), (int, float)):
+                raise ValueError(f"{section} rule needs a string 'match' and a number 'maxAgeDays': {rule}")
+    return policy
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact world_state persistence into a pruned snapshot and per-room shards.')
+    parser.add_argument('--data', default='server/data', help='Server data directory (default: server/data)')
+    parser.add_argument('--shards', help='Per-room shard directory (default: <data>/rooms)')
+    parser.add_argument('--policy', help='Pruning policy JSON (same shape as DEFAULT_POLICY; replaces its keys)')
+    parser.add_argument('--max-age-days', type=float, help='Default maximum age (overrides the policy)')
+    parser.add_argument('--now', type=int, help='Reference time in ms (default: now)')
+    parser.add_argument('--precision', type=int, default=2, help='Decimals kept for x / y (-1: keep all)')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be pruned, write nothing')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'compact_world_state')
+
+    if not os.path.isdir(args.data):
+        print(f"Error: {args.data} is not a directory.")
+        sys.exit(1)
+    try:
+        with m.stage('read'):
+            policy = load_policy(args.policy, args.max_age_days)
+            state, base, replayed, log_size = load_state(args.data)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if base is None and not replayed:
+        print(f"Nothing to compact in {args.data}.")
+        return
+
+    before = m.read((os.path.getsize(base) if base else 0) + log_size)
+    now_ms = args.now if args.now is not None else int(time.time() * 1000)
+    with m.stage('prune'):
+        kept, pruned = prune(state, policy, now_ms)
+    m.count('players', len(state))
+    m.count('log_lines', replayed)
+    m.count('pruned', len(state) - len(kept))
+    print(f"{len(state)} players ({os.path.basename(base) if base else 'no snapshot'} + {replayed} log lines), "
+          f"{len(kept)} kept, {len(state) - len(kept)} pruned")
+    for label, n in sorted(pruned.items(), key=lambda p: -p[1]):
+        print(f"  {n:>6}  {label}")
+    if args.dry_run:
+        return
+
+    with m.stage('write'):
+        round_positions(kept, args.precision)
+        index = write_shards(kept, args.shards or os.path.join(args.data, 'rooms'))
+        after = m.wrote(write_json(os.path.join(args.data, SNAPSHOT), {
+            'version': 1,
+            'compactedAt': now_ms,
+            'rooms': {room: v['players'] for room, v in index.items()},
+            'players': kept,
+        }))
+        tail = restart_log(os.path.join(args.data, LOG), log_size)
+    m.count('rooms', len(index))
+    if tail:
+        print(f"Warning: {tail} bytes were appended to {LOG} during compaction (is the server running?); kept them")
+    if base and os.path.basename(base) == LEGACY:
+        os.replace(base, base + '.migrated')
+    print(f"{before} -> {after} bytes; {len(index)} room shards")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from tools import instrument
+
+# Fixed-size record scanner: finds entity / pickup tables in extracted game files.
+#
+# A layout declares the record: 'name:type[:lo:hi]' fields and 'pad:N' gaps, comma separated
+# (types u8 s8 u16 s16 u32 s32, little-endian). Fields with a range are the plausibility
+# filters; the stride defaults to the layout size. Each file is memory-mapped and scanned at
+# every alignment phase (step --align) as an array of records, in two passes:
+#
+#   1. Whole-file prefilter without a Python loop per record: for every ranged field, the
+#      column of its most significant byte (mm[phase + offset::stride]) is mapped through a
+#      256-entry table (bytes.translate) to a 0/1 mask of "this high byte can lie in range";
+#      masks are ANDed as big integers, together with a "checked fields not all zero" mask.
+#      Runs of at least --min-run consecutive passing records (re.finditer over the mask)
+#      are the stride-consistent stretches.
+#   2. Exact check of those runs only (struct.iter_unpack): full range test per field, runs
+#      split at failing records.
+#
+# Surviving runs are scored (0..1) on length, distinct positions, unique / ascending ids and
+# a count header just before the table, overlapping candidates from different phases are
+# reduced to the best one, and each candidate carries its provenance
+# ({file, offset, recordLen, confidence}, as in world_objects "source"). --emit-objects writes
+# the records of the top candidates as world_objects pickups (layout needs x and y fields).
+
+LAYOUTS = {
+    # 16-byte records, as planned in world_objects_generated.json (recordLen 16)
+    'entity16': 'id:u16:1:2047,kind:u16:0:255,x:u16:0:4095,y:u16:0:4095,pad:8',
+    'entity12': 'kind:u16:0:255,id:u16:1:2047,x:u16:0:4095,y:u16:0:4095,pad:4',
+    'pos8': 'x:u16:0:4095,y:u16:0:4095,id:u16:1:2047,kind:u16:0:255',
+}
+TYPES = {
+    'u8': ('B', 1), 's8': ('b', 1),
+    'u16': ('H', 2), 's16': ('h', 2),
+    'u32': ('I', 4), 's32': ('i', 4),
+}
+# Graphics / text / sound containers never hold entity tables
+SKIP_MAGICS = (b'NFTR', b'RGCN', b'RLCN', b'RCSN', b'RNAN', b'RECN', b'BTX0', b'BMD0', b'SDAT', b'MESG')
+SCORE_WEIGHTS = {'length': 0.35, 'distinct': 0.35, 'ids': 0.15, 'header': 0.15}
+
+def parse_layout(spec):
+    # -> (fields [{'name', 'type', 'offset', 'size', 'signed', 'lo', 'hi'}], record size)
+    spec = LAYOUTS.get(spec, spec)
+    fields = []
+    offset = 0
+    for part in spec.split(','):
+        bits = part.strip().split(':')
+        if bits[0] == 'pad':
+            if len(bits) != 2 or not bits[1].isdigit():
+                raise ValueError(f"bad padding '{part}' (pad:N)")
+            offset += int(bits[1])
+            continue
+        if len(bits) not in (2, 4) or bits[1] not in TYPES:
+            raise ValueError(f"bad field '{part}' (name:type[:lo:hi], type one of {', '.join(TYPES)})")
+        code, size = TYPES[bits[1]]
+        field = {'name': bits[0], 'type': bits[1], 'code': code, 'offset': offset, 'size': size,
+                 'signed': bits[1][0] == 's', 'lo': None, 'hi': None}
+        if len(bits) == 4:
+            field['lo'], field['hi'] = int(bits[2], 0), int(bits[3], 0)
+            if field['lo'] > field['hi']:
+                raise ValueError(f"empty range in '{part}'")
+        fields.append(field)
+        offset += size
+    if not fields:
+        raise ValueError("layout has no fields")
+    return fields, offset
+
+def record_struct(fields, stride):
+    # '<' + field codes with 'x' padding for the gaps, padded to the stride
+    fmt = '<'
+    pos = 0
+    for f in sorted(fields, key=lambda f: f['offset']):
+        fmt += 'x' * (f['offset'] - pos) + f['code']
+        pos = f['offset'] + f['size']
+    if pos > stride:
+        raise ValueError(f"layout needs {pos} bytes, stride is {stride}")
+    return struct.Struct(fmt + 'x' * (stride - pos))
+
+def high_byte_table(field):
+    # 256-byte translate table: 1 where a value with that most significant byte can be in range
+    shift = 8 * (field['size'] - 1)
+    span = 1 << shift
+    table = bytearray(256)
+    for b in range(256):
+        top = b - 256 if field['signed'] and b >= 128 else b
+        lo = top * span
+        if lo <= field['hi'] and lo + span - 1 >= field['lo']:
+            table[b] = 1
+    return bytes(table)
+
+NONZERO = bytes([0] + [1] * 255)
+
+def prefilter(mm, phase, n, stride, checked):
+    # -> 0/1 mask (bytes, one per record) of records whose high bytes are plausible and whose
+    #    checked fields are not all zero
+    stop = phase + n * stride
+    mask = (1 << (8 * n)) - 1
+    nonzero = 0
+    for f, table in checked:
+        base = phase + f['offset']
+        top = mm[base + f['size'] - 1:stop:stride]
+        mask &= int.from_bytes(top.translate(table), 'little')
+        for k in range(f['size']):
+            nonzero |= int.from_bytes(mm[base + k:stop:stride].translate(NONZERO), 'little')
+    return (mask & nonzero).to_bytes(n, 'little')
+
+def exact_runs(mm, phase, stride, rec, fields, checked_idx, start, end, min_run):
+    # -> [(first record, [values...])] sub-runs of [start, end) whose records pass every range
+    out = []
+    cur_start, cur = start, []
+    lo = [fields[i]['lo'] for i in checked_idx]
+    hi = [fields[i]['hi'] for i in checked_idx]
+    view = mm[phase + start * stride:phase + end * stride]
+    for i, values in enumerate(rec.iter_unpack(view), start):
+        ok = any(values[j] for j in checked_idx)
+        if ok:
+            for j, a, b in zip(checked_idx, lo, hi):
+                if not a <= values[j] <= b:
+                    ok = False
+                    break
+        if ok:
+            cur.append(values)
+            continue
+        if len(cur) >= min_run:
+            out.append((cur_start, cur))
+        cur_start, cur = i + 1, []
+    if len(cur) >= min_run:
+        out.append((cur_start, cur))
+    return out
+
+def score_run(mm, offset, records, fields, max_len=64):
+    names = [f['name'] for f in fields]
+    n = len(records)
+    parts = {'length': min(1.0, math.log2(n) / math.log2(max_len))}
+    if 'x' in names and 'y' in names:
+        ix, iy = names.index('x'), names.index('y')
+        parts['distinct'] = len({(r[ix], r[iy]) for r in records}) / n
+    else:
+        parts['distinct'] = len(set(records)) / n
+    if 'id' in names:
+        ids = [r[names.index('id')] for r in records]
+        unique = len(set(ids)) == n
+        ascending = all(a < b for a, b in zip(ids, ids[1:]))
+        parts['ids'] = 1.0 if ascending else (0.5 if unique else 0.0)
+    else:
+        parts['ids'] = 0.5
+    # Tables are often preceded by their record count (u32 or u16)
+    parts['header'] = 0.0
+    if offset >= 4 and struct.unpack_from('<I', mm, offset - 4)[0] == n:
+        parts['header'] = 1.0
+    elif offset >= 2 and struct.unpack_from('<H', mm, offset - 2)[0] == n:
+        parts['header'] = 1.0
+    score = sum(SCORE_WEIGHTS[k] * v for k, v in parts.items())
+    return round(score, 4), {k: round(v, 3) for k, v in parts.items()}
+
+def dedupe(candidates):
+    # Keep the best-scored candidate of every overlapping group (same table seen at other phases)
+    kept = []
+    for c in sorted(candidates, key=lambda c: (-c['score'], c['offset'])):
+        end = c['offset'] + c['count'] * c['recordLen']
+        if any(c['offset'] < k['offset'] + k['count'] * k['recordLen'] and k['offset'] < end for k in kept):
+            continue
+        kept.append(c)
+    return kept
+
+def scan_file(path, name, fields, stride, align=2, min_run=4, skip_magics=SKIP_MAGICS):
+    # -> (candidates, records scanned); candidates carry their records under 'records'
+    size = os.path.getsize(path)
+    if size < stride * min_run:
+        return [], 0
+    rec = record_struct(fields, stride)
+    checked_idx = [i for i, f in enumerate(fields) if f['lo'] is not None]
+    checked = [(fields[i], high_byte_table(fields[i])) for i in checked_idx]
+    if not checked:
+        raise ValueError("layout has no ranged fields to filter on")
+    pattern = re.compile(b'\x01{%d,}' % min_run)
+    out = []
+    scanned = 0
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if skip_magics and mm[:4] in skip_magics:
+            return [], 0
+        for phase in range(0, stride, align):
+            n = (size - phase) // stride
+            if n < min_run:
+                continue
+            scanned += n
+            mask = prefilter(mm, phase, n, stride, checked)
+            for hit in pattern.finditer(mask):
+                for first, records in exact_runs(mm, phase, stride, rec, fields, checked_idx,
+                                                 hit.start(), hit.end(), min_run):
+                    offset = phase + first * stride
+                    score, parts = score_run(mm, offset, records, fields)
+                    out.append({
+                        'file': name,
+                        'offset': offset,
+                        'recordLen': stride,
+                        'count': len(records),
+                        'score': score,
+                        'scoreParts': parts,
+                        'records': records,
+                    })
+    return dedupe(out), scanned
+
+def iter_files(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    full = os.path.join(dirpath, fn)
+                    yield full, os.path.relpath(full, p)
+        else:
+            yield p, os.path.basename(p)
+
+def scan_paths(paths, fields, stride, align=2, min_run=4, min_score=0.0, skip_magics=SKIP_MAGICS, m=None):
+    # -> (candidates sorted by score, stats)
+    m = m or instrument.Metrics('scan_records')
+    stats = {'files': 0, 'bytes': 0, 'records': 0, 'skipped': 0}
+    candidates = []
+    for path, name in iter_files(paths):
+        try:
+            with m.stage('scan'):
+                found, scanned = scan_file(path, name, fields, stride, align, min_run, skip_magics)
+        except OSError as e:
+            print(f"Warning: {path}: {e}", file=sys.stderr)
+            stats['skipped'] += 1
+            continue
+        stats['files'] += 1
+        stats['bytes'] += os.path.getsize(path)
+        stats['records'] += scanned
+        m.read(os.path.getsize(path))
+        candidates.extend(c for c in found if c['score'] >= min_score)
+    candidates.sort(key=lambda c: (-c['score'], c['file'], c['offset']))
+    m.count('files', stats['files'])
+    m.count('records', stats['records'])
+    m.count('candidates', len(candidates))
+    return candidates, stats
+
+def to_objects(candidates, fields, limit):
+    # World objects (pickups) for the records of the top candidates, with their provenance
+    names = [f['name'] for f in fields]
+    if 'x' not in names or 'y' not in names:
+        raise ValueError("--emit-objects needs x and y fields in the layout")
+    ix, iy = names.index('x'), names.index('y')
+    pickups = []
+    for c in candidates[:limit]:
+        stem = os.path.splitext(os.path.basename(c['file']))[0]
+        # The same stem turns up in several directories of an unpacked pak: tag ids with the path
+        tag = hashlib.sha1(c['file'].replace(os.sep, '/').encode('utf-8')).hexdigest()[:6]
+        for k, r in enumerate(c['records']):
+            offset = c['offset'] + k * c['recordLen']
+            obj = {
+                'id': f"scan_{stem}_{tag}_{offset:x}",
+                'x': r[ix],
+                'y': r[iy],
+                'source': {'file': c['file'], 'offset': offset, 'recordLen': c['recordLen'],
+                           'confidence': c['score']},
+            }
+            if 'id' in names:
+                obj['label'] = f"{stem} #{r[names.index('id')]}"
+            pickups.append(obj)
+    return {'portals': [], 'npcs': [], 'pickups': pickups}
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan extracted files for fixed-size entity record tables.')
+    parser.add_argument('paths', nargs='*', default=['contentpacks/poc/unpacked_v2'],
+                        help='Files or directories to scan (default: contentpacks/poc/unpacked_v2)')
+    parser.add_argument('--layout', default='entity16',
+                        help=f"Record layout: a preset ({', '.join(LAYOUTS)}) or 'name:type[:lo:hi],pad:N,...'")
+    parser.add_argument('--stride', type=int, help='Record size (default: layout size)')
+    parser.add_argument('--align', type=int, default=2, help='Phase step for table starts (default: 2)')
+    parser.add_argument('--min-run', type=int, default=4, help='Minimum consecutive plausible records')
+    parser.add_argument('--min-score', type=float, default=0.5)
+    parser.add_argument('--top', type=int, default=50, help='Candidates to keep in the output')
+    parser.add_argument('--all-files', action='store_true', help='Also scan graphics / text / sound containers')
+    parser.add_argument('--out', default='contentpacks/poc/world/generated/candidates_records.json')
+    parser.add_argument('--emit-objects', help='Write the top candidates\' records as world_objects pickups here')
+    parser.add_argument('--emit-top', type=int, default=1, help='Candidates to include in --emit-objects')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'scan_records')
+
+    try:
+        fields, size = parse_layout(args.layout)
+        stride = args.stride or size
+        record_struct(fields, stride)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    missing = [p for p in args.paths if not os.path.exists(p)]
+    if missing:
+        print(f"Error: not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    candidates, stats = scan_paths(args.paths, fields, stride, max(1, args.align), max(1, args.min_run),
+                                   args.min_score, () if args.all_files else SKIP_MAGICS, m)
+    elapsed = time.perf_counter() - t0
+
+    top = candidates[:args.top]
+    names = [f['name'] for f in fields]
+    doc = {
+        'layout': args.layout,
+        'fields': [{k: f[k] for k in ('name', 'type', 'offset', 'lo', 'hi')} for f in fields],
+        'recordLen': stride,
+        'stats': dict(stats, candidates=len(candidates), seconds=round(elapsed, 3)),
+        'candidates': [dict({k: v for k, v in c.items() if k != 'records'},
+                            source={'file': c['file'], 'offset': c['offset'], 'recordLen': c['recordLen'],
+                                    'confidence': c['score']},
+                            sample=[dict(zip(names, r)) for r in c['records'][:8]])
+                       for c in top],
+    }
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with m.stage('write'):
+        with open(args.out, 'w') as f:
+            json.dump(doc, f, indent=2)
+
+    for c in top[:10]:
+        print(f"{c['score']:.3f}  {c['file']} @0x{c['offset']:x}  {c['count']} x {c['recordLen']} bytes")
+    print(f"Scanned {stats['records']} records in {stats['files']} files ({stats['bytes']} bytes) "
+          f"in {elapsed:.2f}s: {len(candidates)} candidates -> {args.out}")
+
+    if args.emit_objects:
+        try:
+            objects = to_objects(candidates, fields, args.emit_top)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        os.makedirs(os.path.dirname(args.emit_objects) or '.', exist_ok=True)
+        with m.stage('write'):
+            with open(args.emit_objects, 'w') as f:
+                json.dump(objects, f, indent=2)
+        print(f"Wrote {len(objects['pickups'])} pickups -> {args.emit_objects}")
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,404 @@
-print("TODO: Implement content schema validation")
-exit(0)
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+try:
+    from .. import instrument
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from tools import instrument
+
+# Content schema validator for world_objects.json-style content.
+#
+# Accepts both layouts the tools write: {"portals": [...], "npcs": [...], "pickups": [...]}
+# and {"objects": [...]} with a "type" per object. JSON files of any other shape under the
+# given paths (traces, candidate lists) are ignored.
+#
+# SCHEMAS is compiled once into nested checker closures (compile_schema); checking an
+# object is then a chain of direct calls with no spec interpretation. After the schema pass
+# come the cross-reference checks: unique ids per file, positions and portal targets inside
+# the world bounds, itemIds present in the item catalog, and source.offset (+ recordLen)
+# inside the file it references.
+#
+# Results are cached per file by content hash (plus a hash of everything the checks depend
+# on: this script, bounds, item catalog, source roots), and the sizes of referenced source files are
+# re-checked with stat(), so an unchanged content set re-validates without parsing anything.
+
+# Field spec: type name ('str', 'int', 'num', 'bool', 'any', 'uint', 'pos'), a ('literal', value)
+# or ('oneof', spec, ...) tuple, a dict (object; 'name?' = optional field) or [spec] (list).
+POINT = {'x': 'num', 'y': 'num'}
+SOURCE = {
+    'file': 'str',
+    'offset?': 'uint',
+    'recordLen?': 'pos',
+    'confidence?': ('oneof', 'str', 'num'),
+    'id?': 'str',
+}
+SCHEMAS = {
+    'portal': {
+        'id': 'str',
+        'type?': ('literal', 'portal'),
+        'x': 'num',
+        'y': 'num',
+        'width?': 'pos',
+        'height?': 'pos',
+        'target': POINT,
+        'targetRoom?': 'str',
+        'label?': 'str',
+        'roomId?': 'str',
+        'source?': SOURCE,
+    },
+    'npc': {
+        'id': 'str',
+        'type?': ('literal', 'npc'),
+        'x': 'num',
+        'y': 'num',
+        'name?': 'str',
+        'dialog?': 'str',
+        'roomId?': 'str',
+        'source?': SOURCE,
+    },
+    'pickup': {
+        'id': 'str',
+        'type?': ('literal', 'pickup'),
+        'x': 'num',
+        'y': 'num',
+        'itemId?': 'str',
+        'label?': 'str',
+        'name?': 'str',
+        'active?': 'bool',
+        'roomId?': 'str',
+        'source?': SOURCE,
+    },
+}
+SECTIONS = {'portals': 'portal', 'npcs': 'npc', 'pickups': 'pickup'}
+
+def _is_num(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _is_int(v):
+    return isinstance(v, int) and not isinstance(v, bool)
+
+SCALARS = {
+    'str': (lambda v: isinstance(v, str), 'string'),
+    'num': (_is_num, 'number'),
+    'int': (_is_int, 'integer'),
+    'uint': (lambda v: _is_int(v) and v >= 0, 'integer >= 0'),
+    'pos': (lambda v: _is_num(v) and v > 0, 'number > 0'),
+    'bool': (lambda v: isinstance(v, bool), 'boolean'),
+    'any': (lambda v: True, 'anything'),
+}
+
+def compile_schema(spec):
+    # -> check(value, path, errors); path is only formatted when something fails
+    if isinstance(spec, str):
+        test, expected = SCALARS[spec]
+        def check(value, path, errors):
+            if not test(value):
+                errors.append(f"{path}: expected {expected}, got {json.dumps(value)[:40]}")
+        check.test = test
+        return check
+    if isinstance(spec, tuple) and spec[0] == 'literal':
+        literal = spec[1]
+        def check(value, path, errors):
+            if value != literal:
+                errors.append(f"{path}: expected {json.dumps(literal)}, got {json.dumps(value)[:40]}")
+        return check
+    if isinstance(spec, tuple) and spec[0] == 'oneof':
+        tests = [SCALARS[s][0] for s in spec[1:]]
+        expected = ' or '.join(SCALARS[s][1] for s in spec[1:])
+        def check(value, path, errors):
+            if not any(t(value) for t in tests):
+                errors.append(f"{path}: expected {expected}, got {json.dumps(value)[:40]}")
+        return check
+    if isinstance(spec, list):
+        item = compile_schema(spec[0])
+        def check(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected list")
+                return
+            for i, v in enumerate(value):
+                item(v, f"{path}[{i}]", errors)
+        return check
+    if isinstance(spec, dict):
+        required = []
+        fields = []
+        for name, sub in spec.items():
+            optional = name.endswith('?')
+            name = name.rstrip('?')
+            if not optional:
+                required.append(name)
+            checker = compile_schema(sub)
+            # Scalar fields are tested inline; the path string is only built on failure
+            fields.append((name, getattr(checker, 'test', None), checker))
+        required = tuple(required)
+        fields = tuple(fields)
+        def check(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(f"{path}: expected object")
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing {name}")
+            for name, test, checker in fields:
+                if name in value:
+                    v = value[name]
+                    if test is None or not test(v):
+                        checker(v, f"{path}.{name}", errors)
+        return check
+    raise ValueError(f"bad schema spec {spec!r}")
+
+CHECKERS = {kind: compile_schema(spec) for kind, spec in SCHEMAS.items()}
+
+def iter_objects(doc):
+    # -> (kind, json path, object) for every object in either layout
+    if 'objects' in doc and isinstance(doc['objects'], list):
+        for i, obj in enumerate(doc['objects']):
+            kind = obj.get('type') if isinstance(obj, dict) else None
+            yield kind, f"$.objects[{i}]", obj
+    for section, kind in SECTIONS.items():
+        items = doc.get(section)
+        if isinstance(items, list):
+            for i, obj in enumerate(items):
+                yield kind, f"$.{section}[{i}]", obj
+
+def is_content(doc):
+    return isinstance(doc, dict) and any(k in doc for k in ('objects', *SECTIONS))
+
+class Context:
+    def __init__(self, width, height, items=None, source_roots=()):
+        self.width = width
+        self.height = height
+        self.items = items          # set of item ids, None = no catalog
+        self.source_roots = list(source_roots)
+        self._sizes = {}
+
+    def key(self):
+        with open(__file__, 'rb') as f:
+            code = hashlib.sha256(f.read()).hexdigest()
+        spec = [code, self.width, self.height, sorted(self.items) if self.items is not None else None,
+                [os.path.abspath(r) for r in self.source_roots]]
+        return hashlib.sha256(json.dumps(spec).encode('utf-8')).hexdigest()
+
+    def source_size(self, name, content_dir):
+        # -> (path, size) of a referenced source file, or (None, None) if not found
+        found = self._sizes.get((content_dir, name))
+        if found is None:
+            found = (None, None)
+            for root in [content_dir] + self.source_roots:
+                path = os.path.join(root, name)
+                if os.path.isfile(path):
+                    found = (path, os.path.getsize(path))
+                    break
+            self._sizes[(content_dir, name)] = found
+        return found
+
+    def in_bounds(self, x, y):
+        return 0 <= x <= self.width and 0 <= y <= self.height
+
+def validate_doc(doc, content_dir, ctx):
+    # -> (errors, warnings, deps [(source path, size)])
+    errors = []
+    warnings = []
+    deps = {}
+    if not isinstance(doc, dict):
+        return ["$: expected object"], warnings, []
+    seen = {}
+    for kind, path, obj in iter_objects(doc):
+        checker = CHECKERS.get(kind)
+        if checker is None:
+            errors.append(f"{path}: unknown object type {json.dumps(kind)}")
+            continue
+        before = len(errors)
+        checker(obj, path, errors)
+        oid = obj.get('id') if isinstance(obj, dict) else None
+        if isinstance(oid, str):
+            if oid in seen:
+                errors.append(f"{path}: duplicate id {oid} (first at {seen[oid]})")
+            else:
+                seen[oid] = path
+        if len(errors) != before:
+            continue  # the remaining checks assume a well-formed object
+
+        if not ctx.in_bounds(obj['x'], obj['y']):
+            errors.append(f"{path}: position ({obj['x']}, {obj['y']}) outside the world {ctx.width}x{ctx.height}")
+        if kind == 'portal':
+            t = obj['target']
+            if not ctx.in_bounds(t['x'], t['y']):
+                errors.append(f"{path}.target: ({t['x']}, {t['y']}) outside the world {ctx.width}x{ctx.height}")
+        if 'itemId' in obj and ctx.items is not None and obj['itemId'] not in ctx.items:
+            errors.append(f"{path}.itemId: unknown item {obj['itemId']}")
+
+        source = obj.get('source')
+        # Placeholder provenance from the POC generators ({"file": "mock", "confidence": "mock"})
+        if source and 'offset' in source and source.get('confidence') != 'mock':
+            src_path, size = ctx.source_size(source['file'], content_dir)
+            if src_path is None:
+                warnings.append(f"{path}.source: file {source['file']} not found")
+                continue
+            deps[src_path] = size
+            end = source['offset'] + source.get('recordLen', 1)
+            if end > size:
+                errors.append(f"{path}.source: offset {source['offset']} + {source.get('recordLen', 1)} "
+                              f"past the end of {source['file']} ({size} bytes)")
+    return errors, warnings, sorted(deps.items())
+
+def load_items(path):
+    # Item catalog: ["id", ...], {"items": [{"id": ...}]} or {"id": {...}}
+    with open(path, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+    if isinstance(doc, dict) and isinstance(doc.get('items'), list):
+        doc = doc['items']
+    if isinstance(doc, list):
+        return {e['id'] if isinstance(e, dict) else e for e in doc}
+    return set(doc)
+
+def find_json(paths):
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, names in os.walk(p):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                out.extend(os.path.join(dirpath, n) for n in sorted(names) if n.endswith('.json'))
+        elif os.path.exists(p):
+            out.append(p)
+    return out
+
+class ResultCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def lookup(self, path, ctx_key):
+        # -> (cached result or None, sha256 of the file)
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        hit = self.entries.get(key)
+        if hit and hit['size'] == st.st_size and hit['mtime_ns'] == st.st_mtime_ns:
+            digest = hit['sha256']
+        else:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        if hit and hit['sha256'] == digest and hit['context'] == ctx_key and self._deps_unchanged(hit['deps']):
+            hit['size'], hit['mtime_ns'] = st.st_size, st.st_mtime_ns
+            return hit, digest
+        return None, digest
+
+    def _deps_unchanged(self, deps):
+        for dep, size in deps:
+            try:
+                if os.path.getsize(dep) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def store(self, path, digest, ctx_key, result):
+        st = os.stat(path)
+        self.entries[os.path.abspath(path)] = dict(result, size=st.st_size, mtime_ns=st.st_mtime_ns,
+                                                   sha256=digest, context=ctx_key)
+
+    def save(self):
+        if not self.path:
+            return
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f)
+
+def validate_paths(paths, ctx, cache):
+    # -> {file: {'content', 'errors', 'warnings', 'deps', 'cached'}}
+    ctx_key = ctx.key()
+    results = {}
+    for path in find_json(paths):
+        hit, digest = cache.lookup(path, ctx_key)
+        if hit is not None:
+            results[path] = dict(hit, cached=True)
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except ValueError as e:
+            result = {'content': True, 'errors': [f"invalid JSON: {e}"], 'warnings': [], 'deps': []}
+        else:
+            if is_content(doc):
+                errors, warnings, deps = validate_doc(doc, os.path.dirname(path), ctx)
+                result = {'content': True, 'errors': errors, 'warnings': warnings, 'deps': deps}
+            else:
+                result = {'content': False, 'errors': [], 'warnings': [], 'deps': []}
+        cache.store(path, digest, ctx_key, result)
+        results[path] = dict(result, cached=False)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate world object content (schema + cross references).')
+    parser.add_argument('paths', nargs='*', default=['contentpacks/poc', 'assets/poc'],
+                        help='Content files or directories (default: contentpacks/poc assets/poc)')
+    parser.add_argument('--items', help='Item catalog JSON; without it itemIds are not checked')
+    parser.add_argument('--world-width', type=int, default=5000)
+    parser.add_argument('--world-height', type=int, default=5000)
+    parser.add_argument('--source-root', action='append', default=[],
+                        help='Directory to resolve source.file against (besides the content file\'s own)')
+    parser.add_argument('--cache', default='.content_validation_cache.json', help='Result cache ("" to disable)')
+    parser.add_argument('--strict', action='store_true', help='Treat warnings as errors')
+    parser.add_argument('--json', dest='json_out', help='Write the full report as JSON')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    m = instrument.start(args, 'validate_content_schema')
+
+    start = time.perf_counter()
+    items = None
+    if args.items:
+        try:
+            with m.stage('read'):
+                items = load_items(args.items)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error: cannot read item catalog {args.items}: {e}")
+            sys.exit(1)
+    ctx = Context(args.world_width, args.world_height, items, args.source_root)
+    with m.stage('read'):
+        cache = ResultCache(args.cache)
+    with m.stage('validate'):
+        results = validate_paths(args.paths, ctx, cache)
+    with m.stage('write'):
+        cache.save()
+    elapsed = time.perf_counter() - start
+
+    content = {p: r for p, r in results.items() if r['content']}
+    errors = sum(len(r['errors']) for r in content.values())
+    warnings = sum(len(r['warnings']) for r in content.values())
+    for path, r in content.items():
+        for msg in r['errors']:
+            print(f"{path}: error: {msg}")
+        for msg in r['warnings']:
+            print(f"{path}: warning: {msg}")
+    if items is None:
+        print("Note: no --items catalog, itemIds not checked.")
+    skipped = sum(1 for r in content.values() if r['cached'])
+    m.count('files', len(content))
+    m.count('cached', skipped)
+    m.count('errors', errors)
+    m.count('warnings', warnings)
+    print(f"Validated {len(content)} content files ({skipped} unchanged, skipped) in {elapsed * 1000:.0f} ms: "
+          f"{errors} errors, {warnings} warnings.")
+
+    if args.json_out:
+        with m.stage('write'):
+            with open(args.json_out, 'w') as f:
+                json.dump({'files': content, 'errors': errors, 'warnings': warnings}, f, indent=2)
+    if errors or (args.strict and warnings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
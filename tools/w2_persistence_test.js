@@ -1,8 +1,6 @@
 const WebSocket = require('ws');
-const fs = require('fs');
-const path = require('path');
+const persistence = require('../server/src/persistence');
 
-const STATE_FILE = path.join(__dirname, '../server/data/world_state.json');
 const TEST_KEY = 'bot_persist_test_' + Math.random().toString(36).substr(2, 4);
 const TEST_X = 123.45;
 const TEST_Y = 67.89;
@@ -29,8 +27,8 @@ async function runTest() {
 
     client1.close();
 
-    // 2. Check File
-    const state = JSON.parse(fs.readFileSync(STATE_FILE, 'utf8'));
+    // 2. Check File (snapshot + change log)
+    const state = persistence.readState();
     const entry = state[TEST_KEY];
     if (!entry) throw new Error('Test player not found in file!');
     